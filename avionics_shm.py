@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Shared-memory current state of avionics_zmq (same host consumers)
+the bridge writes the latest values of its Var_store into a mmap file
+(SHM_DIR/name) after each message, readers get consistent snapshots
+without socket nor deserialization (seqlock, readers never block the
+writer). Only the standard library is used.
+
+segment layout (little-endian):
+    +-------+---------+-----+-------+-------------+-----+-------------+
+    | magic | version | pad | nvars | schema hash | seq | update time |
+    | AZSHM | uint8   | 2   | uint32| uint32      | u64 | float64     |
+    +-------+---------+-----+-------+-------------+-----+-------------+
+    keys: int32 var_key per index (var_key order)
+    values: float64 per index (8 bytes aligned)
+    times: float64 per index (last update time.time())
+    valid: uint8 per index
+seq is odd while the writer updates the segment.
+
+ex: reader
+    state=Shm_reader("avionics")
+    value,t,valid=state.read(10) # GPS_LAT
+    seq,t,values,times,valid=state.snapshot()
+"""
+import os
+import time
+import mmap
+import struct
+import array
+import ctypes
+
+
+class Shm_state(object):
+    """writer of the shared-memory segment (see module docstring)
+    the file is created under a temporary name then renamed so readers of
+    a previous segment keep a valid (stale) mapping.
+
+    Attributes:
+        mm (mmap.mmap): mapped segment
+        path (str): segment file
+    """
+    def __init__(self,name,var_keys,schema_hash=0):
+        """constructor
+
+        Args:
+            name (str): segment name (file in SHM_DIR) or path
+            var_keys (array.array|list): var_key of each index (see Var_store.keys)
+            schema_hash (int, optional): catalog hash (see Wire_schema.hash)
+        """
+        self.path=shm_path(name)
+        self.nvars=len(var_keys)
+        self.keys=array.array('i',var_keys)
+        self.schema_hash=schema_hash
+        self.layout=shm_layout(self.nvars)
+        self.mm=None
+        self.seq=0
+
+    def connect(self):
+        """create and map the segment
+        """
+        size=self.layout[-1]
+        tmp=self.path+".tmp"
+        with open(tmp,'w+b') as f:
+            f.truncate(size)
+            self.mm=mmap.mmap(f.fileno(),size)
+        keys_off,values_off,times_off,valid_off,size=self.layout
+        struct.pack_into(SHM_HEADER_FMT,self.mm,0,SHM_MAGIC,SHM_VERSION,
+            self.nvars,self.schema_hash,0,0.0)
+        self.mm[keys_off:keys_off+4*self.nvars]=struct.pack('<%ii' % self.nvars,*self.keys)
+        self.view=ctypes.c_char.from_buffer(self.mm)
+        self.address=ctypes.addressof(self.view)
+        os.rename(tmp,self.path)
+        print "[info] shared state in "+self.path
+
+    def disconnect(self):
+        """unmap and remove the segment
+        """
+        self.view=None
+        self.mm.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        print "[info] shared state removed"
+
+    def write(self,values,times,valid,now):
+        """copy the state (same index order as keys) under the seqlock
+
+        Args:
+            values (array.array): float64 values
+            times (array.array): float64 update times
+            valid (bytearray): valid bits
+            now (float): update time
+        """
+        mm=self.mm
+        keys_off,values_off,times_off,valid_off,size=self.layout
+        nbytes=8*self.nvars
+        self.seq+=1 # odd: update in progress
+        struct.pack_into('<Q',mm,SHM_SEQ_OFFSET,self.seq)
+        ctypes.memmove(self.address+values_off,values.buffer_info()[0],nbytes)
+        ctypes.memmove(self.address+times_off,times.buffer_info()[0],nbytes)
+        mm[valid_off:valid_off+self.nvars]=str(valid)
+        struct.pack_into('<d',mm,SHM_TIME_OFFSET,now)
+        self.seq+=1
+        struct.pack_into('<Q',mm,SHM_SEQ_OFFSET,self.seq)
+#<END of class Shm_state>
+
+class Shm_reader(object):
+    """lock-free consistent reader of the shared-memory segment
+    a read is retried while the writer updates the segment (odd or changed
+    seq), it never blocks the writer. After SHM_SPIN retries the reader
+    sleeps SHM_BACKOFF (writer preempted during an update).
+
+    Attributes:
+        index (dict): {var_key:index}
+        keys (array.array): var_key of each index
+        mm (mmap.mmap): mapped segment (read only)
+        schema_hash (int): catalog hash of the writer
+    """
+    def __init__(self,name):
+        """map an existing segment
+
+        Args:
+            name (str): segment name (file in SHM_DIR) or path
+
+        Raises:
+            IOError: no segment or not an avionics_zmq segment
+        """
+        path=shm_path(name)
+        with open(path,'rb') as f:
+            self.mm=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+        magic,version,nvars,self.schema_hash,seq,t=struct.unpack_from(
+            SHM_HEADER_FMT,self.mm,0)
+        if magic!=SHM_MAGIC or version!=SHM_VERSION:
+            raise IOError("%s is not a shared state segment" % path)
+        self.nvars=nvars
+        self.layout=shm_layout(nvars)
+        keys_off=self.layout[0]
+        self.keys=array.array('i',struct.unpack_from('<%ii' % nvars,self.mm,keys_off))
+        self.index=dict((var_key,idx) for idx,var_key in enumerate(self.keys))
+        self.seq_unpack=struct.Struct('<Qd').unpack_from
+
+    def close(self):
+        """unmap the segment
+        """
+        self.mm.close()
+
+    def snapshot(self):
+        """consistent copy of all values
+
+        Returns:
+            tuple: (seq,update time,values,times,valid) values and times are
+                array.array('d'), valid a bytearray (index order of keys)
+
+        Raises:
+            IOError: writer never left the update (SHM_MAX_RETRY)
+        """
+        mm=self.mm
+        keys_off,values_off,times_off,valid_off,size=self.layout
+        for retry in xrange(SHM_MAX_RETRY):
+            seq,t=self.seq_unpack(mm,SHM_SEQ_OFFSET)
+            if not seq&1:
+                data=mm[values_off:size]
+                if self.seq_unpack(mm,SHM_SEQ_OFFSET)[0]==seq:
+                    values=array.array('d',data[:8*self.nvars])
+                    times=array.array('d',data[times_off-values_off:valid_off-values_off])
+                    valid=bytearray(data[valid_off-values_off:])
+                    return (seq,t,values,times,valid)
+            if retry>=SHM_SPIN:
+                time.sleep(SHM_BACKOFF)
+        raise IOError("shared state is busy")
+
+    def read(self,var_key):
+        """consistent read of one variable
+
+        Args:
+            var_key (int): reference key
+
+        Returns:
+            tuple: (value,update time,valid)
+
+        Raises:
+            KeyError: unknown var_key
+            IOError: writer never left the update (SHM_MAX_RETRY)
+        """
+        idx=self.index[var_key]
+        mm=self.mm
+        keys_off,values_off,times_off,valid_off,size=self.layout
+        for retry in xrange(SHM_MAX_RETRY):
+            seq=self.seq_unpack(mm,SHM_SEQ_OFFSET)[0]
+            if not seq&1:
+                value=struct.unpack_from('<d',mm,values_off+8*idx)[0]
+                t=struct.unpack_from('<d',mm,times_off+8*idx)[0]
+                valid=ord(mm[valid_off+idx])
+                if self.seq_unpack(mm,SHM_SEQ_OFFSET)[0]==seq:
+                    return (value,t,valid==1)
+            if retry>=SHM_SPIN:
+                time.sleep(SHM_BACKOFF)
+        raise IOError("shared state is busy")
+
+    def as_dict(self):
+        """consistent snapshot of the valid values
+
+        Returns:
+            dict: {var_key:value}
+        """
+        seq,t,values,times,valid=self.snapshot()
+        return dict((self.keys[idx],values[idx]) for idx in range(self.nvars)
+            if valid[idx])
+#<END of class Shm_reader>
+
+#------------------------------
+# Globals
+#-------------------------------
+def shm_path(name):
+    """segment file of a name
+
+    Args:
+        name (str): name (file in SHM_DIR) or path (contains /)
+
+    Returns:
+        str: path
+    """
+    if '/' in name:
+        return name
+    return os.path.join(SHM_DIR,name)
+
+def shm_layout(nvars):
+    """offsets of the segment arrays
+
+    Args:
+        nvars (int): number of variables
+
+    Returns:
+        tuple: (keys,values,times,valid,size) offsets in bytes
+    """
+    keys_off=struct.calcsize(SHM_HEADER_FMT)
+    values_off=(keys_off+4*nvars+7)&~7
+    times_off=values_off+8*nvars
+    valid_off=times_off+8*nvars
+    return (keys_off,values_off,times_off,valid_off,valid_off+nvars)
+
+SHM_DIR="/dev/shm"
+SHM_MAGIC="AZSHM"
+SHM_VERSION=1
+SHM_HEADER_FMT="<5sBxxIIQd" # magic,version,nvars,schema hash,seq,update time
+SHM_SEQ_OFFSET=16
+SHM_TIME_OFFSET=24
+SHM_SPIN=100 # retries before sleeping
+SHM_BACKOFF=0.00001 # sleep (s) between retries after SHM_SPIN
+SHM_MAX_RETRY=10000 # reads retried while the writer updates
@@ -16,31 +16,75 @@ import time
 from optparse import OptionParser
 from threading import Thread 
 import socket
+import errno
 import struct
 from pprint import pprint as pp
 import math
+import functools
+import inspect
+import Queue
+import ctypes
+import array
+import json
+import zlib
+import hashlib
+import marshal
+import mmap
+import glob
+import operator
+import multiprocessing
+import numpy as np
 import pmt
 import zmq
 import signal
 import serial
+from avionics_shm import Shm_state
 
 t_start=0
 t_end=0
 v=0
+class Var_record(object):
+    """definition of one variable (see data_collect.vdict)
+    a source subscription is a tuple (group,pos,func,args) or None
+        xplane: (data_set,data_pos,func,args)
+        aid: (channel,label,func,args)
+        ublox: (nmea_sen,pos,func,args)
+    """
+    __slots__=("name","key","xplane","aid","ublox")
+    def __init__(self,name,key):
+        """constructor
+        
+        Args:
+            name (str): variable name
+            key (int): var_key
+        """
+        self.name=name
+        self.key=key
+        self.xplane=None
+        self.aid=None
+        self.ublox=None
+#<END of class Var_record>
+
 class data_collect(object):
     """this class contains the defininition of data tracked 
-    for now they are all listed as class variables. it's better to read
-    from a config file
+    variables are added one by one (see main) or from a catalog file
+    (see load_catalog)
     
     Attributes:
-        key_dict (TYPE): Description
-        vdict (TYPE): Description
+        key_dict (dict): {var_name:var_key}
+        vdict (dict): {var_key:Var_record}
     """
     def __init__(self):
         """Summary
         """
         self.key_dict=dict() # var_name: var_key
-        self.vdict=dict() # var_key:{xplane:xplane_var,aid:aid:aid_var}
+        self.vdict=dict() # var_key: Var_record
+        self.tx_dict=dict() # var_key: tx_ms (rate group)
+        self.priority_dict=dict() # var_key: [src_id...] (fusion)
+        self.group_dict=dict() # var_key: group name (PUB topics)
+        self.deadband_dict=dict() # var_key: deadband (delta mode)
+        self.derived_dict=dict() # var_key: (func,input var_keys,args) (Derived_engine)
+        self.resample_dict=dict() # var_key: mode (Resampler, default linear)
 
     def add_var(self,var_name,var_key):
         """add label {name:ukey} to vdict
@@ -48,10 +92,16 @@ class data_collect(object):
         args:
             var_name (string): name of variable just for debug
             var_key (int): reference key (must be unique)
+        
+        Raises:
+            ValueError: var_name or var_key already used
         """
-        # TODO: check var_key unique (raise)
+        if var_name in self.key_dict:
+            raise ValueError("variable %s already defined" % var_name)
+        if var_key in self.vdict:
+            raise ValueError("var_key %i of %s already used" % (var_key,var_name))
         self.key_dict[var_name]=var_key
-        self.vdict[var_key]={"xplane":dict(),"aid":dict(),"ublox":dict()}
+        self.vdict[var_key]=Var_record(var_name,var_key)
 
     def get_var_key(self,var_name):
         """Summary
@@ -80,13 +130,14 @@ class data_collect(object):
             data_pos (TYPE): Description
             func (None, optional): Description
             arg_list (None, optional): Description
+        
+        Raises:
+            ValueError: var_name already has an xplane source
         """
-        x_dict={
-        "data_set":data_set,
-        "data_pos":data_pos,
-        "func":func,
-        "args":arg_list}
-        self.vdict[self.key_dict[var_name]]["xplane"]=x_dict
+        rec=self.vdict[self.key_dict[var_name]]
+        if rec.xplane is not None:
+            raise ValueError("%s already has an xplane source" % var_name)
+        rec.xplane=(data_set,data_pos,func,arg_list)
 
     def set_aid_var(self,var_name,channel,label,func=None,arg_list=None):
         """sets xplane info for var
@@ -104,94 +155,401 @@ class data_collect(object):
             label (TYPE): Description
             func (None, optional): Description
             arg_list (None, optional): Description
+        
+        Raises:
+            ValueError: var_name already has an aid source
         """
-        x_dict={
-        "channel":channel,
-        "label":label,
-        "func":func,
-        "args":arg_list}
-        self.vdict[self.key_dict[var_name]]["aid"]=x_dict
+        rec=self.vdict[self.key_dict[var_name]]
+        if rec.aid is not None:
+            raise ValueError("%s already has an aid source" % var_name)
+        rec.aid=(channel,label,func,arg_list)
 
-    def set_ublox_var(self,var_name,nmea_sen,pos,func=None,arg_list=None):
-        """Summary
+    def set_ublox_var(self,var_name,nmea_sen,pos):
+        """sets ublox info for var, the field is converted by the function
+        of its position (see nmea_field_dict)
         
         Args:
             var_name (string): variable name
             nmea_sen (string): NMEA sentence
-            pos (TYPE): position
-            func (None, optional): conversion fuction
-            arg_list (None, optional): argument list
+            pos (int): position in nmea_field_dict[nmea_sen]
+        
+        Raises:
+            ValueError: var_name already has a ublox source
         """
-        x_dict={
-        "nmea_sen":nmea_sen,
-        "pos":pos,
-        "func":func,
-        "args":arg_list}
-        self.vdict[self.key_dict[var_name]]["ublox"]=x_dict
+        rec=self.vdict[self.key_dict[var_name]]
+        if rec.ublox is not None:
+            raise ValueError("%s already has a ublox source" % var_name)
+        rec.ublox=(nmea_sen,pos,None,None)
 
-    def get_xplane_dict(self):
-        """get all non empty xplane variables
-        return {key:xplane_dict}
-        xplane_dict 
+    def set_tx_ms(self,var_name,tx_ms):
+        """sets the transmission periode of a variable (rate group)
+        used with -t/--tx_ms (see Tx_scheduler)
+        
+        Args:
+            var_name (string): variable name
+            tx_ms (int): min periode in ms
+        """
+        self.tx_dict[self.key_dict[var_name]]=tx_ms
+
+    def set_priority(self,var_name,modes):
+        """sets the source priority of a variable (see Var_fusion)
+        
+        Args:
+            var_name (string): variable name
+            modes (string): sources best first ex: "aux" (see src_id_dict)
+        """
+        self.priority_dict[self.key_dict[var_name]]=[src_id_dict[m] for m in modes]
+
+    def set_group(self,var_name,group):
+        """sets the group of a variable (PUB topic see get_topic_dict)
+        
+        Args:
+            var_name (string): variable name
+            group (string): group name ex: "GPS"
+        """
+        self.group_dict[self.key_dict[var_name]]=group
+
+    def set_deadband(self,var_name,deadband):
+        """sets the deadband of a variable (see Delta_filter)
+        
+        Args:
+            var_name (string): variable name
+            deadband (float): min change sent (0: any change)
+        """
+        self.deadband_dict[self.key_dict[var_name]]=deadband
+
+    def set_derived(self,var_name,func,input_names,arg_list=None):
+        """sets a variable computed from other variables (any source, see
+        Derived_engine), a value given by the source itself is kept
+        
+        Args:
+            var_name (string): variable name
+            func (callable): func(*(inputs+arg_list)) numpy ufuncs only (the
+                inputs can be arrays see Derived_engine.update_batch)
+            input_names (list): input variable names
+            arg_list (list, optional): constant arguments
+        """
+        self.derived_dict[self.key_dict[var_name]]=(func,
+            tuple(self.key_dict[name] for name in input_names),list(arg_list or []))
+
+    def set_resample(self,var_name,mode):
+        """sets how a variable is resampled (see Resampler)
+        
+        Args:
+            var_name (string): variable name
+            mode (string): "linear" (default), "hold" (last value ex: counts,
+                flags), "angle" (0 to 360) or "angle180" (-180 to 180)
+        """
+        self.resample_dict[self.key_dict[var_name]]=mode
+
+    def get_topic_dict(self,by):
+        """PUB topic of each variable (see Zmq_pmt)
+        var topics have a fixed width so a prefix selects a var_key range
+        (ex: "v0001" subscribes var_key 10 to 19), group topics end with "."
+        
+        Args:
+            by (str): "var" (PUB_VAR_TOPIC) or "group" (PUB_GROUP_TOPIC, the
+                default group is the var_key decade ex: "001")
         
         Returns:
-            TYPE: Description
+            dict: {var_key:topic}
         """
-        result = dict()
-        for key in self.vdict:
-            xplane_dict=self.vdict[key]["xplane"]
-            if len(xplane_dict)!=0:
-                #result[key]=self.vdict[key]["xplane"]
-                data_set=xplane_dict["data_set"]
-                data_pos=xplane_dict["data_pos"]
-                data= (key,xplane_dict["func"],xplane_dict["args"])
-                if data_set not in result:
-                    result[data_set]={data_pos:data}
+        if by=="var":
+            return dict((var_key,PUB_VAR_TOPIC % var_key) for var_key in self.vdict)
+        return dict((var_key,PUB_GROUP_TOPIC % self.group_dict.get(var_key,
+            "%03i" % (var_key//10))) for var_key in self.vdict)
+
+    def load_catalog(self,filename,use_cache=True):
+        """add the variables of a catalog file (json)
+        the catalog is validated once then cached in filename+CATALOG_CACHE_EXT
+        (marshal) keyed by the sha1 of the file, next loads of the same file
+        skip parsing and validation.
+        
+        catalog:
+            {"version":1,"vars":[
+                {"name":"UTC_SEC","key":0,
+                 "xplane":{"set":"TIMES","pos":5,"func":"scale_to_int","args":[3600]},
+                 "aid":{"channel":"GNSS","label":150,"func":"bcd_decode",
+                        "args":[[1,5,6,6],[0,3600,60,1]]},
+                 "ublox":{"sen":"GGA","pos":0},
+                 "tx_ms":200,"priority":"xau","group":"TIME","deadband":0.5,
+                 "resample":"hold"},
+                {"name":"NS_SPEED","key":34,
+                 "derived":{"func":"derive_ns_speed","inputs":["MAG_HDG","GROUND_KTS"]}},
+                ...]}
+            set and channel are numbers or names (xplane_set_dict, aid_set_dict),
+            func is a function name of this module, xplane/aid/ublox, func,
+            args, tx_ms, priority, group, deadband, resample and derived are
+            optional (ublox has no func, see nmea_field_dict)
+            (derived inputs can be declared after the variable)
+        
+        Args:
+            filename (str): catalog file
+            use_cache (bool, optional): read and write the cache
+        
+        Raises:
+            ValueError: invalid catalog (every error is listed)
+            IOError: file not found
+        """
+        with open(filename,'rb') as f:
+            data=f.read()
+        digest=hashlib.sha1(data).hexdigest()
+        cache_name=filename+CATALOG_CACHE_EXT
+        cached=None
+        if use_cache:
+            try:
+                with open(cache_name,'rb') as f:
+                    cached=marshal.load(f)
+            except (IOError,EOFError,ValueError,TypeError):
+                cached=None
+        if isinstance(cached,tuple) and cached[:2]==(CATALOG_CACHE_VERSION,digest):
+            self.restore(cached[2])
+            print "[info] catalog %s loaded from cache" % filename
+            return
+        try:
+            catalog=json.loads(data)
+        except ValueError as e:
+            raise ValueError("catalog %s: %s" % (filename,e))
+        errors=self.parse_catalog(catalog)
+        errors+=self.validate()
+        if errors:
+            raise ValueError("catalog %s:\n    " % filename+"\n    ".join(errors))
+        print "[info] catalog %s loaded (%i variables)" % (filename,len(self.vdict))
+        if use_cache:
+            try:
+                with open(cache_name,'wb') as f:
+                    marshal.dump((CATALOG_CACHE_VERSION,digest,self.state()),f)
+            except IOError as e:
+                print "[warning] catalog cache not written: %s" % e
+
+    def parse_catalog(self,catalog):
+        """add catalog variables (see load_catalog)
+        
+        Args:
+            catalog (dict): parsed json
+        
+        Returns:
+            list: error messages
+        """
+        errors=list()
+        if not isinstance(catalog,dict) or catalog.get("version")!=CATALOG_VERSION:
+            return ["version must be %i" % CATALOG_VERSION]
+        derived=list() # [(i,name,derived)] once all variables are added
+        for i,var in enumerate(catalog.get("vars",[])):
+            try:
+                name=str(var["name"])
+                self.add_var(name,int(var["key"]))
+                for src,group_dict,setter in (
+                        ("xplane",xplane_set_dict,self.set_xplane_var),
+                        ("aid",aid_set_dict,self.set_aid_var),
+                        ("ublox",None,self.set_ublox_var)):
+                    sub=var.get(src)
+                    if sub is None:
+                        continue
+                    if src=="ublox":
+                        if "func" in sub or "args" in sub:
+                            raise ValueError("ublox fields are converted by "
+                                "nmea_field_dict (no func or args)")
+                        setter(name,str(sub["sen"]),int(sub["pos"]))
+                        continue
+                    group=sub["set" if src=="xplane" else "channel"]
+                    group=group_dict[group] if group in group_dict else int(group)
+                    func=sub.get("func")
+                    if func is not None:
+                        func=catalog_func(func)
+                    setter(name,group,int(sub["pos" if src!="aid" else "label"]),
+                        func,sub.get("args"))
+                if "tx_ms" in var:
+                    self.set_tx_ms(name,int(var["tx_ms"]))
+                if "priority" in var:
+                    self.set_priority(name,str(var["priority"]))
+                if "group" in var:
+                    group=str(var["group"])
+                    if not group or '.' in group:
+                        raise ValueError("group %r is empty or has a '.'" % group)
+                    self.set_group(name,group)
+                if "deadband" in var:
+                    self.set_deadband(name,float(var["deadband"]))
+                if "resample" in var:
+                    self.set_resample(name,str(var["resample"]))
+                if "derived" in var:
+                    derived.append((i,name,var["derived"]))
+            except (KeyError,ValueError,TypeError) as e:
+                errors.append("var %i (%s): %s %s" % (i,var.get("name","?") 
+                    if isinstance(var,dict) else "?",e.__class__.__name__,e))
+        for i,name,sub in derived:
+            try:
+                self.set_derived(name,catalog_func(sub["func"]),
+                    [str(input_name) for input_name in sub["inputs"]],sub.get("args"))
+            except (KeyError,ValueError,TypeError) as e:
+                errors.append("var %i (%s): derived %s %s" % (i,name,
+                    e.__class__.__name__,e))
+        return errors
+
+    def validate(self):
+        """check every variable (done once, see load_catalog and
+        add_default_vars)
+        positions, labels, functions and arguments, a position used by
+        two variables
+        
+        Returns:
+            list: error messages
+        """
+        errors=list()
+        used=dict() # {(src,group,pos):var_key}
+        names=dict((var_key,var_name) for var_name,var_key in self.key_dict.items())
+        custom_set=xplane_set_dict["CUSTOM"]
+        for var_key in sorted(self.vdict):
+            name=names[var_key]
+            for src in ("aid","ublox","xplane"):
+                sub=getattr(self.vdict[var_key],src)
+                if sub is None:
+                    continue
+                group,pos,func,args=sub
+                if src=="xplane":
+                    if not 0<=group<=255:
+                        errors.append("%s: xplane set %i out of range" % (name,group))
+                    if group!=custom_set and not 0<=pos<=7:
+                        errors.append("%s: xplane position %i out of range" % (name,pos))
+                elif src=="aid":
+                    if pos<0 or set(str(pos))-set("01234567") or pos>377:
+                        errors.append("%s: AID label %i is not octal" % (name,pos))
                 else:
-                    result[data_set][data_pos]=data
-        return result
+                    if pos not in nmea_field_dict.get(group,{}):
+                        errors.append("%s: no position %i in NMEA sentence %s" % 
+                            (name,pos,group))
+                if (src,group,pos) in used:
+                    errors.append("%s: %s %s/%s already used by %s" % (name,src,
+                        group,pos,names[used[(src,group,pos)]]))
+                used[(src,group,pos)]=var_key
+                if func is not None and not callable(func):
+                    errors.append("%s: %s func is not callable" % (name,src))
+                    continue
+                try:
+                    if src!="ublox" and group!=custom_set:
+                        bind_converter(func,args)
+                    if src=="aid":
+                        a429_converter(pos,func,args)
+                except (ValueError,TypeError) as e:
+                    errors.append("%s: %s args %s" % (name,src,e))
+        for var_key in sorted(self.vdict):
+            sub=self.vdict[var_key].xplane
+            if sub and sub[0]==custom_set:
+                for adr in sub[3] or []:
+                    if ("xplane",adr[0],adr[1]) not in used:
+                        errors.append("%s: custom argument %s is not subscribed" % 
+                            (names[var_key],list(adr)))
+        for var_key,tx_ms in self.tx_dict.items():
+            if tx_ms<=0:
+                errors.append("%s: tx_ms must be positive" % names[var_key])
+        for var_key,deadband in self.deadband_dict.items():
+            if not deadband>=0:
+                errors.append("%s: deadband must be positive or 0" % names[var_key])
+        for var_key,mode in self.resample_dict.items():
+            if mode not in RESAMPLE_MODES:
+                errors.append("%s: resample must be %s" % (names[var_key],
+                    ", ".join(RESAMPLE_MODES)))
+        try:
+            derived_order(self.derived_dict)
+        except ValueError as e:
+            errors.append(str(e))
+        for var_key,(func,inputs,args) in sorted(self.derived_dict.items()):
+            try:
+                func(*([1.0]*len(inputs)+args))
+            except (ValueError,TypeError,ZeroDivisionError) as e:
+                errors.append("%s: derived func %s" % (names[var_key],e))
+        return errors
 
-    def get_aid_dict(self):
-        """get all non empty aid variables
-        return {key:aid_dict}
+    def state(self):
+        """variables with function names (see load_catalog cache)
         
         Returns:
-            TYPE: Description
+            tuple: (key_dict,vdict,tx_dict,priority_dict,group_dict,
+                deadband_dict,derived_dict,resample_dict) marshal compatible
+                vdict {var_key:(xplane,aid,ublox)}
+        """
+        vdict=dict()
+        for var_key,rec in self.vdict.items():
+            subs=list()
+            for sub in (rec.xplane,rec.aid,rec.ublox):
+                if sub is not None and sub[2] is not None:
+                    sub=sub[:2]+(sub[2].__name__,)+sub[3:]
+                subs.append(sub)
+            vdict[var_key]=tuple(subs)
+        derived_dict=dict((var_key,(func.__name__,inputs,args)) 
+            for var_key,(func,inputs,args) in self.derived_dict.items())
+        return (self.key_dict,vdict,self.tx_dict,self.priority_dict,self.group_dict,
+            self.deadband_dict,derived_dict,self.resample_dict)
+
+    def restore(self,state):
+        """add variables of a state (see state)
+        
+        Args:
+            state (tuple): (key_dict,vdict,tx_dict,priority_dict,group_dict,
+                deadband_dict,derived_dict,resample_dict)
         """
+        (key_dict,vdict,tx_dict,priority_dict,group_dict,deadband_dict,
+            derived_dict,resample_dict)=state
+        records=dict()
+        for var_name,var_key in key_dict.items():
+            rec=Var_record(var_name,var_key)
+            subs=list()
+            for sub in vdict[var_key]:
+                if sub is not None and sub[2] is not None:
+                    sub=sub[:2]+(catalog_func(sub[2]),)+sub[3:]
+                subs.append(sub)
+            rec.xplane,rec.aid,rec.ublox=subs
+            records[var_key]=rec
+        self.key_dict.update(key_dict)
+        self.vdict.update(records)
+        self.tx_dict.update(tx_dict)
+        self.priority_dict.update(priority_dict)
+        self.group_dict.update(group_dict)
+        self.deadband_dict.update(deadband_dict)
+        self.resample_dict.update(resample_dict)
+        for var_key,(func,inputs,args) in derived_dict.items():
+            self.derived_dict[var_key]=(catalog_func(func),tuple(inputs),list(args))
+
+    def get_src_dict(self,src):
+        """get all variables of a source by group and position
         
+        Args:
+            src (str): "xplane", "aid" or "ublox"
+        
+        Returns:
+            dict: {group:{pos:(var_key,func,args)}}
+        """
         result = dict()
-        for key in self.vdict:
-            aid_dict=self.vdict[key]["aid"]
-            if len(aid_dict)!=0:
-                #result[key]=self.vdict[key]["xplane"]
-                data_set=aid_dict["channel"]
-                data_pos=aid_dict["label"]
-                data= (key,aid_dict["func"],aid_dict["args"])
-                if data_set not in result:
-                    result[data_set]={data_pos:data}
-                else:
-                    result[data_set][data_pos]=data
+        for key,rec in self.vdict.items():
+            sub=getattr(rec,src)
+            if sub is not None:
+                group,pos,func,args=sub
+                result.setdefault(group,dict())[pos]=(key,func,args)
         return result
 
+    def get_xplane_dict(self):
+        """get all non empty xplane variables
+        
+        Returns:
+            dict: {data_set:{data_pos:(var_key,func,args)}}
+        """
+        return self.get_src_dict("xplane")
+
+    def get_aid_dict(self):
+        """get all non empty aid variables
+        
+        Returns:
+            dict: {channel:{label:(var_key,func,args)}}
+        """
+        return self.get_src_dict("aid")
+
     def get_ublox_dict(self):
         """get all non empty ublox variables
-        return {key:ublox_dict}
         
         Returns:
-            TYPE: Description
+            dict: {nmea_sen:{pos:(var_key,func,args)}}
         """
-        result = dict()
-        for key in self.vdict:
-            ublox_dict=self.vdict[key]["ublox"]
-            if len(ublox_dict)!=0:
-                nmea_sen=ublox_dict["nmea_sen"]
-                pos=ublox_dict["pos"]
-                data=(key,ublox_dict["func"],ublox_dict["args"])
-                if nmea_sen not in result:
-                    result[nmea_sen]={pos:data}
-                else:
-                    result[nmea_sen][pos]=data
-        return result
+        return self.get_src_dict("ublox")
 
 
 class Xplane(object):
@@ -201,11 +559,24 @@ class Xplane(object):
     
     Attributes:
         adr (TYPE): Description
+        complete (bool): always True (one datagram per recv)
         data_subs (TYPE): Description
+        drain (str): None one datagram per recv, "latest" queued datagrams
+            are drained and only the newest is unpacked, "merge" all are
+            unpacked and the newest value of each data set wins
+        malformed (int): always 0 (see AID)
+        multi_src (bool): format_recv returns one source (see Src_poller)
+        rcvbuf (int): SO_RCVBUF in bytes or None (system default)
+        rx_throttle (bool): reads can not be throttled (one datagram per recv)
         sock (TYPE): Description
+        stale (int): datagrams dropped by the last recv (drain)
     """
+    rx_throttle=False
+    multi_src=False
+    complete=True
+    malformed=0
 
-    def __init__(self, data_subs_dict,adr,nsew_vel=True):
+    def __init__(self, data_subs_dict,adr,nsew_vel=True,drain=None,rcvbuf=None):
         """constructor
         
         args:
@@ -214,6 +585,8 @@ class Xplane(object):
                 ip (string): ip address format xx.xx.xx.xx
                 port(int): port
             nsew_vel (bool, optional): Description
+            drain (str, optional): None, "latest" or "merge" (see recv)
+            rcvbuf (int, optional): SO_RCVBUF in bytes
         
         Deleted Parameters:
             data_subs_dict(dict): variable to track format:
@@ -222,9 +595,55 @@ class Xplane(object):
         self.data_subs= data_subs_dict
         self.adr=adr
         self.sock=None
+        self.drain=drain
+        self.rcvbuf=rcvbuf
+        self.stale=0
+        self.buf=bytearray(XPLANE_BUF_SIZE) # reused by every recv_into
+        self.spare=bytearray(XPLANE_BUF_SIZE) # newer datagram (drain)
+        self.index_unpack=dict() # {record count: struct.Struct}
+        self.compile_plan()
 
+    def compile_plan(self):
+        """compile data_subs into a receive plan (done once)
+
+        For every subscribed data set a struct.Struct is built that unpacks
+        only the subscribed positions of its 36 bytes DATA record, the result
+        tuple is indexed by slot instead of position. CUSTOM arguments
+        (data_set,data_pos) are remapped to (data_set,slot) and their
+        positions are added to the unpacked ones.
+        """
+        custom_set=xplane_set_dict["CUSTOM"]
+        pos_dict=dict() # {data_set:set(data_pos)}
+        for data_set in self.data_subs:
+            if data_set != custom_set:
+                pos_dict.setdefault(data_set,set()).update(self.data_subs[data_set])
+        for pos_sub in self.data_subs.get(custom_set,{}):
+            for adr in self.data_subs[custom_set][pos_sub][2] or []:
+                pos_dict.setdefault(adr[0],set()).add(adr[1])
+
+        self.set_unpack=dict() # {data_set:struct.Struct}
+        set_slot=dict() # {data_set:{data_pos:slot}}
+        for data_set in pos_dict:
+            positions=sorted(pos_dict[data_set])
+            self.set_unpack[data_set]=struct.Struct(xplane_record_fmt(positions))
+            set_slot[data_set]=dict((pos,slot) for slot,pos in enumerate(positions))
+
+        self.plan=list() # [(data_set,[(slot,var_key)],[(slot,var_key,conv)])]
+        dispatch=compile_dispatch(self.data_subs)
+        for data_set in dispatch:
+            if data_set == custom_set:
+                continue
+            slot=set_slot[data_set]
+            copy_list,conv_list=dispatch[data_set]
+            self.plan.append((data_set,
+                [(slot[pos],var_key) for pos,var_key in copy_list],
+                [(slot[pos],var_key,conv) for pos,var_key,conv in conv_list]))
+        self.custom_plan=list() # [(var_key,conv)...] conv(recv_dict)
+        for pos_sub in self.data_subs.get(custom_set,{}):
+            var_key,func,args=self.data_subs[custom_set][pos_sub]
+            args=[(adr[0],set_slot[adr[0]][adr[1]]) for adr in args or []]
+            self.custom_plan.append((var_key,bind_converter(func,args)))
 
-    
     def check(self):
         """check if connection is alive
         
@@ -246,6 +665,10 @@ class Xplane(object):
         """
         if(self.check):
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.rcvbuf:
+                self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_RCVBUF,self.rcvbuf)
+                print "[info] xplane SO_RCVBUF %i" % self.sock.getsockopt(
+                    socket.SOL_SOCKET,socket.SO_RCVBUF)
             self.sock.bind(self.adr)
             print "[info] xplane connected to "+ str(self.adr)
     def disconnect(self):
@@ -254,76 +677,195 @@ class Xplane(object):
         self.sock.close()
         print "[info] xplane disconnected from "+ str(self.adr)
 
+    def fileno(self):
+        """file descriptor to poll (see Src_poller)
+        """
+        return self.sock.fileno()
+
     def recv(self):
-        """receive data from xplane and upack them
+        """receive data from xplane and upack subscribed positions
+        the datagram is received into a preallocated buffer, set indexes
+        are read with a single unpack and only subscribed sets are unpacked.
+        With drain the queued datagrams are read without blocking (older
+        ones are counted in stale), the freshest frame is returned.
         
         return:
-            recv_dict(dict): {} 
+            recv_dict(dict): {data_set:(value,...)} values are ordered by slot
+                (see compile_plan)
         """
-        header="DATA"
         #TODO implement gracefull handling of ctr-c for recv
-        data, addr = self.sock.recvfrom(2048) # buffer size is 2048 bytes
         global t_start
+        nbytes = self.sock.recv_into(self.buf)
+        self.stale=0
+        if self.drain=="merge":
+            recv_dict=dict()
+            valid=self.unpack(self.buf,nbytes,recv_dict) is not None
+            while True:
+                nbytes=self.recv_queued(self.buf)
+                if nbytes is None:
+                    break
+                if self.unpack(self.buf,nbytes,recv_dict) is not None:
+                    self.stale+=valid # previous frame merged
+                    valid=True
+            t_start=time.time()
+            if valid:
+                return recv_dict
+            return
+        if self.drain=="latest":
+            while True:
+                newer=self.recv_queued(self.spare)
+                if newer is None:
+                    break
+                if self.is_data(self.spare,newer):
+                    self.buf,self.spare=self.spare,self.buf
+                    nbytes=newer
+                    self.stale+=1
         t_start=time.time()
-        if header not in data: # check if header is present
+        return self.unpack(self.buf,nbytes,dict())
+
+    def recv_queued(self,buf):
+        """non blocking receive of a queued datagram (see drain)
+        
+        Args:
+            buf (bytearray): buffer
+        
+        Returns:
+            int: bytes received or None if nothing is queued
+        """
+        try:
+            return self.sock.recv_into(buf,0,socket.MSG_DONTWAIT)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN,errno.EWOULDBLOCK):
+                return None
+            raise
+
+    def is_data(self,buf,nbytes):
+        """check a received datagram: DATA header within the nbytes received
+        (the reused buffer holds stale bytes after them) and whole records
+        
+        Args:
+            buf (bytearray): datagram
+            nbytes (int): datagram length
+        
+        Returns:
+            bool: True if the datagram can be unpacked
+        """
+        return (buf.startswith(XPLANE_HEADER,0,nbytes) and
+            (nbytes-XPLANE_HEADER_LEN)%XPLANE_RECORD_LEN==0)
+
+    def unpack(self,buf,nbytes,recv_dict):
+        """unpack subscribed sets of a datagram
+        
+        Args:
+            buf (bytearray): datagram
+            nbytes (int): datagram length
+            recv_dict (dict): {data_set:slot_values} updated
+        
+        Returns:
+            dict: recv_dict or None if not a DATA datagram (see is_data)
+        """
+        if not self.is_data(buf,nbytes):
             return
-        payload = data[5:]
-        unpacker = struct.Struct('I 8f')
-        recv_dict=dict() # hold received value {data_set:data_list}
-        for i in range(0,len(payload),36):
-            set_list = unpacker.unpack(payload[i:i+36])
-            recv_dict[set_list[0]]=set_list[1:]
+        nrec=(nbytes-XPLANE_HEADER_LEN)//XPLANE_RECORD_LEN
+        index_unpack=self.index_unpack.get(nrec)
+        if index_unpack is None:
+            index_unpack=struct.Struct('<'+('i%ix' % (XPLANE_RECORD_LEN-4))*nrec)
+            self.index_unpack[nrec]=index_unpack
+        set_unpack=self.set_unpack
+        offset=XPLANE_HEADER_LEN
+        for data_set in index_unpack.unpack_from(buf,offset):
+            unpacker=set_unpack.get(data_set)
+            if unpacker is not None:
+                recv_dict[data_set]=unpacker.unpack_from(buf,offset)
+            offset+=XPLANE_RECORD_LEN
         return recv_dict 
 
     def format_recv(self,recv_dict):
         """format recv
         
         Args:
-            recv_dict (TYPE): Description
+            recv_dict (dict): {data_set:slot_values} (see recv)
         
         Returns:
-            TYPE: Description
+            dict: {var_key:value}
         """
         result=dict()
-        # prosses custum and remove it 
-        # /!\ handle custum key
-        custum_set=255
-        if custum_set in self.data_subs:
-            for pos_sub in self.data_subs[custum_set]:
-                var_key=self.data_subs[custum_set][pos_sub][0]
-                func=self.data_subs[custum_set][pos_sub][1]
-                args=self.data_subs[custum_set][pos_sub][2]
-                # func is alwase no None and callable
-                val=func(*([recv_dict]+args))
-                result[var_key]=val
+        # prosses custum 
+        for var_key,conv in self.custom_plan:
+            # conv is alwase no None and callable
+            result[var_key]=conv(recv_dict)
 
-        for data_set_sub in self.data_subs.keys():
-            if data_set_sub in recv_dict:
-                for pos_sub in self.data_subs[data_set_sub]:
-                    var_key=self.data_subs[data_set_sub][pos_sub][0]
-                    func=self.data_subs[data_set_sub][pos_sub][1]
-                    args=self.data_subs[data_set_sub][pos_sub][2]
-                    val=recv_dict[data_set_sub][pos_sub]
-                    if callable(func):
-                        if args:
-                            val= func(*([val]+args))
-                        else:
-                            val= func(val)
-                    result[var_key]=val
+        for data_set,copy_list,conv_list in self.plan:
+            values=recv_dict.get(data_set)
+            if values is None:
+                continue
+            for slot,var_key in copy_list:
+                result[var_key]=values[slot]
+            for slot,var_key,conv in conv_list:
+                result[var_key]=conv(values[slot])
         return result
 
+    def bind_store(self,store):
+        """compile the plan with store indexes (see format_store)
+        
+        Args:
+            store (Var_store): destination store
+        """
+        index=store.index
+        self.store_plan=[(data_set,[(slot,index[var_key]) for slot,var_key in copy_list],
+            [(slot,index[var_key],conv) for slot,var_key,conv in conv_list],
+            tuple(index[entry[1]] for entry in copy_list+conv_list))
+            for data_set,copy_list,conv_list in self.plan]
+        self.store_custom=[(index[var_key],conv) for var_key,conv in self.custom_plan]
+
+    def format_store(self,recv_dict,store,now):
+        """format recv in place (same values as format_recv)
+        
+        Args:
+            recv_dict (dict): {data_set:slot_values} (see recv)
+            store (Var_store): bound store (see bind_store)
+            now (float): reception time
+        """
+        for idx,conv in self.store_custom:
+            store.set(idx,conv(recv_dict))
+        msg=store.msg
+        touch=store.touched.append
+        for data_set,copy_list,conv_list,idxs in self.store_plan:
+            values=recv_dict.get(data_set)
+            if values is None:
+                continue
+            for slot,idx in copy_list:
+                msg[idx]=values[slot]
+            for slot,idx,conv in conv_list:
+                msg[idx]=conv(values[slot])
+            touch(idxs)
+
 
 
     #<END of class Xplane>
         
 class AID(object):
-    """docstring for ClassName
+    """This class contains methodes to get and decode ARINC 429 labels from
+    the AID box (TCP). Lines are "data,aid_time,channel,label,hex_data"
     
     Attributes:
         adr (TYPE): Description
+        complete (bool): the last recv read at least one complete line
+        conv_dict (dict): {(channel,label):(var_key,conv,conv_batch)}
+            dispatch table (see a429_converter, a429_batch_converter)
         data_subs (TYPE): Description
+        frames (generator): line_framer over sock
+        malformed (int): malformed lines skipped by the last recv
+        multi_src (bool): format_recv returns one source (see Src_poller)
+        rx_throttle (bool): reads can be throttled (see main -r)
         sock (TYPE): Description
+        stale (int): always 0 (see Xplane drain)
     """
+    rx_throttle=True
+    multi_src=False
+    stale=0
+    complete=True
+    malformed=0
     def __init__(self, data_subs_dict,adr,nsew_vel=True):
         """Summary
         
@@ -335,6 +877,14 @@ class AID(object):
         self.data_subs= data_subs_dict
         self.adr=adr
         self.sock=None
+        self.frames=None
+        self.conv_dict=dict() # {(channel,label):(var_key,conv,conv_batch)}
+        for channel in data_subs_dict:
+            for label in data_subs_dict[channel]:
+                var_key,func,arg_list=data_subs_dict[channel][label]
+                self.conv_dict[(channel,label)]=(var_key,
+                    a429_converter(label,func,arg_list),
+                    a429_batch_converter(label,func,arg_list))
     def check(self):
         """Summary
         """
@@ -346,7 +896,8 @@ class AID(object):
                 (self.adr[0], self.adr[1], e))
             return False
         finally:
-            sock.close
+            sock.close()
+        return True
     def connect(self):
         """Summary
         """
@@ -359,49 +910,115 @@ class AID(object):
                 for label in self.data_subs[channel]:
                     self.sock.send("add,%i,%i\n" % (channel,label))
                     print '[info] add,%i,%i\n' % (channel,label)
+            self.frames=line_framer(self.sock)
     def disconnect(self):
         """Summary
         """
         self.sock.close()
         print "[info] AID disconnected from "+ str(self.adr)
+    def fileno(self):
+        """file descriptor to poll (see Src_poller)
+        """
+        return self.sock.fileno()
     def recv(self):
         """receive aid data
+        complete lines of one read are returned, a line cut by the read is
+        kept by the framer until the next one. Unsubscribed labels are skipped,
+        malformed lines are skipped and counted in malformed
         
         Returns:
             [[float, int, int, int]...]: result a list of lists [[aid_time(sec),channel,label,data],...]
+        
+        Raises:
+            socket.error: AID closed the connection
         """
         #TODO implement gracefull handling of ctr-c for recv
-        #TODO replace with a generator
-        data, addr = self.sock.recvfrom(2048) # buffer size is 2048 bytes
-        data=data.split('\n')
+        try:
+            lines=next(self.frames)
+        except StopIteration:
+            raise socket.error("AID closed the connection")
+        self.complete=bool(lines)
+        self.malformed=0
+        global t_start
+        t_start=time.time()
+        conv_dict=self.conv_dict
         result=list()
-        for elm in data:
-            if 'data' in elm:
-                temp=elm.split(',')
-                result.append([float(temp[1]), #time_stamps
-                                int(temp[2]),  #chanel
-                                int(temp[3]),   #Label
-                                int(temp[4],16)]) # data
+        for line in lines:
+            if line.startswith('data,'):
+                try:
+                    temp=line.split(',')
+                    channel=int(temp[2])
+                    label=int(temp[3])
+                    if (channel,label) in conv_dict:
+                        result.append([float(temp[1]), #time_stamps
+                                        channel,
+                                        label,
+                                        int(temp[4],16)]) # data
+                except (ValueError,IndexError):
+                    self.malformed+=1
         return result
     def format_recv(self,recv_list):
-        """Summary
+        """decode labels, invalid words (NCD, FT, FW, parity) are dropped
+        the words of a label are decoded together when the read holds at
+        least A429_BATCH_MIN of them (see a429_batch_converter)
         
         Args:
-            recv_list (TYPE): Description
+            recv_list (list): [[aid_time,channel,label,data],...] (see recv)
+        
+        Returns:
+            dict: {var_key:value} last valid value of each var_key
         """
-        for elm in recv_list:
-            print 'raw: '+str(elm)
-            if elm:
-                channel=elm[1]
-                label=elm[2]
-                val=elm[3]
-                var_key=self.data_subs[channel][label][0]
-                func=self.data_subs[channel][label][1]
-                args=self.data_subs[channel][label][2]
-                val= func(*([val]+args))
-                print 'decoded: '+str(val)
+        result=dict()
+        conv_dict=self.conv_dict
+        for adr,words in aid_bursts(recv_list).items():
+            var_key,conv,conv_batch=conv_dict[adr]
+            if conv_batch is not None and len(words)>=A429_BATCH_MIN:
+                values,status=conv_batch(words)
+                valid=np.flatnonzero(status==A429_NORMAL)
+                if len(valid):
+                    result[var_key]=float(values[valid[-1]])
+                continue
+            for data in words:
+                val,status= conv(data)
+                if not status:
+                    result[var_key]=val
+        return result
 
+    def bind_store(self,store):
+        """compile the converters with store indexes (see format_store)
+        
+        Args:
+            store (Var_store): destination store
+        """
+        index=store.index
+        self.store_conv=dict((adr,(index[var_key],conv,conv_batch)) 
+            for adr,(var_key,conv,conv_batch) in self.conv_dict.items())
 
+    def format_store(self,recv_list,store,now):
+        """decode labels in place, invalid words clear the valid bit
+        
+        Args:
+            recv_list (list): [[aid_time,channel,label,data],...] (see recv)
+            store (Var_store): bound store (see bind_store)
+            now (float): reception time
+        """
+        store_conv=self.store_conv
+        for adr,words in aid_bursts(recv_list).items():
+            idx,conv,conv_batch=store_conv[adr]
+            if conv_batch is not None and len(words)>=A429_BATCH_MIN:
+                values,status=conv_batch(words)
+                valid=np.flatnonzero(status==A429_NORMAL)
+                if len(valid)<len(words):
+                    store.invalidate(idx,now)
+                if len(valid):
+                    store.set(idx,float(values[valid[-1]]))
+                continue
+            for data in words:
+                val,status= conv(data)
+                if status:
+                    store.invalidate(idx,now)
+                else:
+                    store.set(idx,val)
 
 #<END of class AID>
 
@@ -410,9 +1027,19 @@ class NMEA_ublox(object):
     
     Attributes:
         com (TYPE): Description
+        complete (bool): the last recv read at least one complete line
         data_subs (TYPE): Description
+        malformed (int): always 0 (bad sentences are dropped by nmea_framer)
+        multi_src (bool): format_recv returns one source (see Src_poller)
+        rx_throttle (bool): reads can be throttled (see main -r)
         sock (TYPE): Description
+        stale (int): always 0 (see Xplane drain)
     """
+    rx_throttle=True
+    multi_src=False
+    stale=0
+    complete=True
+    malformed=0
     #TODO clean-up
     def __init__(self,data_subs_dict,com,baud=115200):
         """constructor
@@ -420,6 +1047,7 @@ class NMEA_ublox(object):
                 Args:
                     data_subs_dict(dict): variable to track format:
                  {NMEA_sentence:{position:(var_key,func,arg_list}}
+                 positions are listed in nmea_field_dict
                     com (string): com port
         
         Args:
@@ -427,10 +1055,11 @@ class NMEA_ublox(object):
             com (TYPE): Description
         """
         self.data_subs= data_subs_dict
+        self.plan=compile_nmea_dispatch(data_subs_dict)
         self.port=com
         self.baud=baud
         self.ser=None
-        self.isock=None
+        self.frames=None
 
     def check(self):
         """Summary
@@ -444,159 +1073,2477 @@ class NMEA_ublox(object):
         """
         self.ser = serial.Serial(self.port, self.baud, timeout=1)
         if self.ser.isOpen() :print self.ser.name+' is now open...'
-        context = zmq.Context()
-        self.isock = context.socket(zmq.PUB)
-        self.isock.bind("ipc://my-endpoint")
+        self.frames=nmea_framer(self.ser,self.plan)
     def disconnect(self):
         """Summary
         """
         self.ser.close()
         if not (self.ser.isOpen()) :print '[info] '+self.ser.name+' is now closed...'
+    def fileno(self):
+        """file descriptor to poll (see Src_poller)
+        """
+        return self.ser.fileno()
     def recv(self):
-        """Summary
+        """read available bytes and return subscribed sentences
+        (see nmea_framer)
+        
+        Returns:
+            [(nmea_sen,sentence)...]: checked sentences (can be empty)
         """
         if self.ser.isOpen() :
-            data = self.ser.readline().rstrip()
-            for key in self.data_subs.keys():
-                if key in data:
-                    self.isock.send(data)
-                    return (key,data)
+            recv_list=next(self.frames)
+            self.complete=recv_list is not None
+            if recv_list:
+                global t_start
+                t_start=time.time()
+            return recv_list or []
     def format_recv(self,recv_list):
-        #get parse func
-        nmea_sen= recv_list[0]
-        recv_txt=recv_list[1]
-        data_subs=self.data_subs
-        key0=data_subs[nmea_sen].keys()[0]
-        func=data_subs[nmea_sen][key0][1]
-        parsed=func(recv_txt)
+        """convert subscribed fields of sentences
+        
+        Args:
+            recv_list (list): [(nmea_sen,sentence)...] (see recv)
+        
+        Returns:
+            dict: {var_key:value} last sentence wins
+        """
         result=dict()
-        key0=data_subs[nmea_sen].keys()[0]
-        for pos in data_subs[nmea_sen]:
-            result[data_subs[nmea_sen][pos][0]]=parsed[pos]
+        plan=self.plan
+        for nmea_sen,sentence in recv_list:
+            fields=sentence[:-3].split(',') # remove *hh
+            for var_key,func,args in plan[nmea_sen]:
+                result[var_key]=func(fields,*args)
         return result
 
+    def bind_store(self,store):
+        """compile the plan with store indexes (see format_store)
+        
+        Args:
+            store (Var_store): destination store
+        """
+        index=store.index
+        self.store_plan=dict((nmea_sen,([(index[var_key],func,args) 
+            for var_key,func,args in entries],
+            tuple(index[entry[0]] for entry in entries)))
+            for nmea_sen,entries in self.plan.items())
+
+    def format_store(self,recv_list,store,now):
+        """convert subscribed fields in place (last sentence wins)
+        
+        Args:
+            recv_list (list): [(nmea_sen,sentence)...] (see recv)
+            store (Var_store): bound store (see bind_store)
+            now (float): reception time
+        """
+        msg=store.msg
+        touch=store.touched.append
+        plan=self.store_plan
+        for nmea_sen,sentence in recv_list:
+            fields=sentence[:-3].split(',') # remove *hh
+            entries,idxs=plan[nmea_sen]
+            for idx,func,args in entries:
+                msg[idx]=func(fields,*args)
+            touch(idxs)
+
 #<end of ENMEA_ublox>
 
-class Zmq_pmt(object):
-    """class for managing zmq and pmt transfers"""
-    def __init__(self, adr):
+class Wire_schema(object):
+    """fixed little-endian binary layout of var_key values (alternative to pmt)
+    
+    data message (fixed size):
+        +-------+---------+------+-------------+------------------------------+
+        | magic | version | kind | schema hash | value per var_key            |
+        | 'AZ'  | uint8   | 0    | uint32      | float64 ordered by var_key   |
+        +-------+---------+------+-------------+------------------------------+
+        not received var_key are NaN
+    schema message: same header with kind 1 followed by a json descriptor
+        {"version":1,"vars":[[var_key,var_name],...]}
+    the hash is the crc32 of the descriptor
+    
+    Attributes:
+        buf (bytearray): reused data message buffer
+        descriptor (str): json descriptor
+        hash (int): schema hash
+        slot (dict): {var_key:slot}
+        vars (list): [[var_key,var_name]...] ordered by var_key
+    """
+    def __init__(self,key_dict):
         """constructor
-        args
-        adr(tuple): adress of zmq (ip,port)
-            ip(string): xx.xx.xx.xx
-            port(int)
         
         Args:
-            adr (TYPE): Description
-        """
-        self.adr = adr
-        self.zmq_sock=None
-    def connect(self):
-        """create zmq sock
+            key_dict (dict): {var_name:var_key} (see data_collect.key_dict)
         """
-        context = zmq.Context()
-        adr="tcp://"+self.adr[0]+":"+str(self.adr[1])
-        self.zmq_sock = context.socket(zmq.PUSH)
-        self.zmq_sock.setsockopt(zmq.SNDTIMEO, 1000)
-        self.zmq_sock.bind(adr)
-        print "[info] zmq connected to "+ str(self.adr)
-    
-    def disconnect(self):
-        """Summary
+        self.vars=sorted([var_key,var_name] for var_name,var_key in key_dict.items())
+        self.slot=dict((var[0],slot) for slot,var in enumerate(self.vars))
+        self.descriptor=json.dumps({"version":WIRE_VERSION,"vars":self.vars},
+            sort_keys=True,separators=(',',':'))
+        self.hash=zlib.crc32(self.descriptor)&0xffffffff
+        self.header=struct.Struct(WIRE_HEADER_FMT)
+        self.packer=struct.Struct(WIRE_HEADER_FMT+'%id' % len(self.vars))
+        self.empty=[float('nan')]*len(self.vars)
+        self.buf=bytearray(self.packer.size)
+        self.buf_view=(ctypes.c_char*len(self.buf)).from_buffer(self.buf)
+        self.buf_addr=ctypes.addressof(self.buf_view) # see pack_store
+
+    @classmethod
+    def from_descriptor(cls,msg):
+        """build schema from a schema message (consumer side)
+        
+        Args:
+            msg (str): schema message (see pack_schema)
+        
+        Returns:
+            Wire_schema: schema
+        
+        Raises:
+            ValueError: not a schema message or hash mismatch
         """
-        self.zmq_sock.close()
-        print "[info] zmq disconnected from "+ str(self.adr)
+        magic,version,kind,schema_hash=struct.unpack_from(WIRE_HEADER_FMT,msg)
+        if magic!=WIRE_MAGIC or kind!=WIRE_SCHEMA:
+            raise ValueError("not a schema message")
+        descriptor=json.loads(msg[struct.calcsize(WIRE_HEADER_FMT):])
+        schema=cls(dict((var_name,var_key) for var_key,var_name in descriptor["vars"]))
+        if schema.hash!=schema_hash:
+            raise ValueError("schema hash mismatch %08x!=%08x" % (schema.hash,schema_hash))
+        return schema
 
-    def send_dict(self,dict_to_send):
-        """send data dict through zmq
+    def pack(self,dict_to_send):
+        """pack values in the reused buffer
+        var_keys not in the schema (ex: replay of another catalog) are ignored
         
-        args:
-            dict_to_send (TYPE): Description
+        Args:
+            dict_to_send (dict): {var_key:value}
         
-        Deleted Parameters:
-            dict_to_send(dict): {var_key:value}
+        Returns:
+            bytearray: data message (valid until next pack)
         """
-        pmt_dict=pmt.to_pmt(dict_to_send)
-        pmt_ser=pmt.serialize_str(pmt_dict)
-        global t_end
-        t_end= time.time()
-        self.zmq_sock.send(pmt_ser)
+        values=list(self.empty)
+        slot=self.slot
+        for var_key in dict_to_send:
+            i=slot.get(var_key)
+            if i is not None:
+                values[i]=dict_to_send[var_key]
+        self.packer.pack_into(self.buf,0,WIRE_MAGIC,WIRE_VERSION,WIRE_DATA,
+            self.hash,*values)
+        return self.buf
+
+    def pack_store(self,store):
+        """pack the current message of a store in the reused buffer without
+        intermediate list (store.msg is copied as is, same var_key order)
         
-def main():
-    """TODO: document this
-    """
-    #--------Define options--------------------
-    usage = """ %prog [options] src 
-                src == x ==> source is X-Plane
-                src == a ==> source is AID
-                src == u ==> source is Ublock"""
-    version = 0.1
-    parser = OptionParser(usage=usage,version=version)    
-    parser.add_option("-s", "--src",
-                  dest="src_adr",
-                  type="string",
-                  default="0.0.0.0:49000",
-                  help="source ip address ip:port default=10.10.201.254:49000")
-    parser.add_option("-d", "--dest",
-                  dest="dest_adr",
-                  type="string",
-                  default="127.0.0.1:5556",
-                  help="destination ip address ip:port default=127.0.0.1:5556")
-    parser.add_option("-l", "--log",
-                  dest="log_file_prefix",
-                  type="string",
-                  help="log data into a file")
-    parser.add_option("-u", "--com",
-                  dest="com",
-                  type = "string",
-                  default="/dev/ttyACM0",
-                  help="u-Blox serial com.")
-    parser.add_option("-t", "--tx_ms",
-                  dest="tx_ms",
-                  type = "int",
-                  help="transmition min periode in ms")
-    parser.add_option("-r", "--rx_ms",
-                  dest="rx_ms",
-                  type = "int",
-                  help="transmition min periode in ms")
+        Args:
+            store (Var_store): store of the same var_keys
+        
+        Returns:
+            bytearray: data message (valid until next pack)
+        """
+        self.header.pack_into(self.buf,0,WIRE_MAGIC,WIRE_VERSION,WIRE_DATA,
+            self.hash)
+        if sys.byteorder=="little":
+            ctypes.memmove(self.buf_addr+self.header.size,
+                store.msg.buffer_info()[0],len(store.msg)*store.msg.itemsize)
+        else:
+            self.packer.pack_into(self.buf,0,WIRE_MAGIC,WIRE_VERSION,WIRE_DATA,
+                self.hash,*store.msg)
+        return self.buf
 
-    #--------Parse options--------------------
+    def pack_schema(self):
+        """schema message
+        
+        Returns:
+            str: header+json descriptor
+        """
+        return self.header.pack(WIRE_MAGIC,WIRE_VERSION,WIRE_SCHEMA,self.hash)+self.descriptor
 
-    (options, args) = parser.parse_args()
-    if (len(args) != 1) or ((args[0]!="a") and (args[0]!="x") and (args[0]!="u"))  :
-        parser.error("argument must be x, a or u")
+    def unpack(self,msg):
+        """unpack a data message (consumer side)
+        
+        Args:
+            msg (str): data message
+        
+        Returns:
+            dict: {var_key:value} received values
+        
+        Raises:
+            ValueError: not a data message of this schema
+        """
+        data=self.packer.unpack_from(msg)
+        if data[0]!=WIRE_MAGIC or data[2]!=WIRE_DATA or data[3]!=self.hash:
+            raise ValueError("not a data message of schema %08x" % self.hash)
+        result=dict()
+        for var,val in zip(self.vars,data[4:]):
+            if val==val: # not NaN
+                result[var[0]]=val
+        return result
+#<END of class Wire_schema>
+
+class Var_store(object):
+    """latest value of every variable in preallocated arrays
+    variables have a dense index in var_key order (same as Wire_schema
+    slots). Sources write the current message in place into msg (NaN is
+    not received) and touch the index tuples they wrote (precompiled per
+    group, see format_store). msg is copied as is as a Wire_schema payload,
+    commit() then moves it to values/times/valid. Nothing is allocated
+    per value.
+    
+    Attributes:
+        index (dict): {var_key:idx}
+        keys (array.array): var_key of each idx
+        blank (array.array): all NaN message (see discard)
+        msg (array.array): values of the current message, NaN if not updated
+        single (list): (idx,) tuple of each idx (see set)
+        times (array.array): last commit time of each idx
+        touched (list): idx tuples written by the current message
+        valid (bytearray): 1 if the last value of idx is valid
+        values (array.array): last value of each idx
+    """
+    def __init__(self,var_keys):
+        """constructor
+        
+        Args:
+            var_keys (list): all var_key (see data_collect.vdict)
+        """
+        keys=sorted(var_keys)
+        size=len(keys)
+        self.keys=array.array('i',keys)
+        self.index=dict((var_key,idx) for idx,var_key in enumerate(keys))
+        self.values=array.array('d',[0.0]*size)
+        self.times=array.array('d',[0.0]*size)
+        self.valid=bytearray(size)
+        self.msg=array.array('d',[float('nan')]*size)
+        self.blank=array.array('d',self.msg)
+        self.single=[(idx,) for idx in range(size)]
+        self.touched=list()
+
+    def set(self,idx,value):
+        """write one value of the current message
+        
+        Args:
+            idx (int): variable index
+            value (float): value
+        """
+        self.msg[idx]=value
+        self.touched.append(self.single[idx])
+
+    def invalidate(self,idx,now):
+        """clear the valid bit (value is kept, not sent)
+        
+        Args:
+            idx (int): variable index
+            now (float): reception time
+        """
+        self.valid[idx]=0
+        self.times[idx]=now
+
+    def write_dict(self,recv_dict):
+        """write formated values in the current message (see format_recv)
+        unknown var_keys (ex: replay of another catalog) are ignored
+        
+        Args:
+            recv_dict (dict): {var_key:value}
+        """
+        index=self.index
+        for var_key in recv_dict:
+            idx=index.get(var_key)
+            if idx is not None:
+                self.set(idx,recv_dict[var_key])
+
+    def as_dict(self):
+        """current message as a dict (allocates, for dict consumers)
+        
+        Returns:
+            dict: {var_key:value}
+        """
+        keys=self.keys
+        msg=self.msg
+        result=dict()
+        for idxs in self.touched:
+            for idx in idxs:
+                value=msg[idx]
+                if value==value:
+                    result[keys[idx]]=value
+        return result
+
+    def commit(self,now):
+        """end of the current message: msg to values, times and valid
+        
+        Args:
+            now (float): reception time
+        """
+        nan=float('nan')
+        msg=self.msg
+        values=self.values
+        times=self.times
+        valid=self.valid
+        for idxs in self.touched:
+            for idx in idxs:
+                value=msg[idx]
+                if value==value: # first touch of idx
+                    values[idx]=value
+                    times[idx]=now
+                    valid[idx]=1
+                    msg[idx]=nan
+        del self.touched[:]
+
+    def discard(self):
+        """drop the current message (format error), nothing is committed
+        every value is cleared: a source can fail between writing msg and
+        touching the idx tuple
+        """
+        self.msg[:]=self.blank
+        del self.touched[:]
+#<END of class Var_store>
+
+class Tx_scheduler(object):
+    """latest value coalescing between format_recv and send_dict
+    received values are kept per var_key (latest wins) and one merged
+    message is sent for all rate groups that are due
+    
+    Attributes:
+        dest (Zmq_pmt): destination
+        groups (list): [[periode(sec),deadline,pending_dict]...]
+        pending_of (dict): {var_key:pending_dict} of non default groups
+    """
+    def __init__(self,dest,tx_ms,tx_dict=None):
+        """constructor
+        
+        Args:
+            dest (Zmq_pmt): destination (send_dict)
+            tx_ms (int): default min periode in ms
+            tx_dict (dict, optional): {var_key:tx_ms} rate groups 
+                (see data_collect.set_tx_ms)
+        """
+        self.dest=dest
+        tx_dict=tx_dict or dict()
+        pending_dict=dict() # {tx_ms:pending_dict}
+        self.groups=list()
+        for ms in sorted(set([tx_ms]+tx_dict.values())):
+            pending_dict[ms]=dict()
+            self.groups.append([ms/1000.0,0.0,pending_dict[ms]])
+        self.default=pending_dict[tx_ms]
+        self.pending_of=dict((var_key,pending_dict[tx_dict[var_key]]) 
+            for var_key in tx_dict)
+
+    def update(self,recv_dict):
+        """keep latest values
+        
+        Args:
+            recv_dict (dict): {var_key:value} (see format_recv)
+        """
+        pending_of=self.pending_of
+        default=self.default
+        for var_key in recv_dict:
+            pending_of.get(var_key,default)[var_key]=recv_dict[var_key]
+
+    def poll(self,now):
+        """send one merged message of due groups (if any value is pending)
+        
+        Args:
+            now (float): time.time()
+        
+        Returns:
+            dict: sent message or None
+        """
+        msg=None
+        for group in self.groups:
+            if now>=group[1] and group[2]:
+                if msg is None:
+                    msg=dict()
+                msg.update(group[2])
+                group[2].clear()
+                group[1]+=group[0]
+                if group[1]<=now: # late or idle: restart from now
+                    group[1]=now+group[0]
+        if msg:
+            self.dest.send_dict(msg)
+        return msg
+
+    def next_deadline(self):
+        """earliest deadline of groups with pending values
+        
+        Returns:
+            float: time or None if nothing is pending
+        """
+        deadlines=[group[1] for group in self.groups if group[2]]
+        if deadlines:
+            return min(deadlines)
+        return None
+#<END of class Tx_scheduler>
+
+class Resampler(object):
+    """fixed-rate output of the latest values (instead of Tx_scheduler)
+    every periode one message holds each known variable at the sample time
+    (tick-delay), in the mode of the variable (see data_collect.set_resample):
+        - between two samples: linear interpolation (delay > 0 needed)
+        - after the last sample: extrapolation from the slope of the last
+          two samples for at most max_extrap sec, then held
+        - hold: last sample at the sample time
+    A variable without sample for stale sec is no longer sent. Ticks are on
+    a fixed monotonic grid (multiples of periode) so a late tick does not
+    shift the next ones (no drift), skipped ticks are counted as
+    METRIC_TX_MISSED. Messages are stamped with the sample time (header
+    capture time, see Zmq_pmt).
+    
+    Attributes:
+        dest (Zmq_pmt): destination
+        hist (dict): {var_key:[(monotonic time,value)...]} samples, oldest
+            first (trimmed at each tick)
+        mode_of (dict): {var_key:mode} variables not linear
+        periode (float): sec
+        tick (int): index of the next tick (deadline tick*periode)
+        wall0 (float): time.time() at monotonic 0 (sample time stamps)
+    """
+    def __init__(self,dest,periode_ms,delay_ms=0,extrap_ms=None,stale_ms=None,
+            mode_dict=None):
+        """constructor
+        
+        Args:
+            dest (Zmq_pmt): destination (send_dict)
+            periode_ms (int): output periode in ms
+            delay_ms (int, optional): sample time behind the tick (values
+                are interpolated instead of extrapolated)
+            extrap_ms (int, optional): max extrapolation default
+                RESAMPLE_EXTRAP_MS
+            stale_ms (int, optional): a variable is no longer sent without
+                sample (default always sent)
+            mode_dict (dict, optional): {var_key:mode} (see
+                data_collect.resample_dict)
+        """
+        self.dest=dest
+        self.periode=periode_ms/1000.0
+        self.delay=delay_ms/1000.0
+        if extrap_ms is None:
+            extrap_ms=RESAMPLE_EXTRAP_MS
+        self.max_extrap=extrap_ms/1000.0
+        self.stale=stale_ms/1000.0 if stale_ms else None
+        self.mode_of=dict((var_key,mode) for var_key,mode in (mode_dict or {}).items()
+            if mode!="linear")
+        self.hist=dict()
+        now=monotonic()
+        self.wall0=time.time()-now
+        self.tick=int(math.ceil(now/self.periode))
+
+    def update(self,recv_dict):
+        """add samples (received now)
+        
+        Args:
+            recv_dict (dict): {var_key:value} (see format_recv)
+        """
+        now=monotonic()
+        hist=self.hist
+        for var_key in recv_dict:
+            samples=hist.get(var_key)
+            if samples is None:
+                samples=hist[var_key]=list()
+            samples.append((now,recv_dict[var_key]))
+
+    def poll(self,now):
+        """send the message of the due tick (the latest one if late)
+        
+        Args:
+            now (float): time.time() (not used, the grid is monotonic)
+        
+        Returns:
+            dict: sent message or None
+        """
+        periode=self.periode
+        t=monotonic()
+        if t<self.tick*periode:
+            return None
+        late=int(t/periode)-self.tick
+        if late>0:
+            self.dest.metrics.count(self.dest.src_id,METRIC_TX_MISSED,late)
+            self.tick+=late
+        t_sample=self.tick*periode-self.delay
+        self.tick+=1
+        msg=self.sample(t_sample)
+        if msg:
+            self.dest.send_dict(msg,None,self.wall0+t_sample)
+        return msg
+
+    def sample(self,t):
+        """values of every variable at a time (see class docstring)
+        samples no longer needed for t are removed
+        
+        Args:
+            t (float): monotonic time
+        
+        Returns:
+            dict: {var_key:value}
+        """
+        msg=dict()
+        mode_of=self.mode_of
+        stale=self.stale
+        for var_key,samples in self.hist.items():
+            while len(samples)>2 and samples[1][0]<=t:
+                del samples[0]
+            t1,v1=samples[-1]
+            if stale and t-t1>stale:
+                continue
+            mode=mode_of.get(var_key)
+            if mode=="hold" or len(samples)==1:
+                for t1,v1 in reversed(samples): # last sample before t
+                    if t1<=t:
+                        break
+                msg[var_key]=v1
+                continue
+            if t>=t1: # extrapolation
+                t0,v0=samples[-2]
+                f=1.0+min(t-t1,self.max_extrap)/(t1-t0) if t1>t0 else 1.0
+            else:
+                for i in range(1,len(samples)):
+                    if samples[i][0]>t:
+                        break
+                t0,v0=samples[i-1]
+                t1,v1=samples[i]
+                f=max(0.0,(t-t0)/(t1-t0)) if t1>t0 else 1.0
+            if mode is None:
+                msg[var_key]=v0+(v1-v0)*f
+            else: # angle, angle180: shortest way
+                value=v0+((v1-v0+180)%360-180)*f
+                msg[var_key]=value%360 if mode=="angle" else (value+180)%360-180
+        return msg
+
+    def next_deadline(self):
+        """time of the next tick
+        
+        Returns:
+            float: time.time() domain
+        """
+        return time.time()+self.tick*self.periode-monotonic()
+#<END of class Resampler>
+
+class Delta_filter(object):
+    """change-only transmission (see Zmq_pmt.delta)
+    a value is sent when it moved beyond the deadband of its variable since
+    the last sent value (default 0: any change). Every keyframe periode the
+    latest value of all received variables is sent (consumers resync).
+    
+    Attributes:
+        deadband (array.array): deadband per var
+        key_periode (float): keyframe periode (sec)
+        key_time (float): next keyframe time
+        keys (list): var_key per var
+        last (array.array): latest received value per var (NaN never)
+        sent (array.array): last sent value per var (NaN never)
+        var_idx (dict): {var_key:var index}
+    """
+    def __init__(self,var_keys,key_sec=1.0,deadband_dict=None):
+        """constructor
+        
+        Args:
+            var_keys (list): all var_key (see data_collect.vdict)
+            key_sec (float, optional): keyframe periode in sec
+            deadband_dict (dict, optional): {var_key:deadband} (see
+                data_collect.set_deadband)
+        """
+        deadband_dict=deadband_dict or dict()
+        self.keys=sorted(var_keys)
+        self.var_idx=dict((var_key,v) for v,var_key in enumerate(self.keys))
+        size=len(self.keys)
+        self.deadband=array.array('d',[deadband_dict.get(var_key,0.0) 
+            for var_key in self.keys])
+        self.last=array.array('d',[float('nan')]*size)
+        self.sent=array.array('d',[float('nan')]*size)
+        self.key_periode=key_sec
+        self.key_time=0.0
+
+    def filter(self,recv_dict,now):
+        """changed values or a keyframe
+        unknown var_keys (ex: replay of another catalog) are ignored
+        
+        Args:
+            recv_dict (dict): {var_key:value}
+            now (float): time.time()
+        
+        Returns:
+            dict: {var_key:value} to send (empty if nothing changed)
+        """
+        var_idx=self.var_idx
+        last=self.last
+        sent=self.sent
+        if now>=self.key_time:
+            self.key_time+=self.key_periode
+            if self.key_time<=now: # late or idle: restart from now
+                self.key_time=now+self.key_periode
+            for var_key in recv_dict:
+                v=var_idx.get(var_key)
+                if v is not None:
+                    last[v]=recv_dict[var_key]
+            result=dict()
+            keys=self.keys
+            for v in range(len(keys)):
+                val=last[v]
+                if val==val:
+                    result[keys[v]]=val
+                    sent[v]=val
+            return result
+        deadband=self.deadband
+        result=dict()
+        for var_key in recv_dict:
+            v=var_idx.get(var_key)
+            if v is None:
+                continue
+            val=recv_dict[var_key]
+            last[v]=val
+            ref=sent[v]
+            if not abs(val-ref)<=deadband[v]: # NaN: never sent
+                result[var_key]=val
+                sent[v]=val
+        return result
+#<END of class Delta_filter>
+
+class Derived_engine(object):
+    """variables computed from other variables (see data_collect.set_derived)
+    the latest value of inputs and derived variables is kept per source
+    (sources are never mixed, fusion selects afterward). A derived variable
+    is recomputed in dependency order when one of its inputs changed, never
+    for a source that gives it. A batch of records (replay, pipeline) is
+    computed with one numpy call per derived variable. A Var_store message
+    is read and completed in place (see update_store).
+    
+    Attributes:
+        col (dict): {var_key:column} inputs and derived variables
+        keys (list): var_key per column
+        plan (list): [(var_key,func,input columns,args,column)...] in
+            dependency order
+        states (dict): {src_id:(values,direct)} latest value per column
+            (array.array NaN unknown) and derived columns given by the
+            source (bytearray)
+        store_cols (list): column of each store idx (None not used)
+        store_idx (list): store idx of each column (None not stored)
+    """
+    def __init__(self,derived_dict):
+        """constructor
+        
+        Args:
+            derived_dict (dict): {var_key:(func,input var_keys,args)} (see
+                data_collect.derived_dict)
+        
+        Raises:
+            ValueError: circular dependency
+        """
+        keys=set(derived_dict)
+        for func,inputs,args in derived_dict.values():
+            keys.update(inputs)
+        self.keys=sorted(keys)
+        self.col=dict((var_key,c) for c,var_key in enumerate(self.keys))
+        col=self.col
+        self.plan=list()
+        for var_key in derived_order(derived_dict):
+            func,inputs,args=derived_dict[var_key]
+            self.plan.append((var_key,func,tuple(col[k] for k in inputs),
+                list(args),col[var_key]))
+        self.states=dict()
+        self.store_cols=None
+        self.store_idx=None
+
+    def bind_store(self,store):
+        """map store indexes to columns (see update_store)
+        
+        Args:
+            store (Var_store): store of the messages
+        """
+        self.store_cols=[None]*len(store.keys)
+        for var_key,c in self.col.items():
+            idx=store.index.get(var_key)
+            if idx is not None:
+                self.store_cols[idx]=c
+        self.store_idx=[store.index.get(var_key) for var_key in self.keys]
+
+    def state(self,src_id):
+        """state of a source (created on first use)
+        
+        Args:
+            src_id (int): source id
+        
+        Returns:
+            tuple: (values,direct) see states
+        """
+        state=self.states.get(src_id)
+        if state is None:
+            state=(array.array('d',[float('nan')]*len(self.keys)),
+                bytearray(len(self.keys)))
+            self.states[src_id]=state
+        return state
+
+    def update(self,src_id,recv_dict):
+        """derive one message
+        
+        Args:
+            src_id (int): source id
+            recv_dict (dict): {var_key:value} derived values are added
+        
+        Returns:
+            dict: {var_key:value} derived values
+        """
+        values,direct=self.state(src_id)
+        col=self.col
+        changed=set()
+        given=set()
+        for var_key in recv_dict:
+            c=col.get(var_key)
+            if c is not None:
+                given.add(c)
+                value=recv_dict[var_key]
+                if value!=values[c]:
+                    values[c]=value
+                    changed.add(c)
+        result=dict()
+        if not changed:
+            return result
+        for var_key,out,value in self.derive(values,direct,changed,given):
+            result[var_key]=value
+            recv_dict[var_key]=value
+        return result
+
+    def update_store(self,src_id,store):
+        """derive the current message of a store in place (same values as
+        update on store.as_dict(), no dict is built)
+        
+        Args:
+            src_id (int): source id
+            store (Var_store): bound store (see bind_store), derived values
+                are set in the current message
+        """
+        values,direct=self.state(src_id)
+        store_cols=self.store_cols
+        msg=store.msg
+        changed=set()
+        given=set()
+        for idxs in store.touched:
+            for idx in idxs:
+                c=store_cols[idx]
+                if c is None:
+                    continue
+                value=msg[idx]
+                if value!=value: # NaN: not received
+                    continue
+                given.add(c)
+                if value!=values[c]:
+                    values[c]=value
+                    changed.add(c)
+        if not changed:
+            return
+        store_idx=self.store_idx
+        for var_key,out,value in self.derive(values,direct,changed,given):
+            idx=store_idx[out]
+            if idx is not None:
+                store.set(idx,value)
+
+    def derive(self,values,direct,changed,given):
+        """recompute derived variables of changed inputs (see update)
+        
+        Args:
+            values (array.array): latest value per column, updated
+            direct (bytearray): derived columns given by the source, updated
+            changed (set): changed columns, derived changes are added
+            given (set): columns of the message
+        
+        Yields:
+            (int,int,float): (var_key,column,value) derived values
+        """
+        for var_key,func,cols,args,out in self.plan:
+            if out in given:
+                direct[out]=1
+                continue
+            if direct[out] or changed.isdisjoint(cols):
+                continue
+            inputs=[values[c] for c in cols]
+            if any(value!=value for value in inputs): # NaN: not received yet
+                continue
+            value=float(func(*(inputs+args)))
+            if value!=values[out]:
+                values[out]=value
+                changed.add(out)
+            yield var_key,out,value
+
+    def update_records(self,records):
+        """derive records of several sources (see update_batch)
+        
+        Args:
+            records (list): [(src_id,recv_dict)...] derived values are added
+        """
+        if len(records)==1:
+            self.update(*records[0])
+            return
+        by_src=dict() # {src_id:[recv_dict...]} order is kept per source
+        for src_id,recv_dict in records:
+            by_src.setdefault(src_id,list()).append(recv_dict)
+        for src_id,dicts in by_src.items():
+            if len(dicts)<DERIVED_BATCH_MIN:
+                for recv_dict in dicts:
+                    self.update(src_id,recv_dict)
+            else:
+                self.update_batch(src_id,dicts)
+
+    def update_batch(self,src_id,dicts):
+        """derive consecutive messages of one source (same result as update
+        on each one): columns are forward filled then each derived variable
+        is computed by one func call on the rows where an input changed
+        
+        Args:
+            src_id (int): source id
+            dicts (list): [recv_dict...] derived values are added
+        """
+        values,direct=self.state(src_id)
+        col=self.col
+        nrow=len(dicts)+1 # row 0: state before the batch
+        ncol=len(self.keys)
+        raw=np.full((nrow,ncol),np.nan)
+        given=np.zeros((nrow,ncol),dtype=bool)
+        raw[0]=np.frombuffer(values,dtype=np.float64)
+        given[0]=True
+        for r,recv_dict in enumerate(dicts,1):
+            for var_key in recv_dict:
+                c=col.get(var_key)
+                if c is not None:
+                    raw[r,c]=recv_dict[var_key]
+                    given[r,c]=True
+        rows=np.arange(nrow)
+        last=np.where(given,rows[:,None],0)
+        np.maximum.accumulate(last,axis=0,out=last)
+        vals=raw[last,np.arange(ncol)]
+        changed=derived_changed(vals)
+        for var_key,func,cols,args,out in self.plan:
+            if direct[out]:
+                continue
+            first=np.flatnonzero(given[1:,out]) # the source gives it from there
+            if len(first):
+                direct[out]=1
+            cols=list(cols)
+            inputs=vals[1:,cols]
+            need=changed[:,cols].any(axis=1)&~np.isnan(inputs).any(axis=1)
+            if len(first):
+                need[first[0]:]=False
+            idx=np.nonzero(need)[0]
+            if not len(idx):
+                continue
+            result=np.asarray(func(*([inputs[idx,i] for i in range(len(cols))]+args)),
+                dtype=np.float64)*np.ones(len(idx))
+            for r,value in zip(idx.tolist(),result.tolist()):
+                dicts[r][var_key]=value
+            raw[idx+1,out]=result
+            mask=given[:,out].copy()
+            mask[idx+1]=True
+            last=np.where(mask,rows,0)
+            np.maximum.accumulate(last,out=last)
+            vals[:,out]=raw[last,out]
+            changed[:,out]=derived_changed(vals[:,out])
+        values[:]=array.array('d',vals[-1].tolist())
+#<END of class Derived_engine>
+
+class Var_fusion(object):
+    """per variable multi-source fusion (priority, staleness and failover)
+    latest value and time of each (var_key,source) are kept in flat arrays
+    (index var*nsrc+src). For each variable the best ranked source is
+    selected, a fresh lower ranked source takes over when the selected one
+    is older than stale_ms, the higher ranked source takes back as soon as
+    it sends again. Only the received variables are checked (no scan).
+    
+    Attributes:
+        col_dict (dict): {src_id:column}
+        rank (array.array): priority rank per (var,src) lower is better
+        sel (array.array): selected column per var (-1 none)
+        stale (float): max age (sec) of the selected source
+        times (array.array): last update time per (var,src)
+        values (array.array): last value per (var,src)
+        var_idx (dict): {var_key:var index}
+    """
+    def __init__(self,var_keys,src_ids,stale_ms=1000,priority_dict=None):
+        """constructor
+        
+        Args:
+            var_keys (list): all var_key (see data_collect.vdict)
+            src_ids (list): source ids by default priority (best first)
+            stale_ms (int, optional): max age of selected source in ms
+            priority_dict (dict, optional): {var_key:[src_id...]} per variable
+                priority (see data_collect.set_priority)
+        """
+        priority_dict=priority_dict or dict()
+        self.nsrc=len(src_ids)
+        self.col_dict=dict((src_id,col) for col,src_id in enumerate(src_ids))
+        self.var_idx=dict((var_key,v) for v,var_key in enumerate(sorted(var_keys)))
+        size=len(self.var_idx)*self.nsrc
+        self.values=array.array('d',[0.0]*size)
+        self.times=array.array('d',[0.0]*size)
+        self.rank=array.array('i',[0]*size)
+        self.sel=array.array('i',[-1]*len(self.var_idx))
+        self.stale=stale_ms/1000.0
+        for var_key,v in self.var_idx.items():
+            order=priority_dict.get(var_key,src_ids)
+            for col,src_id in enumerate(src_ids):
+                if src_id in order:
+                    self.rank[v*self.nsrc+col]=order.index(src_id)
+                else:
+                    self.rank[v*self.nsrc+col]=self.nsrc # last resort
+
+    def update(self,src_id,recv_dict,now):
+        """store received values and return selected ones
+        unknown var_keys (ex: replay of another catalog) are ignored
+        
+        Args:
+            src_id (int): source id
+            recv_dict (dict): {var_key:value} (see format_recv)
+            now (float): time.time()
+        
+        Returns:
+            dict: {var_key:value} values of the selected source
+        """
+        col=self.col_dict[src_id]
+        nsrc=self.nsrc
+        var_idx=self.var_idx
+        values=self.values
+        times=self.times
+        rank=self.rank
+        sel=self.sel
+        stale=self.stale
+        result=dict()
+        for var_key in recv_dict:
+            v=var_idx.get(var_key)
+            if v is None:
+                continue
+            val=recv_dict[var_key]
+            i=v*nsrc+col
+            values[i]=val
+            times[i]=now
+            cur=sel[v]
+            if cur==col or cur<0 or rank[i]<rank[v*nsrc+cur] or \
+                    now-times[v*nsrc+cur]>stale:
+                sel[v]=col
+                result[var_key]=val
+        return result
+#<END of class Var_fusion>
+
+class Flight_logger(object):
+    """buffered binary logger of the formated stream of every source
+    log() only queues (bounded, never blocks: records are dropped and counted
+    when full), a writer thread packs and writes batches. Files rotate by
+    size or time: prefix_<start time>_<file number>.azl
+    
+    file:
+        header: LOG_HEADER_FMT (magic,version,start time,start monotonic)
+        records: LOG_RECORD_FMT (payload length,src_id,monotonic time)
+            data payload (src_id<LOG_INDEX): LOG_VALUE_FMT per var_key
+            index payload (src_id==LOG_INDEX): previous index block offset
+                then LOG_ENTRY_FMT (monotonic time,record offset) per batch
+        trailer: LOG_TRAILER_FMT (magic,last index block offset) on close
+    index blocks are chained backward from the trailer to seek by time
+    a write error (disk full, bad value) stops logging: the file is closed
+    with its index, error is set and log() drops every record afterward
+    
+    Attributes:
+        dropped (int): records dropped (queue full or logging failed)
+        error (str): write error that stopped logging, None while logging
+        queue (Queue.Queue): (src_id,monotonic time,recv_dict) records
+    """
+    def __init__(self,file_prefix,max_mb=256,max_sec=3600,queue_size=None):
+        """constructor
+        
+        Args:
+            file_prefix (str): file prefix
+            max_mb (int, optional): rotate above this size (MB)
+            max_sec (int, optional): rotate after this time (sec)
+            queue_size (int, optional): max queued records (default LOG_QUEUE_SIZE)
+        """
+        self.file_prefix=file_prefix
+        self.max_bytes=max_mb<<20
+        self.max_sec=max_sec
+        self.queue=Queue.Queue(queue_size or LOG_QUEUE_SIZE)
+        self.dropped=0
+        self.error=None
+        self.thread=None
+        self.f=None
+        self.t_start=time.time()
+        self.nfile=0
+        self.rec_packer=struct.Struct(LOG_RECORD_FMT)
+        self.val_packer=struct.Struct(LOG_VALUE_FMT)
+        self.entry_packer=struct.Struct(LOG_ENTRY_FMT)
+
+    def start(self):
+        """start writer thread
+        """
+        self.thread = Thread(target = self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        """flush queued records and close file
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def log(self,src_id,recv_dict):
+        """queue a record (called from the send path)
+        
+        Args:
+            src_id (int): source id
+            recv_dict (dict): {var_key:value} (not modified afterward)
+        """
+        if self.error is not None:
+            self.dropped+=1
+            return
+        try:
+            self.queue.put_nowait((src_id,monotonic(),recv_dict))
+        except Queue.Full:
+            self.dropped+=1
+
+    def open(self):
+        """open a new file
+        """
+        now=time.time()
+        self.filename=self.file_prefix+"_%i_%03i.azl" % (int(self.t_start),self.nfile)
+        self.nfile+=1
+        self.f=open(self.filename,'wb',LOG_BUF_SIZE)
+        self.f.write(struct.pack(LOG_HEADER_FMT,LOG_MAGIC,LOG_VERSION,now,monotonic()))
+        self.offset=struct.calcsize(LOG_HEADER_FMT)
+        self.t_open=now
+        self.entries=list() # [(monotonic time,offset)...] of next index block
+        self.last_index=-1
+        print "[info] logging to "+self.filename
+
+    def close(self):
+        """write last index block, trailer and close file
+        """
+        self.write_index()
+        self.f.write(struct.pack(LOG_TRAILER_FMT,LOG_TRAILER_MAGIC,self.last_index))
+        self.f.close()
+        self.f=None
+
+    def write_index(self):
+        """write index block of pending entries
+        """
+        if not self.entries:
+            return
+        chunks=[struct.pack('<q',self.last_index)]
+        for entry in self.entries:
+            chunks.append(self.entry_packer.pack(*entry))
+        payload=''.join(chunks)
+        self.f.write(self.rec_packer.pack(len(payload),LOG_INDEX,monotonic())+payload)
+        self.last_index=self.offset
+        self.offset+=self.rec_packer.size+len(payload)
+        self.entries=list()
+
+    def fail(self,error):
+        """stop logging: close file with its index (if still writable)
+        
+        Args:
+            error (Exception): write error
+        """
+        self.error=str(error)
+        print '[warning] logging stopped: %s' % self.error
+        if self.f is None:
+            return
+        try:
+            self.close()
+        except (IOError,OSError) as e:
+            print '[warning] %s not closed: %s' % (self.filename,e)
+            self.f=None
+
+    def run(self):
+        """writer thread: logs until stop, or until a write error then only
+        consumes the queue (records dropped) so that stop never blocks
+        """
+        try:
+            self.write_batches()
+            return
+        except (IOError,OSError,struct.error) as e:
+            self.fail(e)
+        while True:
+            item=self.queue.get()
+            if item is None:
+                return
+            self.dropped+=1
+
+    def write_batches(self):
+        """batch queued records in one write until stop (None record)
+        
+        Raises:
+            IOError, OSError: write error
+            struct.error: value can not be packed
+        """
+        self.open()
+        queue=self.queue
+        rec_packer=self.rec_packer
+        val_packer=self.val_packer
+        while True:
+            item=queue.get()
+            batch=[item]
+            while item is not None and len(batch)<LOG_BATCH:
+                try:
+                    item=queue.get_nowait()
+                except Queue.Empty:
+                    break
+                batch.append(item)
+            chunks=list()
+            size=0
+            for item in batch:
+                if item is None:
+                    break
+                src_id,t,recv_dict=item
+                payload=''.join([val_packer.pack(var_key,recv_dict[var_key]) 
+                    for var_key in recv_dict])
+                chunks.append(rec_packer.pack(len(payload),src_id,t))
+                chunks.append(payload)
+                size+=rec_packer.size+len(payload)
+            if chunks:
+                self.entries.append((batch[0][1],self.offset))
+                self.f.write(''.join(chunks))
+                self.offset+=size
+                if len(self.entries)>=LOG_INDEX_LEN:
+                    self.write_index()
+            if batch[-1] is None:
+                self.close()
+                return
+            if self.offset>self.max_bytes or time.time()-self.t_open>self.max_sec:
+                self.close()
+                self.open()
+#<END of class Flight_logger>
+
+class Log_replay(object):
+    """replay Flight_logger files as a source (same interface as Xplane)
+    files are mapped (mmap) and parsed in place. Records are re-emitted with
+    their recorded src_id at the original timing, speed times faster or
+    as fast as possible (speed 0). Index blocks and trailer are skipped.
+    A backward jump of the recorded time (next session) is replayed as
+    no delay. There is no file descriptor: Src_poller calls recv() when
+    next_time() is reached.
+    
+    Attributes:
+        batch (int): max records per recv
+        complete (bool): always True
+        filenames (list): log files in replay order
+        malformed (int): always 0 (see AID)
+        multi_src (bool): format_recv returns [(src_id,recv_dict)...]
+        next_rec (tuple): (monotonic time,src_id,recv_dict) next record or None
+        records (generator): iter_records over all files
+        rx_throttle (bool): reads can not be throttled (timing is replayed)
+        speed (float): replay speed factor, 0 as fast as possible
+        stale (int): always 0 (see Xplane drain)
+        t_base (float): recorded time replayed at t_play
+        t_last (float): recorded time of last record
+        t_play (float): monotonic() at replay start
+    """
+    rx_throttle=False
+    multi_src=True
+    stale=0
+    complete=True
+    malformed=0
+    def __init__(self,filenames,speed=1.0,batch=None):
+        """constructor
+        
+        Args:
+            filenames (list): log files, or glob pattern (sorted)
+            speed (float, optional): replay speed factor, 0 as fast as possible
+            batch (int, optional): max records per recv (default REPLAY_BATCH)
+        """
+        if isinstance(filenames,str):
+            filenames=sorted(glob.glob(filenames))
+        self.filenames=filenames
+        self.speed=speed
+        self.batch=batch or REPLAY_BATCH
+        self.maps=list()
+        self.records=None
+        self.next_rec=None
+        self.rec_parser=struct.Struct(LOG_RECORD_FMT)
+        self.val_parsers=dict() # {count:struct.Struct}
+
+    def check(self):
+        """check every file header
+        
+        Returns:
+            bool: all files can be replayed
+        """
+        if not self.filenames:
+            print '[warning] no log file to replay'
+            return False
+        for filename in self.filenames:
+            with open(filename,'rb') as f:
+                header=f.read(struct.calcsize(LOG_HEADER_FMT))
+            if len(header)<struct.calcsize(LOG_HEADER_FMT) or \
+                    struct.unpack(LOG_HEADER_FMT,header)[:2]!=(LOG_MAGIC,LOG_VERSION):
+                print '[warning] %s is not a log file' % filename
+                return False
+        print '%i log file(s) to replay' % len(self.filenames)
+        return True
+
+    def connect(self):
+        """map files and start replay clock (nothing to replay if check fails)
+        """
+        self.t_base=self.t_last=0.0
+        self.t_play=monotonic()
+        if not self.check():
+            return
+        for filename in self.filenames:
+            with open(filename,'rb') as f:
+                self.maps.append(mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ))
+        self.records=self.iter_records()
+        self.next_rec=next(self.records,None)
+        self.t_base=self.next_rec[0] if self.next_rec else 0.0
+        self.t_last=self.t_base
+        self.t_play=monotonic()
+
+    def disconnect(self):
+        """unmap files
+        """
+        self.records=None
+        for mm in self.maps:
+            mm.close()
+        self.maps=list()
+        print '[info] replay closed'
+
+    def fileno(self):
+        """no file descriptor (see next_time)
+        """
+        return None
+
+    def iter_records(self):
+        """parse mapped files, a truncated last record (crash) ends a file
+        
+        Yields:
+            (float,int,dict): (monotonic time,src_id,{var_key:value})
+        """
+        rec_parser=self.rec_parser
+        val_size=struct.calcsize(LOG_VALUE_FMT)
+        for mm in self.maps:
+            offset=struct.calcsize(LOG_HEADER_FMT)
+            end=len(mm)-rec_parser.size
+            while offset<=end:
+                length,src_id,t=rec_parser.unpack_from(mm,offset)
+                offset+=rec_parser.size
+                if offset+length>len(mm):
+                    break
+                if src_id!=LOG_INDEX:
+                    count=length//val_size
+                    parser=self.val_parsers.get(count)
+                    if parser is None:
+                        parser=struct.Struct('<'+LOG_VALUE_FMT[1:]*count)
+                        self.val_parsers[count]=parser
+                    vals=parser.unpack_from(mm,offset)
+                    yield t,src_id,dict(zip(vals[::2],vals[1::2]))
+                offset+=length
+
+    def next_time(self):
+        """time.time() at which the next record is due
+        
+        Returns:
+            float: time or None (replay done)
+        """
+        if self.next_rec is None:
+            return None
+        if not self.speed:
+            return 0.0
+        due=self.t_play+(max(self.next_rec[0],self.t_last)-self.t_base)/self.speed
+        return time.time()+due-monotonic()
+
+    def recv(self):
+        """return due records (at most batch)
+        
+        Returns:
+            list: [(monotonic time,src_id,recv_dict)...] (can be empty)
+        
+        Raises:
+            EOFError: replay done
+        """
+        if self.next_rec is None:
+            raise EOFError('replay done')
+        if self.speed:
+            t_due=self.t_base+(monotonic()-self.t_play)*self.speed
+        else:
+            t_due=float('inf')
+        recv_list=list()
+        rec=self.next_rec
+        while rec is not None and len(recv_list)<self.batch:
+            if rec[0]<self.t_last: # next session: rebase on last record
+                self.t_base+=rec[0]-self.t_last
+                t_due+=rec[0]-self.t_last
+            elif rec[0]>t_due:
+                break
+            self.t_last=rec[0]
+            recv_list.append(rec)
+            rec=next(self.records,None)
+        self.next_rec=rec
+        if recv_list:
+            global t_start
+            t_start=time.time()
+        return recv_list
+
+    def format_recv(self,recv_list):
+        """records by source
+        
+        Args:
+            recv_list (list): [(monotonic time,src_id,recv_dict)...] (see recv)
+        
+        Returns:
+            list: [(src_id,recv_dict)...]
+        """
+        return [(src_id,recv_dict) for t,src_id,recv_dict in recv_list]
+#<END of class Log_replay>
+
+class Metrics(object):
+    """preallocated counters and latency histograms (cheap, always on)
+    counters are kept per src_id, histograms per stage (see STAGE_*) in
+    log-linear buckets of microseconds (HDR style): 2**METRIC_SUB_BITS exact
+    buckets then METRIC_SUB_BITS-1 bits of precision per power of 2 (~3%).
+    No allocation per message, a json snapshot is published on a zmq PUB
+    socket every METRIC_PERIOD (see watch_avionics_zmq.py).
+    
+    Attributes:
+        counters (array.array): count per (src_id,METRIC_*)
+        gauges (dict): {name:value} published as is (ex: log_dropped)
+        hists (array.array): count per (STAGE_*,bucket)
+        next_publish (float): next snapshot time or None (not connected)
+        sock (zmq.Socket): PUB socket or None
+    """
+    def __init__(self):
+        """constructor
+        """
+        self.counters=array.array('l',[0]*(METRIC_SRC_MAX*len(metric_counter_names)))
+        self.hists=array.array('l',[0]*(len(metric_stage_names)*METRIC_BUCKETS))
+        self.gauges=dict()
+        self.sock=None
+        self.next_publish=None
+        self.t_start=time.time()
+
+    def connect(self,adr):
+        """bind stats PUB socket
+        
+        Args:
+            adr (tuple): (ip,port)
+        """
+        self.sock=zmq.Context.instance().socket(zmq.PUB)
+        self.sock.bind("tcp://"+adr[0]+":"+str(adr[1]))
+        self.next_publish=time.time()+METRIC_PERIOD
+        print "[info] stats published on "+str(adr)
+
+    def disconnect(self):
+        """close stats socket
+        """
+        if self.sock:
+            self.sock.close()
+            self.sock=None
+            self.next_publish=None
+
+    def count(self,src_id,counter,n=1):
+        """increment a counter
+        
+        Args:
+            src_id (int): source id (0 if unknown)
+            counter (int): METRIC_*
+            n (int, optional): increment
+        """
+        if src_id>=METRIC_SRC_MAX:
+            src_id=0
+        self.counters[src_id*METRIC_NCOUNTERS+counter]+=n
+
+    def record(self,stage,sec):
+        """add a latency to the histogram of a stage
+        
+        Args:
+            stage (int): STAGE_*
+            sec (float): latency in seconds
+        """
+        us=int(sec*1e6)
+        if us<0:
+            us=0
+        m=us.bit_length()-METRIC_SUB_BITS
+        if m<=0:
+            idx=us
+        else:
+            idx=(m<<(METRIC_SUB_BITS-1))+(us>>m)
+            if idx>=METRIC_BUCKETS:
+                idx=METRIC_BUCKETS-1
+        self.hists[stage*METRIC_BUCKETS+idx]+=1
+
+    def snapshot(self):
+        """counters and histograms summary
+        
+        Returns:
+            dict: {"t":time,"uptime":sec,"gauges":{},
+                "counters":{src_id:{name:count}} (sources with counts only),
+                "stages":{name:{"count","p50","p99","p999","max","buckets"}}}
+                latencies in us, buckets [[lower bound us,count]...] not empty
+        """
+        now=time.time()
+        counters=dict()
+        for src_id in range(METRIC_SRC_MAX):
+            row=self.counters[src_id*METRIC_NCOUNTERS:(src_id+1)*METRIC_NCOUNTERS]
+            if any(row):
+                counters[str(src_id)]=dict(zip(metric_counter_names,row))
+        stages=dict()
+        for stage,name in enumerate(metric_stage_names):
+            hist=self.hists[stage*METRIC_BUCKETS:(stage+1)*METRIC_BUCKETS]
+            buckets=[[metric_bucket_us(idx),n] for idx,n in enumerate(hist) if n]
+            total=sum(n for lower,n in buckets)
+            if not total:
+                continue
+            summary={"count":total,"max":buckets[-1][0],"buckets":buckets}
+            for key,q in zip(("p50","p99","p999"),METRIC_PERCENTILES):
+                rank=q*total
+                acc=0
+                for lower,n in buckets:
+                    acc+=n
+                    if acc>=rank:
+                        summary[key]=lower
+                        break
+            stages[name]=summary
+        return {"t":now,"uptime":now-self.t_start,"gauges":self.gauges,
+            "counters":counters,"stages":stages}
+
+    def publish(self,now):
+        """publish snapshot (topic "stats")
+        
+        Args:
+            now (float): time.time()
+        """
+        self.next_publish=now+METRIC_PERIOD
+        try:
+            self.sock.send_multipart([METRIC_TOPIC,json.dumps(self.snapshot())],
+                zmq.NOBLOCK)
+        except zmq.error.Again:
+            pass
+#<END of class Metrics>
+
+class Src_poller(object):
+    """single thread event loop running several sources (zmq.Poller)
+    a source is read only when its file descriptor is readable so one recv
+    never blocks, a slow or silent source can not stall the others.
+    Sources must implement fileno(), recv() and format_recv(rec), complete
+    is False when a read only buffered a partial frame (not counted),
+    malformed counts the skipped frames of a read (decode errors).
+    A source without file descriptor (fileno() is None) must implement
+    next_time(), it is read when due (see Log_replay). A multi_src source
+    returns [(src_id,recv_data)...] from format_recv.
+    fileno() can also return a zmq socket (see Pipe_input).
+    
+    Attributes:
+        dest (Zmq_pmt): destination or None (forward only)
+        derived (Derived_engine): derived variables are added to each
+            formated message or None
+        forward (Pipe_output): raw records are forwarded to the decoders of
+            a pipeline instead of formated (receiver process) or None
+        fusion (Var_fusion): only selected sources are sent or None
+        logger (Flight_logger): formated data of each source is logged or None
+        metrics (Metrics): counters and stage latencies (shared with dest)
+        paused (dict): {fd:time} throttled sources (rx_ms) and resume time
+        pipe (Pipe_input): decoded records of a pipeline or None
+        poller (zmq.Poller): poller
+        rx_periode (float): min reception periode (sec) of throttled sources
+        sched (Tx_scheduler|Resampler): scheduler or None
+        shm (Shm_state): latest values of the store are written in shared
+            memory after each message or None
+        srcs (dict): {fd:(src,src_id)}
+        store (Var_store): sources format in place and the store is sent
+            (dicts are built only for logger, fusion, sched or verbose) or None.
+            With fusion the store holds the selected values (dict path).
+        timed (list): [(src,src_id)...] sources without file descriptor
+        verbose (bool): print formated data of each message
+    """
+    def __init__(self,dest,sched=None,rx_ms=None,fusion=None,store=None):
+        """constructor
+        
+        Args:
+            dest (Zmq_pmt): destination or None (see forward)
+            sched (Tx_scheduler|Resampler, optional): values are merged by
+                scheduler
+            rx_ms (int, optional): min reception periode in ms of sources
+                with rx_throttle
+            fusion (Var_fusion, optional): only selected sources are sent
+            store (Var_store, optional): in place formating (see format_store)
+        """
+        self.dest=dest
+        self.store=store
+        self.sched=sched
+        self.fusion=fusion
+        self.logger=None # Flight_logger
+        self.shm=None # Shm_state
+        self.forward=None # Pipe_output
+        self.pipe=None # Pipe_input
+        self.derived=None # Derived_engine
+        self.metrics=dest.metrics if dest else Metrics()
+        self.verbose=True
+        self.rx_periode=(rx_ms or 0)/1000.0
+        self.poller=zmq.Poller()
+        self.srcs=dict()
+        self.timed=list()
+        self.paused=dict()
+
+    def add(self,src,src_id=0):
+        """add connected source
+        
+        Args:
+            src (Xplane|AID|NMEA_ublox|Log_replay): source
+            src_id (int, optional): source id (see src_id_dict)
+        """
+        if self.store is not None and not src.multi_src:
+            src.bind_store(self.store)
+        fd=src.fileno()
+        if fd is None:
+            self.timed.append((src,src_id))
+            return
+        self.srcs[fd]=(src,src_id)
+        self.poller.register(fd,zmq.POLLIN)
+
+    def add_pipe(self,pipe):
+        """add the decoded records of a pipeline (see Pipeline)
+        
+        Args:
+            pipe (Pipe_input): connected input
+        """
+        self.pipe=pipe
+        self.add(pipe)
+
+    def remove(self,fd):
+        """remove source
+        
+        Args:
+            fd (int): source file descriptor
+        """
+        if fd in self.paused:
+            del self.paused[fd]
+        else:
+            self.poller.unregister(fd)
+        del self.srcs[fd]
+
+    def timeout(self,now):
+        """poll timeout: next resume of a paused source, next record of a
+        timed source, scheduler deadline, skip of a missing pipeline record
+        or stats publication
+        
+        Args:
+            now (float): time.time()
+        
+        Returns:
+            int: ms or None (no timeout)
+        """
+        deadlines=self.paused.values()
+        for src,src_id in self.timed:
+            t=src.next_time()
+            deadlines.append(now if t is None else t) # None: read to close
+        if self.sched:
+            deadlines.append(self.sched.next_deadline())
+        if self.pipe and self.pipe.gap_t is not None:
+            deadlines.append(self.pipe.gap_t+PIPE_REORDER_SEC)
+        deadlines.append(self.metrics.next_publish)
+        deadlines=[t for t in deadlines if t is not None]
+        if not deadlines:
+            return None
+        return max(0,int((min(deadlines)-now)*1000)+1)
+
+    def run_once(self,max_ms=None):
+        """wait for readable sources, receive, format and send
+        
+        Args:
+            max_ms (int, optional): max wait in ms (default no limit)
+        """
+        now=time.time()
+        for fd in [fd for fd in self.paused if self.paused[fd]<=now]:
+            del self.paused[fd]
+            self.poller.register(fd,zmq.POLLIN)
+        timeout=self.timeout(now)
+        if max_ms is not None and (timeout is None or timeout>max_ms):
+            timeout=max_ms
+        for fd,event in self.poller.poll(timeout):
+            src,src_id=self.srcs[fd]
+            if not self.read(src,src_id):
+                self.remove(fd)
+                continue
+            if self.rx_periode and src.rx_throttle:
+                self.poller.unregister(fd)
+                self.paused[fd]=time.time()+self.rx_periode
+        pipe=self.pipe
+        if pipe and pipe.gap_t is not None and pipe.fileno() in self.srcs and \
+                time.time()>=pipe.gap_t+PIPE_REORDER_SEC: # nothing else arrives
+            if not self.read_pipe(pipe):
+                self.remove(pipe.fileno())
+        if self.timed:
+            now=time.time()
+            for src,src_id in list(self.timed):
+                t=src.next_time()
+                if (t is None or t<=now) and not self.read(src,src_id):
+                    self.timed.remove((src,src_id))
+        if self.sched:
+            try:
+                self.sched.poll(time.time())
+            except zmq.error.Again:
+                self.metrics.count(0,METRIC_TX_TIMEOUT)
+                print '[warning] zmq destination is not available' 
+        metrics=self.metrics
+        if metrics.next_publish is not None and time.time()>=metrics.next_publish:
+            if self.logger:
+                metrics.gauges["log_dropped"]=self.logger.dropped
+                metrics.gauges["log_failed"]=int(self.logger.error is not None)
+            metrics.publish(time.time())
+
+    def read(self,src,src_id):
+        """receive, format and output one source
+        complete reads without data are counted as dropped (bad or
+        unsubscribed packets), malformed reads and format errors as decode
+        errors (the source is kept)
+        
+        Args:
+            src (Xplane|AID|NMEA_ublox|Log_replay): source
+            src_id (int): source id
+        
+        Returns:
+            bool: False if the source is closed (to remove)
+        """
+        if src is self.pipe:
+            return self.read_pipe(src)
+        metrics=self.metrics
+        t0=time.time()
+        try:
+            rec=src.recv()
+        except (socket.error,EOFError) as e:
+            print '[warning] source %i removed: %s' % (src_id,e)
+            return False
+        except (ValueError,IndexError):
+            metrics.count(src_id,METRIC_RX)
+            metrics.count(src_id,METRIC_DECODE_ERR)
+            return True
+        t1=time.time()
+        if src.stale:
+            metrics.count(src_id,METRIC_RX_STALE,src.stale)
+        if src.malformed:
+            metrics.count(src_id,METRIC_DECODE_ERR,src.malformed)
+        if self.forward:
+            if rec or src.complete:
+                self.forward.send(src_id,rec,t_start,t1-t0)
+            return True
+        metrics.record(STAGE_RECV,t1-t0)
+        if not rec:
+            if src.malformed:
+                metrics.count(src_id,METRIC_RX)
+            elif src.complete:
+                metrics.count(src_id,METRIC_RX_DROPPED)
+            return True
+        metrics.count(src_id,METRIC_RX)
+        store=self.store
+        if store is not None and not src.multi_src and not self.fusion:
+            try:
+                src.format_store(rec,store,t1)
+            except (ValueError,IndexError,KeyError,struct.error):
+                metrics.count(src_id,METRIC_DECODE_ERR)
+                store.discard()
+                return True
+            if self.derived:
+                self.derived.update_store(src_id,store)
+            metrics.record(STAGE_FORMAT,time.time()-t1)
+            self.output_store(src_id)
+            self.commit(t1)
+            return True
+        try:
+            formated=src.format_recv(rec)
+        except (ValueError,IndexError,KeyError,struct.error):
+            metrics.count(src_id,METRIC_DECODE_ERR)
+            return True
+        if not src.multi_src:
+            formated=[(src_id,formated)]
+        if self.derived:
+            self.derived.update_records(formated)
+        metrics.record(STAGE_FORMAT,time.time()-t1)
+        for rec_src_id,recv_data in formated:
+            if self.verbose:
+                pp(recv_data)
+                print
+            self.output(recv_data,rec_src_id)
+        return True
+
+    def read_pipe(self,pipe):
+        """output the decoded records of a pipeline in order (see Pipeline)
+        counters and recv/format latencies come from the records
+        
+        Args:
+            pipe (Pipe_input): input
+        
+        Returns:
+            bool: False when the pipeline is done (to remove)
+        """
+        global t_start
+        metrics=self.metrics
+        for src_id,kind,t_capture,recv_s,format_s,payload in pipe.recv():
+            metrics.record(STAGE_RECV,recv_s)
+            if kind==PIPE_DROPPED:
+                metrics.count(src_id,METRIC_RX_DROPPED)
+                continue
+            metrics.count(src_id,METRIC_RX)
+            if kind==PIPE_DECODE_ERR:
+                metrics.count(src_id,METRIC_DECODE_ERR)
+                continue
+            records=marshal.loads(payload)
+            if self.derived:
+                t0=time.time()
+                self.derived.update_records(records)
+                format_s+=time.time()-t0
+            metrics.record(STAGE_FORMAT,format_s)
+            t_start=t_capture
+            for rec_src_id,recv_data in records:
+                if self.verbose:
+                    pp(recv_data)
+                    print
+                self.output(recv_data,rec_src_id)
+        if pipe.done:
+            print '[info] pipeline done'
+            return False
+        return True
+
+    def output_store(self,src_id):
+        """send the current message of the store (see Var_store.commit)
+        
+        Args:
+            src_id (int): source id
+        """
+        store=self.store
+        if not store.touched:
+            return
+        if self.logger or self.fusion or self.sched or self.verbose:
+            recv_data=store.as_dict()
+            if self.verbose:
+                pp(recv_data)
+                print
+            self.output(recv_data,src_id,True)
+            return
+        try:
+            self.dest.send_dict(store,src_id)
+        except zmq.error.Again:
+            self.metrics.count(src_id,METRIC_TX_TIMEOUT)
+            print '[warning] zmq destination is not available' 
+
+    def commit(self,now):
+        """commit the current message of the store and write the shared state
+        
+        Args:
+            now (float): reception time
+        """
+        store=self.store
+        store.commit(now)
+        if self.shm:
+            self.shm.write(store.values,store.times,store.valid,now)
+
+    def output(self,recv_data,src_id,stored=False):
+        """send or schedule formated data
+        
+        Args:
+            recv_data (dict): {var_key:value}
+            src_id (int): source id
+            stored (bool, optional): recv_data is the current message of the
+                store (else the sent values are committed to the store)
+        """
+        if self.logger:
+            self.logger.log(src_id,recv_data)
+        if self.fusion:
+            recv_data=self.fusion.update(src_id,recv_data,time.time())
+            if not recv_data:
+                return
+        if self.store is not None and not stored:
+            self.store.write_dict(recv_data)
+            self.commit(time.time())
+        try:
+            if self.sched:
+                self.sched.update(recv_data)
+            else:
+                self.dest.send_dict(recv_data,src_id)
+        except zmq.error.Again:
+            self.metrics.count(src_id,METRIC_TX_TIMEOUT)
+            print '[warning] zmq destination is not available' 
+
+    def run(self):
+        """run until all sources are removed
+        """
+        while self.srcs or self.timed:
+            self.run_once()
+#<END of class Src_poller>
+
+class Pipeline(object):
+    """multi-process receive/decode/send (see main -j)
+        receiver process: sources are only read (recv), records are numbered
+            and timestamped then pushed to the decoders (see pipe_receive)
+        decoder processes: format_recv of the records (see pipe_decode)
+        this process: records are put back in order (Pipe_input) then
+            output by Src_poller (logger, fusion, scheduler, store, Zmq_pmt)
+    stages are connected by zmq ipc (PUSH/PULL, decoders are fed round
+    robin). Processes are forked: sources are built here and connected by
+    the receiver, format_recv must not keep state between records.
+    
+    Attributes:
+        input (Pipe_input): decoded records (see Src_poller.add_pipe)
+        procs (list): [multiprocessing.Process...] receiver then decoders
+        srcs (list): [(src,src_id)...] not connected sources
+    """
+    def __init__(self,srcs,workers=2,rx_ms=None):
+        """constructor
+        
+        Args:
+            srcs (list): [(src,src_id)...] not connected sources
+            workers (int, optional): decoder processes
+            rx_ms (int, optional): min reception periode in ms (see Src_poller)
+        """
+        self.srcs=srcs
+        self.workers=workers
+        self.rx_ms=rx_ms
+        self.procs=list()
+        self.input=None
+        prefix="ipc://%s/avionics_zmq-%i" % (PIPE_DIR,os.getpid())
+        self.raw_adr=prefix+"-raw"
+        self.fmt_adr=prefix+"-fmt"
+
+    def start(self):
+        """fork receiver and decoders, bind the input
+        """
+        self.procs=[multiprocessing.Process(target=pipe_receive,
+            args=(self.srcs,self.rx_ms,self.raw_adr))]
+        for i in range(self.workers):
+            self.procs.append(multiprocessing.Process(target=pipe_decode,
+                args=(self.srcs,self.raw_adr,self.fmt_adr)))
+        for proc in self.procs:
+            proc.daemon=True
+            proc.start()
+        self.input=Pipe_input(self.fmt_adr)
+        self.input.connect()
+        print "[info] pipeline started (%i decoders)" % self.workers
+
+    def stop(self):
+        """stop processes (the receiver disconnects the sources)
+        """
+        for proc in self.procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in self.procs:
+            proc.join(PIPE_JOIN_SEC)
+        self.input.disconnect()
+        for adr in (self.raw_adr,self.fmt_adr):
+            try:
+                os.unlink(adr[len("ipc://"):])
+            except OSError:
+                pass
+        print "[info] pipeline stopped (%i records lost)" % self.input.lost
+#<END of class Pipeline>
+
+class Pipe_output(object):
+    """numbered raw records to the decoders (receiver process, see Pipeline)
+    each message is a header frame (PIPE_HEADER_FMT) and a marshal payload
+    
+    Attributes:
+        seq (int): sequence number of the next record
+        sock (zmq.Socket): PUSH socket
+    """
+    def __init__(self,adr):
+        """constructor
+        
+        Args:
+            adr (str): zmq ipc address
+        """
+        self.adr=adr
+        self.sock=None
+        self.seq=0
+        self.header=struct.Struct(PIPE_HEADER_FMT)
+
+    def connect(self):
+        """bind the socket
+        """
+        self.sock=zmq.Context().socket(zmq.PUSH)
+        self.sock.bind(self.adr)
+
+    def disconnect(self):
+        """close the socket (pending records are sent)
+        """
+        self.sock.close()
+
+    def send(self,src_id,rec,t_capture,recv_s):
+        """push one raw record
+        
+        Args:
+            src_id (int): source id
+            rec (object): result of src.recv() (marshal compatible)
+            t_capture (float): capture time (time.time)
+            recv_s (float): recv duration (sec)
+        """
+        self.sock.send_multipart([self.header.pack(self.seq,src_id,PIPE_RAW,
+            t_capture,recv_s,0.0),marshal.dumps(rec)])
+        self.seq+=1
+
+    def end(self):
+        """last message (all sources are closed)
+        """
+        self.sock.send_multipart([self.header.pack(self.seq,0,PIPE_END,
+            time.time(),0.0,0.0),""])
+        self.seq+=1
+#<END of class Pipe_output>
+
+class Pipe_input(object):
+    """decoded records of the decoders in receiver order (see Pipeline)
+    records are kept until the previous sequence numbers arrived, a missing
+    record (decoder died) is skipped after PIPE_REORDER_SEC (Src_poller
+    reads again at gap_t+PIPE_REORDER_SEC if nothing else arrives)
+    
+    Attributes:
+        done (bool): end of the records was output
+        gap_t (float): time the next record was first missing or None
+        lost (int): skipped records
+        next_seq (int): sequence number to output next
+        pending (dict): {seq:record} records received out of order
+        sock (zmq.Socket): PULL socket (polled by Src_poller)
+    """
+    multi_src=True
+    rx_throttle=False
+    def __init__(self,adr):
+        """constructor
+        
+        Args:
+            adr (str): zmq ipc address
+        """
+        self.adr=adr
+        self.sock=None
+        self.header=struct.Struct(PIPE_HEADER_FMT)
+        self.pending=dict()
+        self.next_seq=0
+        self.gap_t=None
+        self.lost=0
+        self.done=False
+
+    def connect(self):
+        """bind the socket
+        """
+        self.sock=zmq.Context().socket(zmq.PULL)
+        self.sock.bind(self.adr)
+
+    def disconnect(self):
+        """close the socket
+        """
+        self.sock.close(0)
+
+    def fileno(self):
+        """zmq socket to poll (see Src_poller)
+        """
+        return self.sock
+
+    def recv(self):
+        """receive available records and return those in order
+        
+        Returns:
+            list: [(src_id,kind,capture time,recv sec,format sec,payload)...]
+        """
+        pending=self.pending
+        header=self.header
+        for i in range(PIPE_BATCH):
+            try:
+                hdr,payload=self.sock.recv_multipart(zmq.NOBLOCK)
+            except zmq.error.Again:
+                break
+            rec=header.unpack(hdr)
+            pending[rec[0]]=rec[1:]+(payload,)
+        result=list()
+        while pending and not self.done:
+            rec=pending.pop(self.next_seq,None)
+            if rec is None:
+                now=time.time()
+                if self.gap_t is None:
+                    self.gap_t=now
+                if now-self.gap_t<PIPE_REORDER_SEC:
+                    break
+                seq=min(pending)
+                print '[warning] pipeline records %i to %i lost' % (self.next_seq,seq-1)
+                self.lost+=seq-self.next_seq
+                self.next_seq=seq
+                continue
+            self.gap_t=None
+            self.next_seq+=1
+            if rec[1]==PIPE_END:
+                self.done=True
+            else:
+                result.append(rec)
+        return result
+#<END of class Pipe_input>
+
+class Zmq_pmt(object):
+    """class for managing zmq and pmt transfers
+    serialization, send and capture to sent latencies are recorded in
+    metrics (see Metrics). "bin" payloads are packed in the reused buffer of
+    their Wire_schema: frames are small (below the pyzmq copy_threshold)
+    so zmq copies them on send and the buffer is free again at once.
+    With header a multipart message is sent:
+        frame 0: header (see ZMQ_HEADER_FMT)
+            +----------+--------+--------+-------------------------+
+            | seq      | src_id | fmt_id | capture time (time.time)|
+            | uint32   | uint8  | uint8  | float64                 |
+            +----------+--------+--------+-------------------------+
+        frame 1: payload (pmt, bin data or bin schema see FMT_*)
+    With topic_dict (PUB mode) values are split by topic, each topic is
+    serialized once and published (fan-out and subscription filtering are
+    done by libzmq), a topic frame comes first. In "bin" each topic has its
+    own Wire_schema (schema messages are published on each topic) and
+    the header seq counts the messages of the topic.
+    """
+    def __init__(self, adr,fmt="pmt",schema=None,header=False,src_id=0,
+            topic_dict=None,delta=None):
+        """constructor
+        args
+        adr(tuple): adress of zmq (ip,port)
+            ip(string): xx.xx.xx.xx
+            port(int)
+        
+        Args:
+            adr (TYPE): Description
+            fmt (str, optional): output format "pmt" or "bin"
+            schema (Wire_schema, optional): layout for "bin" format
+            header (bool, optional): send header frame (multipart)
+            src_id (int, optional): source id in header (see src_id_dict)
+            topic_dict (dict, optional): {var_key:topic} PUB mode (see
+                data_collect.get_topic_dict) default PUSH
+            delta (Delta_filter, optional): only changed values and keyframes
+                are sent
+        """
+        self.adr = adr
+        self.zmq_sock=None
+        self.fmt=fmt
+        self.schema=schema
+        self.schema_t=0 # last schema message time
+        self.header=header
+        self.src_id=src_id
+        self.seq=0
+        self.hdr_packer=struct.Struct(ZMQ_HEADER_FMT)
+        self.topic_dict=topic_dict
+        self.delta=delta
+        self.topic_seq=dict() # {topic:seq}
+        self.topic_schemas=dict() # {topic:Wire_schema}
+        if topic_dict is not None and schema:
+            names=dict((var_key,var_name) for var_key,var_name in schema.vars)
+            for topic in set(topic_dict.values()):
+                self.topic_schemas[topic]=Wire_schema(dict((names[var_key],var_key) 
+                    for var_key in topic_dict if topic_dict[var_key]==topic))
+        self.metrics=Metrics()
+    def connect(self):
+        """create zmq sock
+        """
+        context = zmq.Context()
+        adr="tcp://"+self.adr[0]+":"+str(self.adr[1])
+        if self.topic_dict is not None:
+            self.zmq_sock = context.socket(zmq.PUB)
+        else:
+            self.zmq_sock = context.socket(zmq.PUSH)
+        self.zmq_sock.setsockopt(zmq.SNDTIMEO, 1000)
+        self.zmq_sock.bind(adr)
+        print "[info] zmq connected to "+ str(self.adr)
+    
+    def disconnect(self):
+        """Summary
+        """
+        self.zmq_sock.close()
+        print "[info] zmq disconnected from "+ str(self.adr)
+
+    def send_dict(self,dict_to_send,src_id=None,capture_t=None):
+        """send data dict through zmq
+        a Var_store is packed from its current message ("bin" without
+        intermediate dict). With delta nothing is sent when no value
+        changed (counted as METRIC_TX_UNCHANGED).
+        
+        args:
+            dict_to_send (dict|Var_store): values to send
+            src_id (int, optional): header source id (default self.src_id)
+            capture_t (float, optional): header capture time (default
+                t_start, see Resampler)
+        
+        Deleted Parameters:
+            dict_to_send(dict): {var_key:value}
+        """
+        global t_end
+        metrics=self.metrics
+        now=time.time()
+        if capture_t is None:
+            capture_t=t_start
+        if self.delta:
+            if isinstance(dict_to_send,Var_store):
+                dict_to_send=dict_to_send.as_dict()
+            dict_to_send=self.delta.filter(dict_to_send,now)
+            if not dict_to_send:
+                metrics.count(self.src_id if src_id is None else src_id,
+                    METRIC_TX_UNCHANGED)
+                return
+        if self.topic_dict is not None:
+            if isinstance(dict_to_send,Var_store):
+                dict_to_send=dict_to_send.as_dict()
+            msgs=self.pack_topics(dict_to_send,now)
+            t_end= time.time()
+            for topic,fmt_id,msg in msgs:
+                self.send_msg(fmt_id,msg,src_id,topic=topic,capture_t=capture_t)
+        elif self.fmt=="bin":
+            if now-self.schema_t>WIRE_SCHEMA_PERIOD:
+                self.send_msg(FMT_SCHEMA,self.schema.pack_schema(),
+                    capture_t=capture_t)
+                self.schema_t=now
+            if isinstance(dict_to_send,Var_store):
+                msg=self.schema.pack_store(dict_to_send)
+            else:
+                msg=self.schema.pack(dict_to_send)
+            t_end= time.time()
+            self.send_msg(FMT_BIN,msg,src_id,capture_t=capture_t)
+        else:
+            if isinstance(dict_to_send,Var_store):
+                dict_to_send=dict_to_send.as_dict()
+            pmt_dict=pmt.to_pmt(dict_to_send)
+            msg=pmt.serialize_str(pmt_dict)
+            t_end= time.time()
+            self.send_msg(FMT_PMT,msg,src_id,capture_t=capture_t)
+        t_sent=time.time()
+        metrics.record(STAGE_PACK,t_end-now)
+        metrics.record(STAGE_SEND,t_sent-t_end)
+        metrics.record(STAGE_TOTAL,t_sent-capture_t)
+        metrics.count(self.src_id if src_id is None else src_id,METRIC_TX)
+
+    def pack_topics(self,dict_to_send,now):
+        """split values by topic and serialize each topic once (PUB mode)
+        
+        Args:
+            dict_to_send (dict): {var_key:value}
+            now (float): time.time() (schema messages)
+        
+        Returns:
+            list: [(topic,fmt_id,payload)...]
+        """
+        topic_dict=self.topic_dict
+        split=dict() # {topic:{var_key:value}}
+        for var_key in dict_to_send:
+            topic=topic_dict[var_key]
+            values=split.get(topic)
+            if values is None:
+                values=split[topic]=dict()
+            values[var_key]=dict_to_send[var_key]
+        msgs=list()
+        if self.fmt=="bin":
+            if now-self.schema_t>WIRE_SCHEMA_PERIOD:
+                for topic,schema in sorted(self.topic_schemas.items()):
+                    msgs.append((topic,FMT_SCHEMA,schema.pack_schema()))
+                self.schema_t=now
+            for topic,values in split.items():
+                schema=self.topic_schemas[topic]
+                msgs.append((topic,FMT_BIN,schema.pack(values)))
+        else:
+            for topic,values in split.items():
+                msgs.append((topic,FMT_PMT,pmt.serialize_str(pmt.to_pmt(values))))
+        return msgs
+
+    def send_msg(self,fmt_id,payload,src_id=None,topic=None,capture_t=None):
+        """send payload (after topic and header frames if enabled), the
+        payload is copied by zmq (the buffer can be reused on return)
+        
+        Args:
+            fmt_id (int): FMT_PMT, FMT_BIN or FMT_SCHEMA
+            payload (buffer): message
+            src_id (int, optional): header source id (default self.src_id)
+            topic (str, optional): topic frame (PUB mode)
+            capture_t (float, optional): header capture time (default t_start)
+        """
+        if topic is not None:
+            self.zmq_sock.send(topic,zmq.SNDMORE)
+        if self.header:
+            if src_id is None:
+                src_id=self.src_id
+            if topic is None:
+                seq=self.seq
+                self.seq=(seq+1)&0xffffffff
+            else:
+                seq=self.topic_seq.get(topic,0)
+                self.topic_seq[topic]=(seq+1)&0xffffffff
+            self.zmq_sock.send(self.hdr_packer.pack(seq,src_id,fmt_id,
+                t_start if capture_t is None else capture_t),zmq.SNDMORE)
+        self.zmq_sock.send(payload)
+        
+def main():
+    """TODO: document this
+    """
+    #--------Define options--------------------
+    usage = """ %prog [options] src 
+                src == x ==> source is X-Plane
+                src == a ==> source is AID
+                src == u ==> source is Ublock
+                src == r ==> replay of log files (see --replay)
+                sources can be combined ex: xu (one event loop)"""
+    version = 0.1
+    parser = OptionParser(usage=usage,version=version)    
+    parser.add_option("-s", "--src",
+                  dest="src_adr",
+                  type="string",
+                  default="0.0.0.0:49000",
+                  help="source ip address ip:port default=10.10.201.254:49000")
+    parser.add_option("-a", "--aid",
+                  dest="aid_adr",
+                  type="string",
+                  help="AID ip address ip:port default=--src")
+    parser.add_option("-p", "--priority",
+                  dest="priority",
+                  type="string",
+                  help="source priority for combined sources ex: aux default=src")
+    parser.add_option("-o", "--stale_ms",
+                  dest="stale_ms",
+                  type="int",
+                  default=1000,
+                  help="combined sources: switch to next source when older (ms), resampling: variable no longer sent default=1000")
+    parser.add_option("-d", "--dest",
+                  dest="dest_adr",
+                  type="string",
+                  default="127.0.0.1:5556",
+                  help="destination ip address ip:port default=127.0.0.1:5556")
+    parser.add_option("-l", "--log",
+                  dest="log_file_prefix",
+                  type="string",
+                  help="log data into a file (see Flight_logger)")
+    parser.add_option("--log_mb",
+                  dest="log_mb",
+                  type="int",
+                  default=256,
+                  help="log file rotation size in MB default=256")
+    parser.add_option("--log_sec",
+                  dest="log_sec",
+                  type="int",
+                  default=3600,
+                  help="log file rotation time in sec default=3600")
+    parser.add_option("-c", "--catalog",
+                  dest="catalog",
+                  type="string",
+                  help="variable catalog file (json see data_collect.load_catalog)")
+    parser.add_option("-R", "--replay",
+                  dest="replay",
+                  type="string",
+                  help="log files to replay (glob) ex: \"flight_*.azl\"")
+    parser.add_option("--xp_drain",
+                  dest="xp_drain",
+                  type = "choice",
+                  choices=["latest","merge"],
+                  help="X-Plane: drain queued datagrams, keep the latest or merge data sets (stale ones are counted)")
+    parser.add_option("--rcvbuf",
+                  dest="rcvbuf",
+                  type="int",
+                  help="X-Plane: socket receive buffer SO_RCVBUF in bytes")
+    parser.add_option("--speed",
+                  dest="speed",
+                  type="float",
+                  default=1.0,
+                  help="replay speed factor, 0 as fast as possible default=1")
+    parser.add_option("-u", "--com",
+                  dest="com",
+                  type = "string",
+                  default="/dev/ttyACM0",
+                  help="u-Blox serial com.")
+    parser.add_option("-t", "--tx_ms",
+                  dest="tx_ms",
+                  type = "int",
+                  help="transmition min periode in ms (latest values are merged)")
+    parser.add_option("--resample_ms",
+                  dest="resample_ms",
+                  type = "int",
+                  help="send all variables every RESAMPLE_MS ms stamped with the sample time (header, see Resampler)")
+    parser.add_option("--resample_delay_ms",
+                  dest="resample_delay_ms",
+                  type = "int",
+                  default=0,
+                  help="resampling: sample time behind the clock, values are interpolated instead of extrapolated default=0")
+    parser.add_option("--extrap_ms",
+                  dest="extrap_ms",
+                  type = "int",
+                  default=RESAMPLE_EXTRAP_MS,
+                  help="resampling: max extrapolation after the last sample in ms default=%i" % RESAMPLE_EXTRAP_MS)
+    parser.add_option("-f", "--format",
+                  dest="fmt",
+                  type = "choice",
+                  choices=["pmt","bin"],
+                  default="pmt",
+                  help="output format pmt or bin (see Wire_schema) default=pmt")
+    parser.add_option("-m", "--header",
+                  dest="header",
+                  action="store_true",
+                  default=False,
+                  help="send a header frame before each message (see Zmq_pmt)")
+    parser.add_option("-b", "--pub",
+                  dest="pub",
+                  type = "choice",
+                  choices=["var","group"],
+                  help="publish (zmq PUB) with a topic per var or per group instead of PUSH")
+    parser.add_option("-k", "--keyframe",
+                  dest="keyframe",
+                  type="float",
+                  help="delta mode: send changed values only (catalog deadband) and all values every KEYFRAME sec")
+    parser.add_option("-r", "--rx_ms",
+                  dest="rx_ms",
+                  type = "int",
+                  help="reception min periode in ms (AID and u-Blox)")
+    parser.add_option("-w", "--stats",
+                  dest="stats_adr",
+                  type="string",
+                  help="publish stats on ip:port (zmq PUB see watch_avionics_zmq.py)")
+    parser.add_option("-j", "--workers",
+                  dest="workers",
+                  type="int",
+                  help="pipeline mode: receiver, WORKERS decoders and sender processes (see Pipeline)")
+    parser.add_option("-q", "--quiet",
+                  dest="quiet",
+                  action="store_true",
+                  default=False,
+                  help="do not print received data")
+    parser.add_option("-S", "--shm",
+                  dest="shm",
+                  type="string",
+                  help="write latest values in shared memory /dev/shm/SHM (see avionics_shm.py)")
+
+    #--------Parse options--------------------
+
+    (options, args) = parser.parse_args()
+    if (len(args) != 1) or not args[0] or \
+            (args[0].strip("xau")!="" and args[0]!="r") or \
+            (len(set(args[0]))!=len(args[0])):
+        parser.error("argument must be x, a, u or a combination of them, or r")
+    if args[0]=="r" and not options.replay:
+        parser.error("replay needs --replay")
+    if options.resample_ms and options.tx_ms:
+        parser.error("--resample_ms and --tx_ms can not be combined")
+    if options.resample_ms and not options.header:
+        print "[info] header enabled (resampling sample time)"
+        options.header=True
     print options
     print args
-    mode =args[0]
+    modes =args[0]
     src_ip,src_port = parse_adr(options.src_adr)
+    aid_ip,aid_port = parse_adr(options.aid_adr or options.src_adr)
     dest_ip,dest_port = parse_adr(options.dest_adr)
     file_prefix=options.log_file_prefix
     com_port=options.com
     #--------subscribe variables------------------
-    #TODO: AID
     #TODO: document data pos
     dc= data_collect()
+    try:
+        if options.catalog:
+            dc.load_catalog(options.catalog)
+        else:
+            add_default_vars(dc)
+    except (IOError,ValueError) as e:
+        parser.error(str(e))
+
+    #--------src setup--------------------
+    print "---------"   
+    srcs=list() # [(src,mode)...]
+    if 'x' in modes:
+        pp(dc.get_xplane_dict())
+        srcs.append((Xplane(dc.get_xplane_dict(),(src_ip,src_port),False,
+            options.xp_drain,options.rcvbuf),'x'))
+    if 'a' in modes:
+        pp(dc.get_aid_dict())
+        srcs.append((AID(dc.get_aid_dict(),(aid_ip,aid_port)),'a'))
+    if 'u' in modes:
+        pp(dc.get_ublox_dict())
+        srcs.append((NMEA_ublox(dc.get_ublox_dict(),com_port),'u'))
+    if 'r' in modes:
+        srcs.append((Log_replay(options.replay,options.speed),'r'))
+
+    for src,mode in srcs:
+        src.check()
+        if not options.workers:
+            src.connect()
+    pipeline=None
+    if options.workers:
+        pipeline=Pipeline([(src,src_id_dict[mode]) for src,mode in srcs],
+            options.workers,options.rx_ms)
+        pipeline.start()
+
+    #-------dest setup------------
+    topic_dict=None
+    if options.pub:
+        topic_dict=dc.get_topic_dict(options.pub)
+    delta=None
+    if options.keyframe:
+        delta=Delta_filter(dc.vdict.keys(),options.keyframe,dc.deadband_dict)
+    dest=Zmq_pmt((dest_ip,dest_port),options.fmt,Wire_schema(dc.key_dict),
+        options.header,src_id_dict.get(modes,0),topic_dict,delta)
+    dest.connect();
+    sched=None
+    if options.tx_ms:
+        sched=Tx_scheduler(dest,options.tx_ms,dc.tx_dict)
+    if options.resample_ms:
+        sched=Resampler(dest,options.resample_ms,options.resample_delay_ms,
+            options.extrap_ms,options.stale_ms,dc.resample_dict)
+    fusion=None
+    fused=modes.replace('r',"xau") # replay: recorded sources
+    if len(fused)>1:
+        priority=list()
+        for m in (options.priority or "")+fused:
+            if m in fused and m not in priority:
+                priority.append(m)
+        fusion=Var_fusion(dc.vdict.keys(),[src_id_dict[m] for m in priority],
+            options.stale_ms,dc.priority_dict)
+    store=Var_store(dc.vdict.keys())
+    loop=Src_poller(dest,sched,options.rx_ms,fusion,store)
+    loop.verbose=not options.quiet
+    if dc.derived_dict:
+        loop.derived=Derived_engine(dc.derived_dict)
+        loop.derived.bind_store(store)
+    if options.shm:
+        shm=Shm_state(options.shm,store.keys,dest.schema.hash)
+        shm.connect()
+        loop.shm=shm
+    if options.stats_adr:
+        dest.metrics.connect(parse_adr(options.stats_adr))
+    if pipeline:
+        loop.add_pipe(pipeline.input)
+    else:
+        for src,mode in srcs:
+            loop.add(src,src_id_dict[mode])
+    #-------logging---------------
+    if file_prefix:
+        logger=Flight_logger(file_prefix,options.log_mb,options.log_sec)
+        logger.start()
+        loop.logger=logger
+
+
+    #-------------------------------
+    #--------run--------------------
+    try :
+        loop.run()
+
+    except KeyboardInterrupt :
+        print "\n[info] Gracefully killed"
+    if pipeline:
+        pipeline.stop()
+    else:
+        for src,mode in srcs:
+            src.disconnect()
+    dest.disconnect()
+    dest.metrics.disconnect()
+    if options.shm:
+        shm.disconnect()
+    if file_prefix:
+        logger.stop()
+        print "[info] log closed (%i records dropped)" % logger.dropped
+
+    # <END of main>
+#------------------------------
+# Globals
+#------------------------------- 
+def add_default_vars(dc):
+    """default variables (used without --catalog), validated as a catalog
+    
+    Args:
+        dc (data_collect): variables
     
+    Raises:
+        ValueError: invalid default variable (every error is listed)
+    """
     dc.add_var("UTC_SEC",0)
     dc.set_xplane_var("UTC_SEC",xplane_set_dict["TIMES"],5,scale_to_int,[3600])
     dc.set_aid_var("UTC_SEC",aid_set_dict['GNSS'],150,bcd_decode,[[1,5,6,6],[0,3600,60,1]])
     #dc.set_aid_var("UTC_SEC",aid_set_dict['GNSS'],150,bcd_decode,[[1,5,6,6],[0,10000,100,1]]) # test
-    dc.set_ublox_var("UTC_SEC","GGA",0,parse_GGA)
+    dc.set_ublox_var("UTC_SEC","GGA",0)
     
     dc.add_var("GPS_LAT",10)
     dc.set_xplane_var("GPS_LAT",xplane_set_dict["GPS"],0)
     dc.set_aid_var("GPS_LAT",aid_set_dict['GNSS'],110,bnr_decode,[20,180,0.000172]) #BUG: precesion 
-    dc.set_ublox_var("GPS_LAT","GGA",1,parse_GGA)
+    dc.set_ublox_var("GPS_LAT","GGA",1)
     
     dc.add_var("GPS_LON",11)
     dc.set_xplane_var("GPS_LON",xplane_set_dict["GPS"],1) 
     dc.set_aid_var("GPS_LON",aid_set_dict['GNSS'],111,bnr_decode,[20,180,0.000172]) #BUG: precesion 
-    dc.set_ublox_var("GPS_LON","GGA",2,parse_GGA)
+    dc.set_ublox_var("GPS_LON","GGA",2)
 
     dc.add_var("BARO_ALT",21) 
     dc.set_xplane_var("BARO_ALT",xplane_set_dict["GPS"],2) #MSL alt
     dc.set_aid_var("BARO_ALT",aid_set_dict['ADC1'],203,bnr_decode,[17,131072,1]) 
-    dc.set_ublox_var("BARO_ALT","GGA",3,parse_GGA)
+    dc.set_ublox_var("BARO_ALT","GGA",3)
     
     dc.add_var("GPS_ALT",22) 
     #picked indicated alt as gps alt to manualy add error
@@ -605,25 +3552,17 @@ def main():
 
 
     dc.add_var("NS_SPEED",34) 
-    #dc.set_xplane_var("NS_SPEED",xplane_set_dict["CUSTOM"],0,calc_ns_speed,[
-        #(xplane_set_dict["HEADING"],3),
-        #(xplane_set_dict["SPEED"],3)])
     dc.set_aid_var("NS_SPEED",aid_set_dict['GNSS'],166,bnr_decode,[15,4096,0.125])
-    dc.set_ublox_var("NS_SPEED","VTG",3,parse_VTG)
-    #add custom for ublcs
+    dc.set_ublox_var("NS_SPEED","VTG",3)
 
     dc.add_var("EW_SPEED",35) 
-    #dc.set_xplane_var("EW_SPEED",xplane_set_dict["CUSTOM"],1,calc_ew_speed,[
-        #(xplane_set_dict["HEADING"],3),
-        #(xplane_set_dict["SPEED"],3)])
     dc.set_aid_var("EW_SPEED",aid_set_dict['GNSS'],174,bnr_decode,[15,4096,0.125])
-    dc.set_ublox_var("EW_SPEED","VTG",2,parse_VTG)
-    #add custom for ublcs
+    dc.set_ublox_var("EW_SPEED","VTG",2)
 
     dc.add_var("GROUND_KTS",32) 
     dc.set_xplane_var("GROUND_KTS",xplane_set_dict["SPEED"],3)
     dc.set_aid_var("GROUND_KTS",aid_set_dict['GNSS'],112,bnr_decode,[15,4096,0.125])
-    dc.set_ublox_var("GROUND_KTS","VTG",1,parse_VTG)
+    dc.set_ublox_var("GROUND_KTS","VTG",1)
 
     dc.add_var("VS_FPM",33) 
     dc.set_xplane_var("VS_FPM",xplane_set_dict["MACH_GLOAD"],2)
@@ -640,72 +3579,451 @@ def main():
     dc.add_var("MAG_HDG",41) 
     dc.set_xplane_var("MAG_HDG",xplane_set_dict["HEADING"],3)
     dc.set_aid_var("MAG_HDG",aid_set_dict['IRS'],320,bnr_decode,[12,180,0.05]) # Note: verify precision
-    dc.set_ublox_var("GROUND_KTS","VTG",0,parse_VTG)
 
+    #derived variables (see Derived_engine) X-Plane does not give NS/EW speeds
+    dc.set_derived("NS_SPEED",derive_ns_speed,["MAG_HDG","GROUND_KTS"])
+    dc.set_derived("EW_SPEED",derive_ew_speed,["MAG_HDG","GROUND_KTS"])
 
-    #--------src setup--------------------
-    print "---------"   
-    dest=Zmq_pmt((dest_ip,dest_port))
-    if mode =='x':
-        pp(dc.get_xplane_dict())
-        src=Xplane(dc.get_xplane_dict(),(src_ip,src_port),False)
-    if mode == 'a':
-        raise('AA: not implemented')
-    if mode == 'u':
-        pp(dc.get_ublox_dict())
-        src=NMEA_ublox(dc.get_ublox_dict(),com_port)
+    #resampling modes (used with --resample_ms) default linear
+    dc.set_resample("UTC_SEC","hold")
+    dc.set_resample("GPS_LON","angle180")
+    dc.set_resample("ROLL","angle180")
+    dc.set_resample("MAG_HDG","angle")
 
-    src.check()
-    src.connect()
+    #rate groups (used with -t) ex: attitude at 50 Hz, position at 5 Hz
+    #dc.set_tx_ms("PITCH",20)
+    #dc.set_tx_ms("ROLL",20)
+    #dc.set_tx_ms("GPS_LAT",200)
+    #dc.set_tx_ms("GPS_LON",200)
 
-    #-------dest setup------------
-    dest=Zmq_pmt((dest_ip,dest_port))
-    dest.connect();
-    #-------logging---------------
-    if file_prefix:
-        thread = Thread(target = task_log, args = (file_prefix,))
-        thread.setDaemon(True)
-        thread.start()
+    errors=dc.validate()
+    if errors:
+        raise ValueError("default variables:\n    "+"\n    ".join(errors))
+
+def pipe_receive(srcs,rx_ms,adr):
+    """receiver process of a Pipeline: connect and read the sources, raw
+    records are forwarded to the decoders (SIGTERM stops)
+    
+    Args:
+        srcs (list): [(src,src_id)...] not connected sources
+        rx_ms (int): min reception periode in ms or None
+        adr (str): zmq ipc address of the decoders
+    """
+    signal.signal(signal.SIGINT,signal.SIG_IGN) # stopped by Pipeline.stop
+    signal.signal(signal.SIGTERM,pipe_stop)
+    out=Pipe_output(adr)
+    out.connect()
+    loop=Src_poller(None,rx_ms=rx_ms)
+    loop.forward=out
+    connected=list()
+    try:
+        for src,src_id in srcs:
+            src.connect()
+            connected.append(src)
+            loop.add(src,src_id)
+        loop.run()
+        out.end()
+    except KeyboardInterrupt:
+        pass
+    for src in connected:
+        src.disconnect()
+    out.disconnect()
+
+def pipe_decode(srcs,adr_in,adr_out):
+    """decoder process of a Pipeline: format_recv of raw records, every
+    record is answered (data, dropped or decode error) to keep the order
+    
+    Args:
+        srcs (list): [(src,src_id)...] sources (format_recv only)
+        adr_in (str): zmq ipc address of the receiver
+        adr_out (str): zmq ipc address of the sender
+    """
+    signal.signal(signal.SIGINT,signal.SIG_IGN) # stopped by Pipeline.stop
+    src_of=dict((src_id,src) for src,src_id in srcs)
+    context=zmq.Context()
+    sock_in=context.socket(zmq.PULL)
+    sock_in.connect(adr_in)
+    sock_out=context.socket(zmq.PUSH)
+    sock_out.connect(adr_out)
+    header=struct.Struct(PIPE_HEADER_FMT)
+    while True:
+        hdr,payload=sock_in.recv_multipart()
+        seq,src_id,kind,t_capture,recv_s,format_s=header.unpack(hdr)
+        if kind==PIPE_RAW:
+            t0=time.time()
+            rec=marshal.loads(payload)
+            src=src_of[src_id]
+            kind=PIPE_DROPPED
+            payload=""
+            if rec:
+                try:
+                    formated=src.format_recv(rec)
+                    if not src.multi_src:
+                        formated=[(src_id,formated)]
+                    payload=marshal.dumps(formated)
+                    kind=PIPE_DATA
+                except (ValueError,IndexError,KeyError,struct.error):
+                    kind=PIPE_DECODE_ERR
+            format_s=time.time()-t0
+        sock_out.send_multipart([header.pack(seq,src_id,kind,t_capture,recv_s,
+            format_s),payload])
+
+def pipe_stop(signum,frame):
+    """SIGTERM handler of the receiver process (see pipe_receive)
+    
+    Raises:
+        KeyboardInterrupt: always
+    """
+    raise KeyboardInterrupt
+
+def monotonic():
+    """CLOCK_MONOTONIC in seconds (time.time if not available)
+    
+    Returns:
+        float: seconds
+    """
+    if clock_gettime is None:
+        return time.time()
+    clock_gettime(CLOCK_MONOTONIC,ctypes.byref(monotonic_ts))
+    return monotonic_ts.tv_sec+monotonic_ts.tv_nsec*1e-9
+
+class Timespec(ctypes.Structure):
+    """struct timespec (see monotonic)"""
+    _fields_=[('tv_sec',ctypes.c_long),('tv_nsec',ctypes.c_long)]
+
+CLOCK_MONOTONIC=1
+monotonic_ts=Timespec()
+try:
+    clock_gettime=ctypes.CDLL('librt.so.1').clock_gettime
+except OSError:
+    clock_gettime=None
+
+def parse_adr(adr_str):
+    """parse adr string to ("ip",port)
+    return (string,int) (ip,port)
+    
+    Args:
+        adr_str (TYPE): Description
+    
+    Returns:
+        TYPE: Description
+    """
+    adr_str=adr_str.split(":")
+    ip=adr_str[0]
+    port=int(adr_str[1])
+    return (ip,port) 
+def catalog_func(name):
+    """function of this module named in a catalog (see load_catalog)
+    
+    Args:
+        name (str): function name
+    
+    Returns:
+        callable: function
+    
+    Raises:
+        ValueError: unknown function
+    """
+    func=globals().get(str(name))
+    if not callable(func) or isinstance(func,type):
+        raise ValueError("unknown function %s" % name)
+    return func
+
+def metric_bucket_us(idx):
+    """lower bound of a histogram bucket (see Metrics.record)
+    
+    Args:
+        idx (int): bucket index
+    
+    Returns:
+        int: latency in us
+    """
+    half=1<<(METRIC_SUB_BITS-1)
+    if idx<2*half:
+        return idx
+    m=idx//half-1
+    return (idx-m*half)<<m
+
+def xplane_record_fmt(positions):
+    """struct format unpacking only positions of a DATA record
+    
+    Args:
+        positions ([int]): sorted data positions (0-7)
+    
+    Returns:
+        string: format ex: [0,3] ==> '<4xf8xf' (index is skipped)
+    """
+    fmt='<4x'
+    cursor=0
+    for pos in positions:
+        if pos>cursor:
+            fmt+='%ix' % (4*(pos-cursor))
+        fmt+='f'
+        cursor=pos+1
+    return fmt
+def bind_converter(func,arg_list=None):
+    """pre-bind conversion arguments: func(value,*arg_list) ==> conv(value)
+    arguments of python functions are bound by name with functools.partial
+    (the count is checked), other callables (builtins, functools.partial,
+    callable objects) have no inspectable signature and are called through
+    apply_converter
+    
+    Args:
+        func (callable): conversion function func(value,arg1,arg2..)
+        arg_list (list, optional): argument list for funtion
+    
+    Returns:
+        callable: conv(value) or None if func is not callable (identity)
+    
+    Raises:
+        ValueError: more arguments than func accepts
+    """
+    if not callable(func):
+        return None
+    if not arg_list:
+        return func
+    if not inspect.isfunction(func):
+        return functools.partial(apply_converter,func=func,args=tuple(arg_list))
+    spec=inspect.getargspec(func)
+    if spec.varargs:
+        return functools.partial(apply_converter,func=func,args=tuple(arg_list))
+    names=spec.args[1:]
+    if len(arg_list)>len(names):
+        raise ValueError("%s takes %i arguments (%i given)" % 
+            (func.__name__,len(names),len(arg_list)))
+    return functools.partial(func,**dict(zip(names,arg_list)))
 
+def apply_converter(value,func,args):
+    """call a converter with positional arguments (see bind_converter)
+    
+    Args:
+        value (float|int): value to convert
+        func (callable): conversion function func(value,arg1,arg2..)
+        args (tuple): argument list for funtion
+    
+    Returns:
+        float: converted value
+    """
+    return func(value,*args)
 
-    #-------------------------------
-    #--------run--------------------
-    try :
-        while True:
-            rec=src.recv()
-            if rec:
-                recv_data=src.format_recv(rec)
-                pp(recv_data)
-                print
-                try:
-                    dest.send_dict(recv_data)
-                except zmq.error.Again:
-                    print '[warning] zmq destination is not available' 
+def compile_dispatch(subs_dict):
+    """compile subscriptions to flat dispatch tables (done once)
+    identity entries (no func) do not get a converter
+    
+    Args:
+        subs_dict (dict): {group:{pos:(var_key,func,arg_list)}}
+            group/pos are xplane data_set/data_pos or AID channel/label
+    
+    Returns:
+        dict: {group:(copy_list,conv_list)}
+            copy_list [(pos,var_key)...]: value is sent as is
+            conv_list [(pos,var_key,conv)...]: conv(value) is sent
+    """
+    result=dict()
+    for group in subs_dict:
+        copy_list=list()
+        conv_list=list()
+        for pos in sorted(subs_dict[group]):
+            var_key,func,arg_list=subs_dict[group][pos]
+            conv=bind_converter(func,arg_list)
+            if conv is None:
+                copy_list.append((pos,var_key))
+            else:
+                conv_list.append((pos,var_key,conv))
+        result[group]=(copy_list,conv_list)
+    return result
 
-    except KeyboardInterrupt :
-        print "\n[info] Gracefully killed"
-        src.disconnect()
-        dest.disconnect()
+def compile_nmea_dispatch(subs_dict):
+    """compile ublox subscriptions to field converters (done once)
+    only subscribed positions are converted (see nmea_field_dict)
+    
+    Args:
+        subs_dict (dict): {nmea_sen:{pos:(var_key,None,None)}}
+    
+    Returns:
+        dict: {nmea_sen:[(var_key,func,args)...]} value is func(fields,*args)
+    
+    Raises:
+        ValueError: unknown sentence or position
+    """
+    result=dict()
+    for nmea_sen in subs_dict:
+        field_dict=nmea_field_dict.get(nmea_sen)
+        if field_dict is None:
+            raise ValueError("no field table for NMEA sentence %s" % nmea_sen)
+        entries=list()
+        for pos in sorted(subs_dict[nmea_sen]):
+            if pos not in field_dict:
+                raise ValueError("no position %i in NMEA sentence %s" % (pos,nmea_sen))
+            func,args=field_dict[pos]
+            entries.append((subs_dict[nmea_sen][pos][0],func,args))
+        result[nmea_sen]=entries
+    return result
+def line_framer(sock,buf_size=2048):
+    """incremental line framer over a stream socket
+    reads with recv_into in a reused buffer, the partial line at the end of
+    a read is moved to the start of the buffer and completed by the next one
+    
+    Args:
+        sock (socket): connected stream socket
+        buf_size (int, optional): initial buffer size (grows for long lines)
+    
+    Yields:
+        [str]: complete lines (without '\n') of each read
+    """
+    buf=bytearray(buf_size)
+    view=memoryview(buf)
+    fill=0 # bytes of partial line
+    while True:
+        if fill==len(buf): # line longer than buffer
+            buf=buf+bytearray(len(buf))
+            view=memoryview(buf)
+        nbytes=sock.recv_into(view[fill:])
+        if nbytes==0:
+            return
+        end=fill+nbytes
+        start=0
+        lines=list()
+        nl=buf.find('\n',fill,end)
+        while nl>=0:
+            lines.append(str(buf[start:nl]))
+            start=nl+1
+            nl=buf.find('\n',start,end)
+        fill=end-start
+        if start and fill:
+            buf[:fill]=buf[start:end]
+        yield lines
+def nmea_framer(ser,subs,max_len=None):
+    """incremental NMEA framer over a serial port
+    reads all waiting bytes at once (at least 1, read timeout applies), splits
+    complete "$...*hh" sentences and keeps the partial one for the next read.
+    Sentences are routed by id (GGA,VTG,.. or PUBX,00) with a dict lookup,
+    the XOR checksum is only verified for subscribed ones
+    
+    Args:
+        ser (serial.Serial): open port
+        subs (dict): {nmea_sen:...} subscribed sentences
+        max_len (int, optional): partial data without '\n' above this
+            is dropped (default NMEA_MAX_LEN)
+    
+    Yields:
+        [(nmea_sen,sentence)...]: checked sentences of each read, None if
+            the read did not complete a line
+    """
+    max_len=max_len or NMEA_MAX_LEN
+    buf=bytearray()
+    while True:
+        buf+=ser.read(ser.in_waiting or 1)
+        end=buf.rfind('\n')
+        if end<0:
+            if len(buf)>max_len:
+                del buf[:]
+            yield None
+            continue
+        lines=str(buf[:end]).split('\n')
+        del buf[:end+1]
+        result=list()
+        for line in lines:
+            start=line.rfind('$')
+            star=line.find('*',start)
+            if start<0 or star<0:
+                continue
+            body=line[start+1:star]
+            addr=body[:body.find(',')]
+            if addr=='PUBX':
+                nmea_sen=body[:7] # PUBX,00
+            else:
+                nmea_sen=addr[2:] # remove talker
+            if nmea_sen in subs:
+                if line[star+1:star+3].upper()=='%02X' % nmea_checksum(body):
+                    result.append((nmea_sen,line[start:star+3]))
+        yield result
 
-    # <END of main>
-#------------------------------
-# Globals
-#------------------------------- 
-def parse_adr(adr_str):
-    """parse adr string to ("ip",port)
-    return (string,int) (ip,port)
+def nmea_checksum(body):
+    """NMEA checksum
     
     Args:
-        adr_str (TYPE): Description
+        body (str): sentence between '$' and '*'
     
     Returns:
-        TYPE: Description
+        int: XOR of all characters
     """
-    adr_str=adr_str.split(":")
-    ip=adr_str[0]
-    port=int(adr_str[1])
-    return (ip,port) 
+    return functools.reduce(operator.xor,bytearray(body),0)
 #--------LUT--------------------
+#Xplane DATA packet: "DATA"+1 byte then 36 bytes records (int index + 8 floats)
+XPLANE_HEADER="DATA"
+XPLANE_HEADER_LEN=5
+XPLANE_RECORD_LEN=36
+XPLANE_BUF_SIZE=2048
+#binary wire format (see Wire_schema)
+WIRE_MAGIC="AZ"
+WIRE_VERSION=1
+WIRE_HEADER_FMT="<2sBBI" # magic,version,kind,schema hash
+WIRE_DATA=0
+WIRE_SCHEMA=1
+WIRE_SCHEMA_PERIOD=1.0 # schema message is repeated (sec)
+#zmq header frame (see Zmq_pmt)
+ZMQ_HEADER_FMT="<IBBd" # seq,src_id,fmt_id,capture time
+FMT_PMT=0
+FMT_BIN=1
+FMT_SCHEMA=2
+#PUB topics (see data_collect.get_topic_dict)
+PUB_VAR_TOPIC="v%05i" # var_key
+PUB_GROUP_TOPIC="g%s." # group name
+#flight log (see Flight_logger)
+LOG_MAGIC="AZLOG"
+LOG_VERSION=1
+LOG_HEADER_FMT="<5sBdd" # magic,version,start time,start monotonic
+LOG_RECORD_FMT="<IBd" # payload length,src_id,monotonic time
+LOG_VALUE_FMT="<id" # var_key,value
+LOG_ENTRY_FMT="<dq" # monotonic time,record offset
+LOG_TRAILER_MAGIC="AZIX"
+LOG_TRAILER_FMT="<4sq" # magic,last index block offset
+LOG_INDEX=255 # src_id of index blocks
+LOG_INDEX_LEN=64 # entries per index block
+LOG_BATCH=512 # max records per write
+LOG_BUF_SIZE=1<<20
+LOG_QUEUE_SIZE=100000
+#pipeline mode (see Pipeline)
+PIPE_DIR="/tmp" # ipc sockets
+PIPE_HEADER_FMT="<QBBddd" # seq,src_id,kind,capture time,recv sec,format sec
+PIPE_RAW=0
+PIPE_DATA=1
+PIPE_DROPPED=2
+PIPE_DECODE_ERR=3
+PIPE_END=4
+PIPE_BATCH=256 # max records per Pipe_input.recv
+PIPE_REORDER_SEC=0.1 # a missing record is skipped after
+PIPE_JOIN_SEC=2.0
+DERIVED_BATCH_MIN=8 # smaller batches are derived message by message
+RESAMPLE_MODES=("linear","hold","angle","angle180") # see data_collect.set_resample
+RESAMPLE_EXTRAP_MS=100 # max extrapolation (see Resampler)
+CATALOG_VERSION=1
+CATALOG_CACHE_VERSION=6 # layout of data_collect.state
+CATALOG_CACHE_EXT=".cache" # see data_collect.load_catalog
+METRIC_SUB_BITS=5 # exact buckets below 2**5 us then 4 bits per power of 2
+METRIC_MAX_BITS=27 # last bucket from ~67 sec
+METRIC_BUCKETS=(METRIC_MAX_BITS-METRIC_SUB_BITS+2)<<(METRIC_SUB_BITS-1)
+METRIC_SRC_MAX=8 # counters of src_id 0 to 7
+METRIC_PERIOD=1.0 # stats publication (sec)
+METRIC_TOPIC="stats"
+METRIC_PERCENTILES=(0.5,0.99,0.999)
+METRIC_RX=0 # reads with data
+METRIC_RX_DROPPED=1 # complete reads without subscribed data
+METRIC_DECODE_ERR=2
+METRIC_TX=3
+METRIC_TX_TIMEOUT=4 # zmq.error.Again
+METRIC_TX_UNCHANGED=5 # not sent by Delta_filter
+METRIC_RX_STALE=6 # datagrams dropped by Xplane drain
+METRIC_TX_MISSED=7 # ticks skipped by Resampler
+METRIC_NCOUNTERS=8
+STAGE_RECV=0
+STAGE_FORMAT=1
+STAGE_PACK=2 # serialization
+STAGE_SEND=3
+STAGE_TOTAL=4 # capture to sent
+REPLAY_BATCH=256 # max replayed records per recv
+NMEA_MAX_LEN=1024 # longer garbage without '\n' is dropped
 #Xplane data set lists
 xplane_set_dict={
     'TIMES'                 :1,
@@ -747,6 +4065,29 @@ xplane_set_dict={
 xplane_custom_pos={
     'EW_SPEED'      :0,
     'NS_SPEED'      :1}
+#ARINC 429 word status
+A429_NORMAL=0 # valid data
+A429_NCD=1 # no computed data
+A429_FT=2 # functional test
+A429_FW=3 # failure warning
+A429_PARITY=4 # parity error
+A429_BATCH_MIN=8 # words of a label per read decoded with numpy (see AID.format_recv)
+#SSM (bits 31|30) to status
+bnr_ssm_lut=(A429_FW,A429_NCD,A429_FT,A429_NORMAL)
+bcd_ssm_lut=(A429_NORMAL,A429_NCD,A429_FT,A429_NORMAL) # 00 plus 11 minus
+bcd_ssm_arr=np.array(bcd_ssm_lut,dtype=np.uint8)
+bnr_ssm_arr=np.array(bnr_ssm_lut,dtype=np.uint8)
+bcd_table_dict=dict() # {(label,len_list,scale_list):table} see bcd_compile
+#metrics names (see Metrics)
+metric_counter_names=("rx","rx_dropped","decode_err","tx","tx_timeout",
+    "tx_unchanged","rx_stale","tx_missed")
+metric_stage_names=("recv","format","pack","send","total")
+#source ids (header frame)
+src_id_dict={
+    'x'     :1,
+    'a'     :2,
+    'u'     :3,
+    'r'     :0}# replay: recorded src_id of each record
 #AID chanels list
 aid_set_dict={
     'FMS1'  :0,
@@ -799,8 +4140,9 @@ def calc_ew_speed(xplane_dict,mag_hdg_adr,gnd_speed_adr):
         return (float) east west speed (kts)
     
     Deleted Parameters:
-        xplane_dict(dict): xplane reception list {data_set:data_list}
+        xplane_dict(dict): xplane reception list {data_set:slot_values}
         mag_hdg_adr(tupple): placement of heading (0-2pi) in dict (data_set,data_pos)
+            (remapped to (data_set,slot) by Xplane.compile_plan)
         gnd_speed_adr(tupple): placement of ground speed  
             in dict (data_set,data_pos)
     
@@ -824,8 +4166,9 @@ def calc_ns_speed(xplane_dict,mag_hdg_adr,gnd_speed_adr):
         return (float) north-south speed(kts)
     
     Deleted Parameters:
-        xplane_dict(dict): xplane reception list {data_set:data_list}
+        xplane_dict(dict): xplane reception list {data_set:slot_values}
         mag_hdg_adr(tupple): placement of heading (0-2pi) in dict (data_set,data_pos)
+            (remapped to (data_set,slot) by Xplane.compile_plan)
         gnd_speed_adr(tupple): placement of ground speed  
             in dict (data_set,data_pos)
     
@@ -839,6 +4182,159 @@ def calc_ns_speed(xplane_dict,mag_hdg_adr,gnd_speed_adr):
 
     return ns_speed
 
+def derived_order(derived_dict):
+    """dependency order of derived variables (inputs first)
+    
+    Args:
+        derived_dict (dict): {var_key:(func,input var_keys,args)}
+    
+    Returns:
+        list: derived var_keys
+    
+    Raises:
+        ValueError: circular dependency
+    """
+    order=list()
+    done=set()
+    def visit(var_key,path):
+        if var_key in done or var_key not in derived_dict:
+            return
+        if var_key in path:
+            raise ValueError("derived variables depend on each other: %s" % 
+                " -> ".join(str(k) for k in path[path.index(var_key):]+[var_key]))
+        for input_key in derived_dict[var_key][1]:
+            visit(input_key,path+[var_key])
+        done.add(var_key)
+        order.append(var_key)
+    for var_key in sorted(derived_dict):
+        visit(var_key,[])
+    return order
+
+def derived_changed(vals):
+    """rows that changed from the previous row (NaN to NaN is unchanged)
+    
+    Args:
+        vals (np.ndarray): values by row (see Derived_engine.update_batch)
+    
+    Returns:
+        np.ndarray: bool, one row less than vals
+    """
+    prev=vals[:-1]
+    cur=vals[1:]
+    return (cur!=prev)&~(np.isnan(cur)&np.isnan(prev))
+
+def derive_ns_speed(track,speed):
+    """north-south speed (see Derived_engine, scalars or arrays)
+    
+    Args:
+        track (float): track or heading (deg)
+        speed (float): ground speed (kts)
+    
+    Returns:
+        float: cos(track)*speed (kts) north positive
+    """
+    return np.cos(np.radians(track))*speed
+
+def derive_ew_speed(track,speed):
+    """east-west speed (see Derived_engine, scalars or arrays)
+    
+    Args:
+        track (float): track or heading (deg)
+        speed (float): ground speed (kts)
+    
+    Returns:
+        float: sin(track)*speed (kts) east positive
+    """
+    return np.sin(np.radians(track))*speed
+
+def derive_wind_speed(tas,heading,gnd_speed,track):
+    """wind speed from air and ground velocities (see Derived_engine)
+    
+    Args:
+        tas (float): true air speed (kts)
+        heading (float): true heading (deg)
+        gnd_speed (float): ground speed (kts)
+        track (float): true track (deg)
+    
+    Returns:
+        float: wind speed (kts)
+    """
+    hdg=np.radians(heading)
+    trk=np.radians(track)
+    return np.hypot(gnd_speed*np.sin(trk)-tas*np.sin(hdg),
+        gnd_speed*np.cos(trk)-tas*np.cos(hdg))
+
+def derive_wind_dir(tas,heading,gnd_speed,track):
+    """direction the wind comes from (see derive_wind_speed)
+    
+    Args:
+        tas (float): true air speed (kts)
+        heading (float): true heading (deg)
+        gnd_speed (float): ground speed (kts)
+        track (float): true track (deg)
+    
+    Returns:
+        float: wind direction (deg 0-360)
+    """
+    hdg=np.radians(heading)
+    trk=np.radians(track)
+    wind_ew=gnd_speed*np.sin(trk)-tas*np.sin(hdg)
+    wind_ns=gnd_speed*np.cos(trk)-tas*np.cos(hdg)
+    return np.degrees(np.arctan2(-wind_ew,-wind_ns))%360
+
+def derive_track_error(track,desired_track):
+    """track angle error (see Derived_engine)
+    
+    Args:
+        track (float): track (deg)
+        desired_track (float): desired track (deg)
+    
+    Returns:
+        float: track-desired_track in -180 to 180 (deg) right positive
+    """
+    return (track-desired_track+180)%360-180
+
+bnr_const_dict=dict() # {(msb,scale,resolution):constants} see bnr_consts
+bnr_pow2=np.left_shift(np.int64(1),np.arange(63,dtype=np.int64)) # bit_length LUT
+
+def bnr_layout(width,msb):
+    """bit positions of a BNR word of width bits (see bnr_decode frame)
+    
+    Args:
+        width (int): word length in bits (24 unless wider data is received)
+        msb (int): is number of bits used
+    
+    Returns:
+        tuple: (sign_shift,data_shift,data_mask)
+    """
+    sign_shift=width-5 # P, SSM and the bit after SSM are skipped
+    take=min(msb-1,sign_shift)
+    return (sign_shift,sign_shift-take,(1<<take)-1)
+
+def bnr_consts(msb,scale,resolution=None):
+    """precomputed bnr_decode constants, cached per (msb,scale,resolution)
+    
+    Args:
+        msb (int): is number of bits used
+        scale (float): a scale mutiplyer
+        resolution (float, optional): rounding resolution
+    
+    Returns:
+        tuple: (sign_shift,data_shift,data_mask,neg_base,denom) for 24 bits words
+            a negative value is -(neg_base-data)/denom a positive one data/denom
+    
+    Raises:
+        ValueError: msb < 2 (no data bits)
+    """
+    key=(msb,scale,resolution)
+    consts=bnr_const_dict.get(key)
+    if consts is None:
+        if msb<2:
+            raise ValueError("bnr msb must be >= 2 (got %i)" % msb)
+        consts=bnr_layout(24,msb)+(1<<(msb-1),2.0**msb-1)
+        bnr_const_dict[key]=consts
+    return consts
+
 def bnr_decode(data,msb,scale,resolution=None):
     """decode ARINC 429
     
@@ -858,21 +4354,118 @@ def bnr_decode(data,msb,scale,resolution=None):
     Returns:
         float: decoded float value
     """
-    #TODO test code
-    data_bin=bin(data)[2:].zfill(24)
-    data_bin=data_bin[4:] # remove P and SSN
-    sign=data_bin[0]
-    data_bin=data_bin[1:] # remove sign
-    if sign == '1':
-        value=(~int(data_bin[:msb-1],2) & (2**(msb-1)-1)) +1
-        value=-value/(2.0**msb-1)
+    consts=bnr_const_dict.get((msb,scale,resolution))
+    if consts is None:
+        consts=bnr_consts(msb,scale,resolution)
+    sign_shift,shift,mask,neg_base,denom=consts
+    if data>>24: # fields are counted from the word msb
+        sign_shift,shift,mask=bnr_layout(data.bit_length(),msb)
+    field=(data>>shift)&mask
+    if (data>>sign_shift)&1:
+        value=-(neg_base-field)/denom
     else:
-        value=int(data_bin[:msb-1],2)/(2.0**(msb)-1)
+        value=field/denom
     value=value*scale
     if resolution:
         value=int(value/resolution)*resolution
     return value
 
+def bnr_decode_batch(words,msb,scale,resolution=None):
+    """decode a burst of ARINC 429 BNR words of the same label
+    gives the same values as bnr_decode for each word
+    
+    Args:
+        words (np.ndarray): arinc429 data (see bnr_decode)
+        msb (int): is number of bits used
+        scale (float): a scale mutiplyer
+        resolution (float, optional): if defined ronds the value for lower bound
+    
+    Returns:
+        np.ndarray: decoded float64 values
+    """
+    words=np.asarray(words,dtype=np.int64)
+    sign_shift,shift,mask,neg_base,denom=bnr_consts(msb,scale,resolution)
+    if words.size and (words>>24).any():
+        width=np.maximum(24,np.searchsorted(bnr_pow2,words,side='right'))
+        sign_shift=width-5
+        take=np.minimum(msb-1,sign_shift)
+        shift=sign_shift-take
+        mask=np.left_shift(np.int64(1),take)-1
+    field=(words>>shift)&mask
+    value=np.where((words>>sign_shift)&1,field-neg_base,field)/denom
+    value=value*scale
+    if resolution:
+        value=np.trunc(value/resolution)*resolution+0.0 # no -0.0
+    return value
+
+def bcd_compile(len_list,scale_list,label=None):
+    """compile a BCD description to shift/mask tables (cached per label)
+    
+    Args:
+        len_list (list): list of digit lengths in bits starting for MSB
+        scale_list ([float]): list of scaler for each digit starting for MSB
+        label (int, optional): ARINC label (octal digits ex: 150) enables
+            the parity check
+    
+    Returns:
+        tuple: (label_parity,((shift,mask,scale)...)) (see bcd_decode_word)
+    """
+    key=(label,tuple(len_list),tuple(scale_list))
+    table=bcd_table_dict.get(key)
+    if table is None:
+        digits=list()
+        shift=21 # under P and SSM
+        for l,s in zip(len_list,scale_list):
+            shift-=l
+            digits.append((shift,(1<<l)-1,s))
+        table=(a429_label_parity(label),tuple(digits))
+        bcd_table_dict[key]=table
+    return table
+
+def bcd_decode_word(data,table):
+    """decode ARINC 429 BCD with SSM and parity validation
+    
+    Args:
+        data (int): arinc429 bcd data (see bcd_decode)
+        table (tuple): compiled digits (see bcd_compile)
+    
+    Returns:
+        tuple: (value,status) value is 0.0 unless status is A429_NORMAL
+    """
+    label_par,digits=table
+    status=a429_status(data,label_par,bcd_ssm_lut)
+    if status:
+        return (0.0,status)
+    value = 0.0
+    for shift,mask,scale in digits:
+        value=value+((data>>shift)&mask)*scale
+    if (data>>21)&3 == 3: # SSM minus
+        value=-value
+    return (value,status)
+
+def bcd_decode_batch(words,table):
+    """decode many ARINC 429 BCD words of the same label
+    
+    Args:
+        words (np.ndarray): arinc429 bcd data (see bcd_decode)
+        table (tuple): compiled digits (see bcd_compile)
+    
+    Returns:
+        tuple: (values,status) np.ndarray, values are 0.0 where status is
+            not A429_NORMAL
+    """
+    words=np.asarray(words,dtype=np.int64)
+    label_par,digits=table
+    status=bcd_ssm_arr[(words>>21)&3]
+    if label_par is not None:
+        status[a429_parity_batch(words)==label_par]=A429_PARITY
+    value=np.zeros(words.shape)
+    for shift,mask,scale in digits:
+        value+=((words>>shift)&mask)*scale
+    value[(words>>21)&3 == 3]*=-1
+    value[status!=A429_NORMAL]=0.0
+    return (value,status)
+
 def bcd_decode(data,len_list,scale_list):
     """decode ARINC 429 BCD
     typical BCD frame
@@ -881,6 +4474,7 @@ def bcd_decode(data,len_list,scale_list):
     +----+-------+----------+-------------+-------------+-------------+-------------+------+
     | P  | SSM   | DIGIT1   | DIGIT2      | DIGIT3      | DIGIT4      | DIGIT5      | SDI  |
     +----+-------+----------+-------------+-------------+-------------+-------------+------+
+    SSM: 00 plus, 01 NCD, 10 functional test, 11 minus
     
     Args:
         data (int): arinc429 bdc data
@@ -888,121 +4482,347 @@ def bcd_decode(data,len_list,scale_list):
         scale_list ([float]): list of scler for each digit starting for MSB
     
     Returns:
-        float: decoded float value
+        float: decoded float value (0.0 for NCD and functional test)
     
     Deleted Parameters:
         digit_list ([int]): list of lengths (in bits) for each digit starting for MSB
     """
-    #TODO: handle other cases of SSM (10|01)
-    data_bin=bin(data)[2:].zfill(24)
-    data_bin=data_bin[1:] # remove P
-    ssm = data_bin[:2]
-    data_bin=data_bin[2:] #remove SSM 
-    chunks=[]
-    value = 0.0
-    for l,s in zip(len_list,scale_list):
-        chunk=int(data_bin[:l],2)*s
-        data_bin=data_bin[l:]
-        value=value+chunk
+    return bcd_decode_word(data,bcd_compile(len_list,scale_list))[0]
+
+def a429_label_parity(label):
+    """parity of the 8 label bits
+    
+    Args:
+        label (int): ARINC label written with octal digits (ex: 150)
+    
+    Returns:
+        int: 0|1 or None if label is None
+    """
+    if label is None:
+        return None
+    return a429_parity(int(str(label),8))
+
+def a429_parity(data):
+    """parity of the 24 data bits (P,SSM,data,SDI)
+    
+    Args:
+        data (int): arinc429 data
+    
+    Returns:
+        int: 1 if the number of ones is odd
+    """
+    data=data^(data>>16)
+    data=data^(data>>8)
+    data=data^(data>>4)
+    data=data^(data>>2)
+    data=data^(data>>1)
+    return data&1
+
+def a429_parity_batch(words):
+    """vectorized a429_parity
+    
+    Args:
+        words (np.ndarray): arinc429 data (int64)
+    
+    Returns:
+        np.ndarray: 0|1 for each word
+    """
+    words=words^(words>>16)
+    words=words^(words>>8)
+    words=words^(words>>4)
+    words=words^(words>>2)
+    words=words^(words>>1)
+    return words&1
+
+def a429_status(data,label_par,ssm_lut):
+    """validate ARINC 429 word (odd parity and SSM)
+    
+    Args:
+        data (int): arinc429 data
+        label_par (int): label parity (see a429_label_parity) None skips
+            the parity check
+        ssm_lut (tuple): SSM to status (bcd_ssm_lut or bnr_ssm_lut)
+    
+    Returns:
+        int: A429_NORMAL (0) or the error status
+    """
+    if label_par is not None and a429_parity(data)==label_par:
+        return A429_PARITY # label+data must have an odd number of ones
+    return ssm_lut[(data>>21)&3]
+
+def bnr_decode_word(data,label_par,msb,scale,resolution=None):
+    """decode ARINC 429 BNR with SSM and parity validation
+    
+    Args:
+        data (int): arinc429 data (see bnr_decode)
+        label_par (int): label parity (see a429_label_parity)
+        msb (int): is number of bits used
+        scale (float): a scale mutiplyer
+        resolution (float, optional): rounding resolution
+    
+    Returns:
+        tuple: (value,status) value is 0.0 unless status is A429_NORMAL
+    """
+    status=a429_status(data,label_par,bnr_ssm_lut)
+    if status:
+        return (0.0,status)
+    return (bnr_decode(data,msb,scale,resolution),status)
+
+def bnr_decode_word_batch(words,label_par,msb,scale,resolution=None):
+    """vectorized bnr_decode_word
+    
+    Args:
+        words (np.ndarray): arinc429 data (see bnr_decode)
+        label_par (int): label parity (see a429_label_parity)
+        msb (int): is number of bits used
+        scale (float): a scale mutiplyer
+        resolution (float, optional): rounding resolution
+    
+    Returns:
+        tuple: (values,status) np.ndarray, values are 0.0 where status is
+            not A429_NORMAL
+    """
+    words=np.asarray(words,dtype=np.int64)
+    status=bnr_ssm_arr[(words>>21)&3]
+    if label_par is not None:
+        status[a429_parity_batch(words)==label_par]=A429_PARITY
+    value=bnr_decode_batch(words,msb,scale,resolution)
+    value[status!=A429_NORMAL]=0.0
+    return (value,status)
+
+def a429_passthrough(data,conv=None):
+    """status converter for labels without ARINC decoding
+    
+    Args:
+        data (int): arinc429 data
+        conv (callable, optional): conversion (see bind_converter)
+    
+    Returns:
+        tuple: (value,A429_NORMAL)
+    """
+    if conv is None:
+        return (data,A429_NORMAL)
+    return (conv(data),A429_NORMAL)
+
+def a429_converter(label,func,arg_list=None):
+    """compile a label subscription to a status converter
+    bcd_decode and bnr_decode are replaced by their validating versions
+    
+    Args:
+        label (int): ARINC label (octal digits)
+        func (callable): conversion function (see data_collect.set_aid_var)
+        arg_list (list, optional): argument list for funtion
+    
+    Returns:
+        callable: conv(data) ==> (value,status)
+    """
+    if func is bcd_decode:
+        return functools.partial(bcd_decode_word,table=bcd_compile(*arg_list,label=label))
+    if func is bnr_decode:
+        return functools.partial(bnr_decode_word,label_par=a429_label_parity(label),
+            **dict(zip(("msb","scale","resolution"),arg_list)))
+    return functools.partial(a429_passthrough,conv=bind_converter(func,arg_list))
+
+def a429_batch_converter(label,func,arg_list=None):
+    """compile a label subscription to a burst converter (see AID.format_recv)
+    
+    Args:
+        label (int): ARINC label (octal digits)
+        func (callable): conversion function (see data_collect.set_aid_var)
+        arg_list (list, optional): argument list for funtion
+    
+    Returns:
+        callable: conv_batch(words) ==> (values,status) np.ndarray or None
+            (the label is decoded word by word)
+    """
+    if func is bcd_decode:
+        return functools.partial(bcd_decode_batch,table=bcd_compile(*arg_list,label=label))
+    if func is bnr_decode:
+        return functools.partial(bnr_decode_word_batch,label_par=a429_label_parity(label),
+            **dict(zip(("msb","scale","resolution"),arg_list)))
+    return None
+
+def aid_bursts(recv_list):
+    """words of a read grouped by label
     
-    return value    
+    Args:
+        recv_list (list): [[aid_time,channel,label,data],...] (see AID.recv)
+    
+    Returns:
+        dict: {(channel,label):[data...]} in reception order
+    """
+    bursts=dict()
+    for elm in recv_list:
+        adr=(elm[1],elm[2])
+        words=bursts.get(adr)
+        if words is None:
+            words=bursts[adr]=list()
+        words.append(elm[3])
+    return bursts
+
     #### UBLOX ####
 
-def parse_GGA(str_data):
-    """GGA parser
-    
-    Args:
-        str_data (str): GGA list str
-    Returns:
-        TYPE: list (ENMEA_sentence,utc time in sec, lat,lon,altitude)
-
-    example
-    ------
-    $GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47
-
-Where:
-     GGA          Global Positioning System Fix Data
-     123519       Fix taken at 12:35:19 UTC
-     4807.038,N   Latitude 48 deg 07.038' N
-     01131.000,E  Longitude 11 deg 31.000' E
-     1            Fix quality: 0 = invalid
-                               1 = GPS fix (SPS)
-                               2 = DGPS fix
-                               3 = PPS fix
-                   4 = Real Time Kinematic
-                   5 = Float RTK
-                               6 = estimated (dead reckoning) (2.3 feature)
-                   7 = Manual input mode
-                   8 = Simulation mode
-     08           Number of satellites being tracked
-     0.9          Horizontal dilution of position
-     545.4,M      Altitude, Meters, above mean sea level
-     46.9,M       Height of geoid (mean sea level) above WGS84
-                      ellipsoid
-     (empty field) time in seconds since last DGPS update
-     (empty field) DGPS station ID number
-     *47          the checksum data, always begins with *
-    """
-    data=str_data.split(',')
-    ts=data[1]
-    utc=int(ts[0:2])*3600+int(ts[2:4])*60+int(ts[4:6])
-
-    if data[2] and data[2] : 
-        lat=int(float(data[2])/100)+((float(data[2]))%100)/60.0 #check this
-        if data[3]=='S':lat=-lat
-    else :
-        lat=0
-    if data[4] and data[5]:
-        lon=int(float(data[4])/100)+((float(data[4]))%100)/60.0 #check this
-        if data[5]=='W':lon=-lon
-    else: 
-        lon = 0 
-
-    if data[9]:
-        alt_ft=float(data[9])*3.28084 # x3.28084 ==> m to ft
-    else :
-        alt_ft=0
-    return (utc,lat,lon,alt_ft)  
-
-def parse_VTG(str_data):
-    """VTG - Velocity made good parser
-    
-    Args:
-        str_data (TYPE): Description
-    
-    Returns:
-        TYPE: 'VTG',mag_track,kts_speed,ew_speed,ns_speed)
-    """
-
-    data=str_data.split(',')
-    if data[1]:
-        track=float(data[1])
-    else:
-        track=0
-    if data[5]:
-        kts_speed = float(data[5])
-    else:
-        kts_speed=0
-    if data[1] and data[5]:
-        ew_speed=math.cos(math.radians(track))*kts_speed
-        ns_speed=math.sin(math.radians(track))*kts_speed
-    else :
-        ew_speed=0
-        ns_speed=0
-    return (track,kts_speed,ew_speed,ns_speed)
-
-
-def task_log(file_prefix):
-    context = zmq.Context()
-    socket = context.socket(zmq.SUB)
-    socket.connect("ipc://my-endpoint")
-    socket.setsockopt(zmq.SUBSCRIBE, "")
-    filename=file_prefix+"_%i.txt" % int(time.time())
-    while True:
-	f=open(filename,'a')
-        data=socket.recv()
-        now_ms=int(time.time()*1000)
-        f.write(str(now_ms)+"|"+data+"\n")
-        f.close()
+def nmea_utc(fields,i):
+    """hhmmss(.ss) field to utc seconds (int)
+    
+    Args:
+        fields ([str]): sentence fields (split on ',')
+        i (int): field index
+    
+    Returns:
+        int: seconds of the day (0 if empty)
+    """
+    ts=fields[i]
+    if not ts:
+        return 0
+    return int(ts[0:2])*3600+int(ts[2:4])*60+int(ts[4:6])
+
+def nmea_latlon(fields,i):
+    """(d)ddmm.mmmm,N|S|E|W fields to degrees
+    
+    Args:
+        fields ([str]): sentence fields (split on ',')
+        i (int): index of value, hemisphere is i+1
+    
+    Returns:
+        float: degrees negative for S or W (0 if empty)
+    """
+    if not (fields[i] and fields[i+1]):
+        return 0
+    val=float(fields[i])
+    deg=int(val/100)+(val%100)/60.0
+    if fields[i+1] in 'SW':
+        deg=-deg
+    return deg
+
+def nmea_float(fields,i,scale=1.0):
+    """float field
+    
+    Args:
+        fields ([str]): sentence fields (split on ',')
+        i (int): field index
+        scale (float, optional): unit conversion
+    
+    Returns:
+        float: value*scale (0 if empty)
+    """
+    if not fields[i]:
+        return 0
+    return float(fields[i])*scale
+
+def nmea_int(fields,i):
+    """int field
+    
+    Args:
+        fields ([str]): sentence fields (split on ',')
+        i (int): field index
+    
+    Returns:
+        int: value (0 if empty)
+    """
+    if not fields[i]:
+        return 0
+    return int(fields[i])
+
+def nmea_flag(fields,i,true_val):
+    """flag field
+    
+    Args:
+        fields ([str]): sentence fields (split on ',')
+        i (int): field index
+        true_val (str): value for 1 (ex: 'A' valid)
+    
+    Returns:
+        int: 1|0
+    """
+    return int(fields[i]==true_val)
+
+def nmea_count(fields,first,last):
+    """count non empty fields (ex: GSA satellites used)
+    
+    Args:
+        fields ([str]): sentence fields (split on ',')
+        first (int): first field index
+        last (int): last field index (excluded)
+    
+    Returns:
+        int: number of non empty fields
+    """
+    return len(filter(None,fields[first:last]))
+
+def nmea_vel(fields,spd_i,trk_i,trig,scale=1.0):
+    """velocity component from speed and track fields
+    
+    Args:
+        fields ([str]): sentence fields (split on ',')
+        spd_i (int): speed field index
+        trk_i (int): track field index (deg)
+        trig (callable): math.sin (east-west) or math.cos (north-south)
+        scale (float, optional): speed unit conversion
+    
+    Returns:
+        float: trig(track)*speed*scale (0 if a field is empty)
+    """
+    if not (fields[spd_i] and fields[trk_i]):
+        return 0
+    return trig(math.radians(float(fields[trk_i])))*(float(fields[spd_i])*scale)
+
+M_TO_FT=3.28084
+KMH_TO_KTS=1/1.852
+MS_TO_FPM=196.850394
+#NMEA sentence positions {nmea_sen:{pos:(func,args)}} value is func(fields,*args)
+nmea_field_dict={
+    'GGA':{
+        0:(nmea_utc,(1,)),              # utc (sec)
+        1:(nmea_latlon,(2,)),           # lat (deg)
+        2:(nmea_latlon,(4,)),           # lon (deg)
+        3:(nmea_float,(9,M_TO_FT)),     # MSL alt (ft)
+        4:(nmea_int,(6,)),              # fix quality
+        5:(nmea_int,(7,)),              # satellites tracked
+        6:(nmea_float,(8,))},           # HDOP
+    'VTG':{
+        0:(nmea_float,(1,)),            # true track (deg)
+        1:(nmea_float,(5,)),            # ground speed (kts)
+        2:(nmea_vel,(5,1,math.sin)),    # ew speed (kts)
+        3:(nmea_vel,(5,1,math.cos))},   # ns speed (kts)
+    'RMC':{
+        0:(nmea_utc,(1,)),              # utc (sec)
+        1:(nmea_latlon,(3,)),           # lat (deg)
+        2:(nmea_latlon,(5,)),           # lon (deg)
+        3:(nmea_float,(7,)),            # ground speed (kts)
+        4:(nmea_float,(8,)),            # true track (deg)
+        5:(nmea_flag,(2,'A')),          # valid
+        6:(nmea_vel,(7,8,math.sin)),    # ew speed (kts)
+        7:(nmea_vel,(7,8,math.cos))},   # ns speed (kts)
+    'GSA':{
+        0:(nmea_int,(2,)),              # fix type 1:none 2:2D 3:3D
+        1:(nmea_float,(15,)),           # PDOP
+        2:(nmea_float,(16,)),           # HDOP
+        3:(nmea_float,(17,)),           # VDOP
+        4:(nmea_count,(3,15))},         # satellites used
+    'GST':{
+        0:(nmea_utc,(1,)),              # utc (sec)
+        1:(nmea_float,(2,)),            # range rms (m)
+        2:(nmea_float,(6,)),            # lat std dev (m)
+        3:(nmea_float,(7,)),            # lon std dev (m)
+        4:(nmea_float,(8,M_TO_FT))},    # alt std dev (ft)
+    'ZDA':{
+        0:(nmea_utc,(1,)),              # utc (sec)
+        1:(nmea_int,(2,)),              # day
+        2:(nmea_int,(3,)),              # month
+        3:(nmea_int,(4,))},             # year
+    'PUBX,00':{ # u-blox position, velocity and accuracy
+        0:(nmea_utc,(2,)),              # utc (sec)
+        1:(nmea_latlon,(3,)),           # lat (deg)
+        2:(nmea_latlon,(5,)),           # lon (deg)
+        3:(nmea_float,(7,M_TO_FT)),     # alt (ft)
+        4:(nmea_float,(11,KMH_TO_KTS)), # ground speed (kts)
+        5:(nmea_float,(12,)),           # true track (deg)
+        6:(nmea_vel,(11,12,math.sin,KMH_TO_KTS)), # ew speed (kts)
+        7:(nmea_vel,(11,12,math.cos,KMH_TO_KTS)), # ns speed (kts)
+        8:(nmea_float,(13,-MS_TO_FPM)), # vertical speed (fpm) up
+        9:(nmea_float,(9,)),            # horizontal accuracy (m)
+        10:(nmea_float,(10,))}}         # vertical accuracy (m)
+
 if __name__ == '__main__':
     sys.exit(main())
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""End to end latency benchmark of avionics_zmq with local source stand-ins
+(read main docstring)
+
+the real pipeline (avionics_zmq.py -q -m) is started as a subprocess and fed
+by stand-ins of its sources:
+    x: UDP generator of X-Plane DATA packets
+    a: TCP AID server of "data,time,ch,label,hex" lines
+    u: pty NMEA emitter (GGA)
+each emission carries a tag (counter modulo TAG_MOD) in a subscribed variable,
+a ZMQ PULL sink matches it to the emission time:
+    e2e latency: emission ==> sink
+    pipe latency: capture time (header frame) ==> sink
+with combined sources a tag variable selected from another source (fusion)
+is not measured, run one source per benchmark for e2e latency
+
+Attributes:
+    tag_var_dict (dict): {src_id:var_key} variable carrying the tag
+"""
+import sys
+import os
+import time
+from optparse import OptionParser
+from threading import Thread
+import socket
+import struct
+import subprocess
+import multiprocessing
+import signal
+import tty
+import fcntl
+import errno
+import numpy as np
+import zmq
+import avionics_zmq as az
+
+
+class Xplane_gen(object):
+    """UDP generator of X-Plane DATA packets
+    subscribed sets of main are always sent, other sets are added up to nsets
+    
+    Attributes:
+        adr (tuple): destination (ip,port)
+        packet (bytearray): reused packet, only the tag is packed per send
+        tag_offset (int): offset of GPS position 0 (tag)
+    """
+    src_id=az.src_id_dict['x']
+    def __init__(self,adr,nsets=5):
+        """constructor
+        
+        Args:
+            adr (tuple): destination (ip,port) (see avionics_zmq --src)
+            nsets (int, optional): data sets per packet
+        """
+        self.adr=adr
+        sets=[az.xplane_set_dict[name] for name in
+            ("TIMES","SPEED","MACH_GLOAD","HEADING","GPS")]
+        filler=[i for i in range(256) if i not in sets]
+        sets=sets+filler[:max(0,nsets-len(sets))]
+        rec_packer=struct.Struct('<i8f')
+        self.packet=bytearray(az.XPLANE_HEADER+'\0')
+        for data_set in sets:
+            self.packet+=rec_packer.pack(data_set,*[float(data_set)]*8)
+        self.tag_offset=az.XPLANE_HEADER_LEN+sets.index(az.xplane_set_dict["GPS"])*\
+            az.XPLANE_RECORD_LEN+4
+        self.sock=socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+
+    def start(self):
+        """nothing to start (connectionless)
+        """
+        pass
+
+    def send(self,tag):
+        """send one packet
+        
+        Args:
+            tag (int): tag (GPS_LAT)
+        
+        Returns:
+            bool: sent
+        """
+        struct.pack_into('<f',self.packet,self.tag_offset,tag)
+        self.sock.sendto(self.packet,self.adr)
+        return True
+#<END of class Xplane_gen>
+
+class Aid_server(object):
+    """TCP stand-in of the AID box
+    the last accepted connection receives the lines (the pipeline check
+    connects and closes first). Each emission is the tag word (GNSS 150
+    UTC_SEC) followed by nlabels-1 unsubscribed words.
+    
+    Attributes:
+        conn (socket.socket): current client or None
+        filler (str): unsubscribed lines of one emission
+        sock (socket.socket): listening socket
+    """
+    src_id=az.src_id_dict['a']
+    def __init__(self,adr,nlabels=1):
+        """constructor
+        
+        Args:
+            adr (tuple): listen (ip,port) (see avionics_zmq --aid)
+            nlabels (int, optional): lines per emission
+        """
+        self.sock=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET,socket.SO_REUSEADDR,1)
+        self.sock.bind(adr)
+        self.sock.listen(4)
+        self.conn=None
+        self.channel=az.aid_set_dict['GNSS']
+        self.label_par=az.a429_label_parity(150)
+        self.filler=''.join(["data,0.0,7,377,%06x\n" % i for i in range(nlabels-1)])
+
+    def start(self):
+        """start accept thread
+        """
+        thread = Thread(target = self.run)
+        thread.setDaemon(True)
+        thread.start()
+
+    def run(self):
+        """accept thread: subscription lines ("add,ch,label") are ignored
+        """
+        while True:
+            conn,adr=self.sock.accept()
+            conn.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+            self.conn=conn
+
+    def word(self,tag):
+        """UTC_SEC BCD word of a tag (see main: [1,5,6,6],[0,3600,60,1])
+        
+        Args:
+            tag (int): seconds of the day
+        
+        Returns:
+            int: arinc429 data with odd parity
+        """
+        data=((tag//3600)<<15)|(((tag//60)%60)<<9)|((tag%60)<<3)
+        if az.a429_parity(data)==self.label_par:
+            data|=1<<23
+        return data
+
+    def send(self,tag):
+        """send one emission
+        
+        Args:
+            tag (int): tag (UTC_SEC)
+        
+        Returns:
+            bool: sent (False without client)
+        """
+        conn=self.conn
+        if conn is None:
+            return False
+        try:
+            conn.sendall("data,%f,%i,150,%06x\n" % (time.time(),self.channel,
+                self.word(tag))+self.filler)
+        except socket.error:
+            self.conn=None
+            return False
+        return True
+#<END of class Aid_server>
+
+class Nmea_pty(object):
+    """pty NMEA emitter (the pipeline opens the slave as its serial port)
+    writes are non blocking, a full pty drops the sentence
+    
+    Attributes:
+        master (int): master file descriptor
+        port (str): slave device (see avionics_zmq --com)
+    """
+    src_id=az.src_id_dict['u']
+    def __init__(self):
+        """constructor
+        """
+        self.master,self.slave=os.openpty()
+        tty.setraw(self.slave)
+        self.port=os.ttyname(self.slave)
+        flags=fcntl.fcntl(self.master,fcntl.F_GETFL)
+        fcntl.fcntl(self.master,fcntl.F_SETFL,flags|os.O_NONBLOCK)
+
+    def start(self):
+        """nothing to start (see __init__)
+        """
+        pass
+
+    def send(self,tag):
+        """write one GGA sentence
+        
+        Args:
+            tag (int): tag (UTC_SEC)
+        
+        Returns:
+            bool: written
+        """
+        body="GPGGA,%02i%02i%02i.00,4530.0000,N,07330.0000,W,1,08,0.9,100.0,M,0.0,M,," % \
+            (tag//3600,(tag//60)%60,tag%60)
+        try:
+            os.write(self.master,"$%s*%02X\r\n" % (body,az.nmea_checksum(body)))
+        except OSError as e:
+            if e.errno!=errno.EAGAIN:
+                raise
+            return False
+        return True
+#<END of class Nmea_pty>
+
+class Sink(object):
+    """ZMQ PULL sink of the pipeline (header frame required)
+    
+    Attributes:
+        e2e (dict): {src_id:[latency (sec)...]} emission ==> sink
+        pipe (dict): {src_id:[latency (sec)...]} capture ==> sink
+        received (dict): {src_id:messages}
+        schema (Wire_schema): bin format schema or None
+    """
+    def __init__(self,adr,emit_t):
+        """constructor
+        
+        Args:
+            adr (tuple): pipeline destination (ip,port) (see avionics_zmq --dest)
+            emit_t (multiprocessing.Array): emission time per (src_id,tag)
+        """
+        self.sock=zmq.Context().socket(zmq.PULL)
+        self.sock.connect("tcp://%s:%i" % adr)
+        self.emit_t=emit_t
+        self.schema=None
+        self.hdr_packer=struct.Struct(az.ZMQ_HEADER_FMT)
+        self.received=dict()
+        self.e2e=dict()
+        self.pipe=dict()
+
+    def decode(self,fmt_id,payload):
+        """payload to dict
+        
+        Args:
+            fmt_id (int): FMT_PMT, FMT_BIN or FMT_SCHEMA
+            payload (str): message
+        
+        Returns:
+            dict: {var_key:value} or None (schema or unknown)
+        """
+        if fmt_id==az.FMT_SCHEMA:
+            self.schema=az.Wire_schema.from_descriptor(payload)
+        elif fmt_id==az.FMT_BIN and self.schema:
+            return self.schema.unpack(payload)
+        elif fmt_id==az.FMT_PMT:
+            return az.pmt.to_python(az.pmt.deserialize_str(payload))
+
+    def run(self,t_from,t_to,t_end):
+        """collect messages
+        
+        Args:
+            t_from (float): ignore emissions before (warmup)
+            t_to (float): ignore emissions after
+            t_end (float): stop time
+        """
+        poller=zmq.Poller()
+        poller.register(self.sock,zmq.POLLIN)
+        while time.time()<t_end:
+            if not poller.poll(100):
+                continue
+            frames=self.sock.recv_multipart()
+            now=time.time()
+            seq,src_id,fmt_id,t_capture=self.hdr_packer.unpack(frames[0])
+            recv_dict=self.decode(fmt_id,frames[-1])
+            if not recv_dict or t_capture<t_from or t_capture>t_to:
+                continue
+            self.received[src_id]=self.received.get(src_id,0)+1
+            self.pipe.setdefault(src_id,list()).append(now-t_capture)
+            tag=recv_dict.get(tag_var_dict.get(src_id))
+            if tag is not None:
+                t_emit=self.emit_t[src_id*TAG_MOD+int(tag)%TAG_MOD]
+                if t_from<=t_emit<=now:
+                    self.e2e.setdefault(src_id,list()).append(now-t_emit)
+#<END of class Sink>
+
+def main():
+    """run stand-ins, pipeline and sink then print a report
+    
+    ex: python bench_avionics_zmq.py --rate 2000 --sets 20 xau
+    """
+    #--------Define options--------------------
+    usage = """ %prog [options] src
+                src: stand-ins to run (x, a, u or a combination of them)"""
+    parser = OptionParser(usage=usage,version=0.1)
+    parser.add_option("-n", "--rate",
+                  dest="rate",
+                  type="float",
+                  default=100.0,
+                  help="emissions per second of each stand-in default=100")
+    parser.add_option("--sets",
+                  dest="sets",
+                  type="int",
+                  default=5,
+                  help="X-Plane data sets per packet default=5")
+    parser.add_option("--labels",
+                  dest="labels",
+                  type="int",
+                  default=1,
+                  help="AID lines per emission default=1")
+    parser.add_option("--duration",
+                  dest="duration",
+                  type="float",
+                  default=10.0,
+                  help="measure time in sec default=10")
+    parser.add_option("--warmup",
+                  dest="warmup",
+                  type="float",
+                  default=2.0,
+                  help="ignored start time in sec default=2")
+    parser.add_option("--port",
+                  dest="port",
+                  type="int",
+                  default=49100,
+                  help="first local port (x, a, dest) default=49100")
+    parser.add_option("-e", "--extra",
+                  dest="extra",
+                  type="string",
+                  default="-f bin",
+                  help="extra avionics_zmq options default=\"-f bin\"")
+    (options, args) = parser.parse_args()
+    if (len(args) != 1) or not args[0] or (args[0].strip("xau")!=""):
+        parser.error("argument must be x, a, u or a combination of them")
+    modes=args[0]
+    xplane_adr=("127.0.0.1",options.port)
+    aid_adr=("127.0.0.1",options.port+1)
+    dest_adr=("127.0.0.1",options.port+2)
+
+    #--------stand-ins--------------------
+    gens=list()
+    if 'x' in modes:
+        gens.append(Xplane_gen(xplane_adr,options.sets))
+    if 'a' in modes:
+        gens.append(Aid_server(aid_adr,options.labels))
+    if 'u' in modes:
+        nmea=Nmea_pty()
+        gens.append(nmea)
+    emit_t=multiprocessing.Array('d',(max(az.src_id_dict.values())+1)*TAG_MOD,lock=False)
+    emitted=multiprocessing.Array('l',max(az.src_id_dict.values())+1,lock=False)
+    t0=time.time()+BENCH_START_SEC
+    t_from=t0+options.warmup
+    t_to=t_from+options.duration
+    emitter=multiprocessing.Process(target=emit,args=(gens,options.rate,t0,
+        t_from,t_to,emit_t,emitted))
+    emitter.start()
+
+    #--------pipeline--------------------
+    cmd=[sys.executable,os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "avionics_zmq.py"),"-q","-m","-s","%s:%i" % xplane_adr,"-a","%s:%i" % aid_adr,
+        "-d","%s:%i" % dest_adr]
+    if 'u' in modes:
+        cmd+=["-u",nmea.port]
+    cmd+=options.extra.split()+[modes]
+    print ' '.join(cmd)
+    devnull=open(os.devnull,'w')
+    pipeline=subprocess.Popen(cmd,stdout=devnull)
+
+    #--------sink--------------------
+    sink=Sink(dest_adr,emit_t)
+    try:
+        sink.run(t_from,t_to,t_to+BENCH_DRAIN_SEC)
+    finally:
+        pipeline.send_signal(signal.SIGINT)
+        pipeline.wait()
+        emitter.join()
+
+    #--------report--------------------
+    print "%-4s %9s %9s %10s %24s %24s" % ("src","emitted","received","msg/s",
+        "e2e p50/p99/p99.9 ms","pipe p50/p99/p99.9 ms")
+    for gen in gens:
+        src_id=gen.src_id
+        print "%-4i %9i %9i %10.1f %24s %24s" % (src_id,emitted[src_id],
+            sink.received.get(src_id,0),sink.received.get(src_id,0)/options.duration,
+            percentiles(sink.e2e.get(src_id)),percentiles(sink.pipe.get(src_id)))
+
+    # <END of main>
+#------------------------------
+# Globals
+#-------------------------------
+def emit(gens,rate,t0,t_from,t_to,emit_t,emitted):
+    """emitter process: paced emissions of every stand-in
+    
+    Args:
+        gens (list): stand-ins (Xplane_gen, Aid_server, Nmea_pty)
+        rate (float): emissions per second of each stand-in
+        t0 (float): start time
+        t_from (float): emissions are counted from (warmup)
+        t_to (float): stop time
+        emit_t (multiprocessing.Array): emission time per (src_id,tag)
+        emitted (multiprocessing.Array): counted emissions per src_id
+    """
+    for gen in gens:
+        gen.start()
+    periode=1.0/rate
+    i=0
+    while True:
+        deadline=t0+i*periode
+        if deadline>t_to:
+            return
+        delay=deadline-time.time()
+        if delay>0:
+            time.sleep(delay)
+        tag=i%TAG_MOD
+        for gen in gens:
+            now=time.time()
+            emit_t[gen.src_id*TAG_MOD+tag]=now
+            if gen.send(tag) and now>=t_from:
+                emitted[gen.src_id]+=1
+        i+=1
+
+def percentiles(latencies):
+    """p50/p99/p99.9 of latencies
+    
+    Args:
+        latencies (list): seconds or None
+    
+    Returns:
+        str: "p50/p99/p99.9" in ms or "-"
+    """
+    if not latencies:
+        return "-"
+    return "%.3f/%.3f/%.3f" % tuple(np.percentile(np.array(latencies)*1000.0,
+        BENCH_PERCENTILES))
+
+TAG_MOD=86400 # tags are seconds of the day (UTC_SEC)
+BENCH_START_SEC=1.0 # emission starts after the pipeline is up
+BENCH_DRAIN_SEC=1.0 # sink keeps receiving after the last emission
+BENCH_PERCENTILES=(50,99,99.9)
+#variable carrying the tag of each source (see main of avionics_zmq)
+tag_var_dict={
+    az.src_id_dict['x']     :10,# GPS_LAT
+    az.src_id_dict['a']     :0, # UTC_SEC
+    az.src_id_dict['u']     :0} # UTC_SEC
+
+if __name__ == '__main__':
+    main()
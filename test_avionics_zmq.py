@@ -0,0 +1,1448 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests of avionics_zmq (python -m unittest test_avionics_zmq)
+sources are fed from in-memory sockets, log files are written in a
+temporary directory
+"""
+import os
+import glob
+import socket
+import shutil
+import tempfile
+import unittest
+import array
+import random
+import struct
+import threading
+import marshal
+import copy
+import math
+import functools
+import numpy as np
+import zmq
+import avionics_zmq as az
+import avionics_shm
+
+
+class Fake_sock(object):
+    """stream socket returning one chunk per recv_into"""
+    def __init__(self,chunks):
+        self.chunks=list(chunks)
+    def recv_into(self,view):
+        if not self.chunks:
+            return 0
+        chunk=self.chunks.pop(0)
+        if len(chunk)>len(view): # rest for the next read
+            self.chunks.insert(0,chunk[len(view):])
+            chunk=chunk[:len(view)]
+        view[:len(chunk)]=chunk
+        return len(chunk)
+
+class Fake_serial(object):
+    """serial port returning one chunk per read"""
+    def __init__(self,chunks):
+        self.chunks=list(chunks)
+        self.in_waiting=1
+    def isOpen(self):
+        return True
+    def read(self,size):
+        return self.chunks.pop(0)
+
+class Fake_dest(object):
+    """Zmq_pmt stand-in keeping the sent dicts"""
+    src_id=0
+    def __init__(self):
+        self.metrics=az.Metrics()
+        self.sent=list()
+    def send_dict(self,dict_to_send,src_id=None,capture_t=None):
+        if isinstance(dict_to_send,az.Var_store):
+            dict_to_send=dict_to_send.as_dict()
+        self.sent.append(dict_to_send)
+
+class Fake_shm(object):
+    """Shm_state stand-in keeping the write times"""
+    def __init__(self):
+        self.writes=list()
+    def write(self,values,times,valid,now):
+        self.writes.append(now)
+
+def array_d(values):
+    """float64 array (Var_store layout)"""
+    return array.array('d',values)
+
+def counter(metrics,src_id,counter):
+    """value of a Metrics counter"""
+    return metrics.counters[src_id*az.METRIC_NCOUNTERS+counter]
+
+def aid_source(chunks):
+    """AID source subscribed to GNSS 110 (GPS_LAT) reading chunks"""
+    dc=az.data_collect()
+    az.add_default_vars(dc)
+    aid=az.AID(dc.get_aid_dict(),("127.0.0.1",0))
+    aid.frames=az.line_framer(Fake_sock(chunks))
+    return aid
+
+def nmea_source(chunks):
+    """u-Blox source with the default subscriptions reading chunks"""
+    dc=az.data_collect()
+    az.add_default_vars(dc)
+    nmea=az.NMEA_ublox(dc.get_ublox_dict(),"/dev/null")
+    nmea.ser=Fake_serial(chunks)
+    nmea.frames=az.nmea_framer(nmea.ser,nmea.plan)
+    return nmea
+
+def nmea_sentence(body):
+    """sentence with its checksum"""
+    return "$%s*%02X\r\n" % (body,az.nmea_checksum(body))
+
+def baseline_bnr_decode(data,msb,scale,resolution=None):
+    """string based bnr_decode of the first version (reference)"""
+    data_bin=bin(data)[2:].zfill(24)
+    data_bin=data_bin[4:] # remove P and SSN
+    sign=data_bin[0]
+    data_bin=data_bin[1:] # remove sign
+    if sign == '1':
+        value=(~int(data_bin[:msb-1],2) & (2**(msb-1)-1)) +1
+        value=-value/(2.0**msb-1)
+    else:
+        value=int(data_bin[:msb-1],2)/(2.0**(msb)-1)
+    value=value*scale
+    if resolution:
+        value=int(value/resolution)*resolution
+    return value
+
+def baseline_bcd_decode(data,len_list,scale_list):
+    """string based bcd_decode of the first version (reference, no SSM)"""
+    data_bin=bin(data)[2:].zfill(24)
+    data_bin=data_bin[1:] # remove P
+    data_bin=data_bin[2:] #remove SSM 
+    value = 0.0
+    for l,s in zip(len_list,scale_list):
+        value=value+int(data_bin[:l],2)*s
+        data_bin=data_bin[l:]
+    return value
+
+def bits(value):
+    """float64 bit pattern (bit for bit comparisons, -0.0 != 0.0)"""
+    return struct.pack('<d',value)
+
+def aid_line(channel,label,data):
+    """AID line"""
+    return "data,1.0,%i,%i,%x" % (channel,label,data)
+
+def with_parity(label,data,odd=True):
+    """set the parity bit (bit 24) of a word, odd parity is valid and even
+    parity a parity error (see a429_status)"""
+    data&=0x7fffff
+    ones=az.a429_parity(data)^az.a429_label_parity(label)
+    return data|((ones^odd)<<23)
+
+class Test_bnr(unittest.TestCase):
+    msbs=(2,3,8,12,15,17,19,20)
+    scales=(1,180,0.5,-90,131072,4096,0.001)
+    resolutions=(None,1,0.125,0.01,0.000172)
+
+    def words(self):
+        rnd=random.Random(429)
+        words=[0,1,0xffffff,0x7fffff,0x800000,0x100000,0x0fffff,0x1fffff,0xefffff]
+        for ssm in range(4): # every SSM with and without sign
+            words+=[(ssm<<21)|rnd.getrandbits(21) for i in range(20)]
+        words+=[rnd.getrandbits(24) for i in range(300)]
+        words+=[rnd.getrandbits(32)|(1<<24) for i in range(50)] # wider words
+        return words
+
+    def test_decode_matches_baseline(self):
+        words=self.words()
+        for msb in self.msbs:
+            for scale in self.scales:
+                for resolution in self.resolutions:
+                    batch=az.bnr_decode_batch(np.array(words),msb,scale,resolution)
+                    for data,value in zip(words,batch.tolist()):
+                        expected=bits(baseline_bnr_decode(data,msb,scale,resolution))
+                        self.assertEqual(bits(az.bnr_decode(data,msb,scale,resolution)),
+                            expected,(data,msb,scale,resolution))
+                        self.assertEqual(bits(value),expected,
+                            (data,msb,scale,resolution))
+
+    def test_word_batch_status(self):
+        label=110
+        par=az.a429_label_parity(label)
+        rnd=random.Random(110)
+        words=[with_parity(label,rnd.getrandbits(24),rnd.random()<0.8)
+            for i in range(400)]
+        values,status=az.bnr_decode_word_batch(np.array(words),par,20,180,0.000172)
+        for data,value,st in zip(words,values.tolist(),status.tolist()):
+            expected=az.bnr_decode_word(data,par,20,180,0.000172)
+            self.assertEqual((bits(value),st),(bits(expected[0]),expected[1]))
+        self.assertEqual(set(status.tolist()),set([az.A429_NORMAL,az.A429_NCD,
+            az.A429_FT,az.A429_FW,az.A429_PARITY]))
+
+def reference_bnr_batch(words,msb,scale,resolution=None):
+    """baseline_bnr_decode of 24 bit words with numpy (same operations on
+    the same bits: sign is bit 19, the field is the next msb-1 bits)"""
+    mask=(1<<(msb-1))-1
+    field=(words>>(20-msb))&mask
+    value=np.where(words&(1<<19),-((~field&mask)+1)/(2.0**msb-1),
+        field/(2.0**msb-1))
+    value=value*scale
+    if resolution:
+        value=np.trunc(value/resolution)*resolution+0.0 # int() gives no -0.0
+    return value
+
+class Test_bnr_exhaustive(unittest.TestCase):
+    """every 24 bit word of every configured BNR label"""
+    chunk=1<<21
+
+    def configured(self):
+        dc=az.data_collect()
+        az.add_default_vars(dc)
+        args=set()
+        for labels in dc.get_aid_dict().values():
+            for var_key,func,arg_list in labels.values():
+                if func is az.bnr_decode:
+                    args.add(tuple(arg_list)+(None,)*(3-len(arg_list)))
+        self.assertTrue(args)
+        return sorted(args)
+
+    def test_reference_matches_baseline(self):
+        rnd=random.Random(3)
+        words=np.array([rnd.getrandbits(24) for i in range(2000)],dtype=np.int64)
+        for msb,scale,resolution in self.configured():
+            expected=[bits(baseline_bnr_decode(data,msb,scale,resolution))
+                for data in words.tolist()]
+            self.assertEqual([bits(value) for value in 
+                reference_bnr_batch(words,msb,scale,resolution).tolist()],expected)
+
+    def test_all_words(self):
+        for msb,scale,resolution in self.configured():
+            for start in range(0,1<<24,self.chunk):
+                words=np.arange(start,start+self.chunk,dtype=np.int64)
+                batch=az.bnr_decode_batch(words,msb,scale,resolution)
+                expected=reference_bnr_batch(words,msb,scale,resolution)
+                diff=np.flatnonzero(batch.view(np.uint64)!=expected.view(np.uint64))
+                self.assertEqual(diff.size,0,(msb,scale,resolution,
+                    words[diff[:5]].tolist()))
+
+class Test_bcd(unittest.TestCase):
+    label=150
+    args=([1,5,6,6],[0,3600,60,1]) # UTC_SEC (see add_default_vars)
+
+    def words(self,ssm):
+        rnd=random.Random(ssm)
+        return [with_parity(self.label,(ssm<<21)|rnd.getrandbits(21),rnd.random()<0.8)
+            for i in range(200)]
+
+    def check(self,ssm,status,sign):
+        table=az.bcd_compile(*self.args,label=self.label)
+        words=self.words(ssm)
+        values,batch_status=az.bcd_decode_batch(np.array(words),table)
+        par=az.a429_label_parity(self.label)
+        for data,value,st in zip(words,values.tolist(),batch_status.tolist()):
+            expected=az.bcd_decode_word(data,table)
+            self.assertEqual((bits(value),st),(bits(expected[0]),expected[1]),data)
+            if az.a429_parity(data)==par:
+                self.assertEqual(expected,(0.0,az.A429_PARITY))
+            elif status:
+                self.assertEqual(expected,(0.0,status))
+            else:
+                self.assertEqual(expected,(sign*baseline_bcd_decode(data,*self.args),
+                    az.A429_NORMAL))
+        self.assertIn(az.A429_PARITY,batch_status.tolist())
+
+    def test_plus(self):
+        self.check(0,az.A429_NORMAL,1)
+
+    def test_ncd(self):
+        self.check(1,az.A429_NCD,1)
+
+    def test_functional_test(self):
+        self.check(2,az.A429_FT,1)
+
+    def test_minus(self):
+        self.check(3,az.A429_NORMAL,-1)
+
+    def test_no_label_skips_parity(self):
+        for data in self.words(3):
+            self.assertEqual(az.bcd_decode(data,*self.args),
+                -baseline_bcd_decode(data,*self.args))
+
+def varargs_sum(value,*args):
+    """converter with variable arguments"""
+    return value+sum(args)
+
+class Test_bind_converter(unittest.TestCase):
+    def test_function_binds_by_name(self):
+        conv=az.bind_converter(az.scale_to_int,[3600])
+        self.assertEqual(conv(1.5),az.scale_to_int(1.5,3600))
+        self.assertIs(az.bind_converter(az.scale_to_int),az.scale_to_int)
+        self.assertIsNone(az.bind_converter(None,[1]))
+
+    def test_too_many_arguments(self):
+        self.assertRaises(ValueError,az.bind_converter,az.scale_to_int,[1,2])
+
+    def test_callables_without_signature(self):
+        self.assertEqual(az.bind_converter(pow,[2])(3),9) # builtin
+        self.assertEqual(az.bind_converter(math.fmod,[3.0])(7.0),1.0)
+        conv=az.bind_converter(functools.partial(az.bcd_decode,scale_list=[10,1]),
+            [[4,4]])
+        self.assertEqual(conv(0x12<<13),12.0)
+        self.assertEqual(az.bind_converter(varargs_sum,[1,2,3])(1),7)
+
+    def test_validate_builtin_converter(self):
+        dc=az.data_collect()
+        dc.add_var("X",1)
+        dc.set_xplane_var("X",az.xplane_set_dict["GPS"],0,pow,[2])
+        dc.set_aid_var("X",az.aid_set_dict["GNSS"],110,math.fmod,[3.0])
+        self.assertEqual(dc.validate(),[])
+        dc.get_xplane_dict()
+        dc.get_aid_dict()
+
+class Test_aid_burst(unittest.TestCase):
+    def burst(self,seed):
+        rnd=random.Random(seed)
+        gnss=az.aid_set_dict['GNSS']
+        lines=list()
+        for i in range(200):
+            label=rnd.choice((110,111,112,150,166,370))
+            lines.append(aid_line(gnss,label,with_parity(label,rnd.getrandbits(24),
+                rnd.random()<0.9)))
+        return [line+"\n" for line in lines]
+
+    def decode(self,batch_min,store=None):
+        saved=az.A429_BATCH_MIN
+        az.A429_BATCH_MIN=batch_min
+        try:
+            result=list()
+            for seed in range(20):
+                aid=aid_source([])
+                aid.frames=az.line_framer(Fake_sock(["".join(self.burst(seed))]),1<<16)
+                rec=aid.recv()
+                if store is None:
+                    result.append(aid.format_recv(rec))
+                    continue
+                aid.bind_store(store)
+                aid.format_store(rec,store,float(seed))
+                result.append((store.as_dict(),bytearray(store.valid)))
+                store.commit(float(seed))
+            return result
+        finally:
+            az.A429_BATCH_MIN=saved
+
+    def test_format_recv_batch_matches_words(self):
+        batch=self.decode(1)
+        self.assertTrue(all(batch))
+        self.assertEqual(batch,self.decode(10**6))
+
+    def test_format_store_batch_matches_words(self):
+        keys=az.data_collect()
+        az.add_default_vars(keys)
+        batch=self.decode(1,az.Var_store(keys.vdict.keys()))
+        words=self.decode(10**6,az.Var_store(keys.vdict.keys()))
+        self.assertEqual(batch,words)
+
+def xplane_datagram(rnd,sets):
+    """DATA datagram with random values for data sets"""
+    data="DATA*"
+    for data_set in sets:
+        data+=struct.pack("<i8f",data_set,*[rnd.uniform(-400,400) for i in range(8)])
+    return bytearray(data)
+
+def xplane_source():
+    """X-Plane source with the default subscriptions (not connected)"""
+    dc=az.data_collect()
+    az.add_default_vars(dc)
+    return az.Xplane(dc.get_xplane_dict(),("127.0.0.1",0))
+
+class Test_xplane(unittest.TestCase):
+    def setUp(self):
+        self.rnd=random.Random(1)
+        self.src=xplane_source()
+
+    def unpack(self,datagram):
+        """unpack a datagram received in the reused buffer"""
+        buf=self.src.buf
+        buf[:len(datagram)]=datagram
+        return self.src.unpack(buf,len(datagram),dict())
+
+    def test_plan_matches_records(self):
+        gps=az.xplane_set_dict["GPS"]
+        heading=az.xplane_set_dict["HEADING"]
+        for i in range(50):
+            datagram=xplane_datagram(self.rnd,[heading,99,gps])
+            formated=self.src.format_recv(self.unpack(datagram))
+            records=dict((struct.unpack_from("<i",datagram,offset)[0],
+                struct.unpack_from("<8f",datagram,offset+4))
+                for offset in range(5,len(datagram),36))
+            self.assertEqual(formated[10],records[gps][0]) # GPS_LAT
+            self.assertEqual(formated[22],records[gps][5]) # GPS_ALT
+            self.assertEqual(formated[41],records[heading][3]) # MAG_HDG
+            self.assertNotIn(32,formated) # SPEED set not received
+
+    def test_stale_bytes_are_not_a_header(self):
+        self.unpack(xplane_datagram(self.rnd,[20,17]))
+        self.assertIsNone(self.unpack(bytearray("DAT"))) # "A*" left in buf
+        self.assertIsNone(self.unpack(bytearray(""))) # empty datagram
+
+    def test_partial_record_is_dropped(self):
+        datagram=xplane_datagram(self.rnd,[20,17])
+        self.assertIsNone(self.unpack(datagram[:-1]))
+        self.assertIsNone(self.unpack(datagram[:40]))
+        self.assertIsNone(self.unpack(datagram[:4]))
+        self.assertEqual(self.unpack(datagram[:5]),dict())
+        self.assertEqual(sorted(self.unpack(datagram[:41])),[20])
+
+    def queued(self,drain,datagrams):
+        """recv of a drained source with datagrams queued"""
+        self.src.drain=drain
+        self.src.sock,peer=socket.socketpair(socket.AF_UNIX,socket.SOCK_DGRAM)
+        self.addCleanup(self.src.sock.close)
+        self.addCleanup(peer.close)
+        for datagram in datagrams:
+            peer.send(datagram)
+        return self.src.recv()
+
+    def expected(self,datagram,recv_dict=None):
+        return xplane_source().unpack(datagram,len(datagram),
+            dict() if recv_dict is None else recv_dict)
+
+    def test_drain_latest(self):
+        gps=az.xplane_set_dict["GPS"]
+        datagrams=[xplane_datagram(self.rnd,[gps]) for i in range(3)]
+        rec=self.queued("latest",datagrams[:2]+[bytearray("junk")]+datagrams[2:]+[
+            datagrams[0][:-1]]) # not DATA: skipped, not counted
+        self.assertEqual(rec,self.expected(datagrams[2]))
+        self.assertEqual(self.src.stale,2)
+        self.assertIsNone(self.src.recv_queued(self.src.spare)) # all drained
+
+    def test_drain_merge(self):
+        gps=az.xplane_set_dict["GPS"]
+        heading=az.xplane_set_dict["HEADING"]
+        speed=az.xplane_set_dict["SPEED"]
+        datagrams=[xplane_datagram(self.rnd,[gps,heading]),xplane_datagram(self.rnd,[gps]),
+            xplane_datagram(self.rnd,[speed,gps])]
+        rec=self.queued("merge",datagrams[:2]+[bytearray("DAT")]+datagrams[2:])
+        expected=dict()
+        for datagram in datagrams: # newest value of each data set
+            self.expected(datagram,expected)
+        self.assertEqual(rec,expected)
+        self.assertEqual(rec[gps],self.expected(datagrams[2])[gps])
+        self.assertEqual(rec[heading],self.expected(datagrams[0])[heading])
+        self.assertEqual(self.src.stale,2)
+
+    def test_drain_single_datagram(self):
+        datagram=xplane_datagram(self.rnd,[az.xplane_set_dict["GPS"]])
+        for drain in (None,"latest","merge"):
+            self.assertEqual(self.queued(drain,[datagram]),self.expected(datagram))
+            self.assertEqual(self.src.stale,0)
+
+class Test_wire_schema(unittest.TestCase):
+    def setUp(self):
+        self.schema=az.Wire_schema({"A":1,"B":5,"C":3})
+
+    def test_round_trip(self):
+        msg=str(self.schema.pack({5:2.5,1:-1.0}))
+        consumer=az.Wire_schema.from_descriptor(self.schema.pack_schema())
+        self.assertEqual(consumer.unpack(msg),{5:2.5,1:-1.0})
+        self.assertRaises(ValueError,az.Wire_schema({"A":1}).unpack,msg)
+
+    def test_unknown_var_key_is_ignored(self):
+        expected=str(self.schema.pack({3:1.0}))
+        self.assertEqual(str(self.schema.pack({3:1.0,99:2.0})),expected)
+
+class Test_var_store(unittest.TestCase):
+    """the store path (format_store, pack_store, commit) gives the same
+    bin payloads and latest values as the dict path (format_recv, pack)"""
+    def setUp(self):
+        self.dc=az.data_collect()
+        az.add_default_vars(self.dc)
+        self.schema=az.Wire_schema(self.dc.key_dict)
+        self.rnd=random.Random(18)
+
+    def compare(self,src,recs,invalid=None):
+        """invalid(rec,formated): var_keys of rec invalidated"""
+        store=az.Var_store(self.dc.vdict.keys())
+        src.bind_store(store)
+        valid=set()
+        for i,rec in enumerate(recs):
+            formated=src.format_recv(rec)
+            expected=str(self.schema.pack(formated))
+            src.format_store(rec,store,float(i))
+            self.assertEqual(str(self.schema.pack_store(store)),expected,i)
+            self.assertEqual(store.as_dict(),formated)
+            store.commit(float(i))
+            if invalid:
+                valid-=invalid(rec,formated)
+            valid.update(formated)
+            for var_key,value in formated.items():
+                idx=store.index[var_key]
+                self.assertEqual(bits(store.values[idx]),bits(value))
+                self.assertEqual(store.times[idx],float(i))
+        for idx in range(len(store.keys)): # msg is cleared by commit
+            self.assertNotEqual(store.msg[idx],store.msg[idx])
+        self.assertEqual(set(store.keys[idx] for idx in range(len(store.keys))
+            if store.valid[idx]),valid)
+
+    def test_xplane(self):
+        src=az.Xplane(self.dc.get_xplane_dict(),("127.0.0.1",0))
+        sets=[az.xplane_set_dict[name] for name in ("TIMES","SPEED","MACH_GLOAD",
+            "HEADING","GPS","ATMOSPHERE_AIRCRAFT")]
+        recs=list()
+        for i in range(200):
+            datagram=xplane_datagram(self.rnd,self.rnd.sample(sets,self.rnd.randint(1,5)))
+            recs.append(src.unpack(datagram,len(datagram),dict()))
+        self.compare(src,recs)
+
+    def test_aid(self):
+        src=aid_source([])
+        labels=[(channel,label) for channel,label in src.conv_dict]
+        lines=list()
+        for i in range(200):
+            burst=list()
+            for j in range(self.rnd.randint(1,30)):
+                channel,label=self.rnd.choice(labels)
+                burst.append(aid_line(channel,label,with_parity(label,
+                    self.rnd.getrandbits(24),self.rnd.random()<0.9)))
+            lines.append("\n".join(burst)+"\n")
+        src.frames=az.line_framer(Fake_sock(lines),1<<16)
+        def invalid(rec,formated):
+            return set(src.conv_dict[(elm[1],elm[2])][0] for elm in rec)-set(formated)
+        self.compare(src,[src.recv() for burst in lines],invalid)
+
+    def test_nmea(self):
+        bodies=list()
+        for i in range(200):
+            lat="%02i%07.4f" % (self.rnd.randint(0,89),self.rnd.uniform(0,60))
+            lon="%03i%07.4f" % (self.rnd.randint(0,179),self.rnd.uniform(0,60))
+            gga="GPGGA,%02i%02i%02i,%s,%s,%s,%s,1,%02i,0.9,%.1f,M,46.9,M,," % (
+                self.rnd.randint(0,23),self.rnd.randint(0,59),self.rnd.randint(0,59),
+                lat,self.rnd.choice("NS"),lon,self.rnd.choice("EW"),
+                self.rnd.randint(3,12),self.rnd.uniform(-100,9000))
+            vtg="GPVTG,%.1f,T,,M,%.2f,N,%.2f,K,A" % (self.rnd.uniform(0,360),
+                self.rnd.uniform(0,300),self.rnd.uniform(0,550))
+            chosen=self.rnd.sample([gga,vtg],self.rnd.randint(1,2))
+            bodies.append("".join(nmea_sentence(body) for body in chosen))
+        src=nmea_source(bodies)
+        self.compare(src,[src.recv() for body in bodies])
+
+class Test_nmea_framer(unittest.TestCase):
+    gga=nmea_sentence("GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,")
+    vtg=nmea_sentence("GNVTG,054.7,T,034.4,M,005.5,N,010.2,K")
+
+    def frames(self,chunks,max_len=None):
+        framer=az.nmea_framer(Fake_serial(chunks),{"GGA":None,"VTG":None},max_len)
+        return [next(framer) for chunk in chunks]
+
+    def test_sentence_across_reads(self):
+        gga=self.gga
+        self.assertEqual(self.frames([gga[:7],gga[7:30],gga[30:]]),
+            [None,None,[("GGA",gga.rstrip())]])
+
+    def test_several_sentences_per_read(self):
+        gga,vtg=self.gga,self.vtg
+        self.assertEqual(self.frames([gga+vtg+gga[:9],gga[9:]]),
+            [[("GGA",gga.rstrip()),("VTG",vtg.rstrip())],[("GGA",gga.rstrip())]])
+
+    def test_checksum(self):
+        body="GPVTG,054.7,T,034.4,M,005.5,N,010.2,K"
+        checksum=az.nmea_checksum(body)
+        bad="$%s*%02X\r\n" % (body,checksum^1)
+        lower="$%s*%02x\r\n" % (body,checksum)
+        self.assertEqual(self.frames([bad,lower,"$%s\r\n" % body]),
+            [[],[("VTG",lower.rstrip())],[]])
+
+    def test_unsubscribed_and_garbage(self):
+        self.assertEqual(self.frames([nmea_sentence("GPGSV,1,1,00"),
+            "\x00\xff$GP"+self.vtg]),[[],[("VTG",self.vtg.rstrip())]])
+
+    def test_long_partial_is_dropped(self):
+        gga=self.gga
+        frames=self.frames([gga[:-6],gga[-6:],gga],32) # 72 bytes without '\n'
+        self.assertEqual(frames,[None,[],[("GGA",gga.rstrip())]])
+
+class Test_nmea_fields(unittest.TestCase):
+    """every position of nmea_field_dict from sample sentences"""
+    sentences=(
+        "GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W",
+        "GPVTG,054.7,T,034.4,M,005.5,N,010.2,K",
+        "GPGSA,A,3,04,05,,09,12,,,24,,,,,2.5,1.3,2.1",
+        "GPGST,172814.0,0.006,0.023,0.020,273.6,0.023,0.020,0.031",
+        "GPZDA,201530.00,04,07,2002,00,00",
+        "PUBX,00,081350.00,4717.113210,N,00833.915187,E,546.589,G3,2.1,2.0,"
+            "0.007,77.52,0.007,,0.92,1.19,0.77,9,0,0",
+        "GPGGA,123519,4807.038,S,01131.000,W,1,08,0.9,545.4,M,46.9,M,,")
+
+    def setUp(self):
+        dc=az.data_collect()
+        self.keys=dict() # {(nmea_sen,pos):var_key}
+        for nmea_sen in sorted(az.nmea_field_dict):
+            for pos in az.nmea_field_dict[nmea_sen]:
+                var_key=len(self.keys)
+                dc.add_var("%s_%i" % (nmea_sen,pos),var_key)
+                dc.set_ublox_var("%s_%i" % (nmea_sen,pos),nmea_sen,pos)
+                self.keys[(nmea_sen,pos)]=var_key
+        self.assertEqual(dc.validate(),[])
+        nmea=az.NMEA_ublox(dc.get_ublox_dict(),"/dev/null")
+        nmea.ser=Fake_serial(["".join(nmea_sentence(body) for body in self.sentences)])
+        nmea.frames=az.nmea_framer(nmea.ser,nmea.plan)
+        formated=nmea.format_recv(nmea.recv())
+        self.values=dict((adr,formated[var_key]) for adr,var_key in self.keys.items())
+
+    def check(self,nmea_sen,expected):
+        for pos,value in enumerate(expected):
+            self.assertAlmostEqual(self.values[(nmea_sen,pos)],value,9,(nmea_sen,pos))
+        self.assertEqual(len(expected),len(az.nmea_field_dict[nmea_sen]))
+
+    def test_rmc(self):
+        track=math.radians(84.4)
+        self.check("RMC",[12*3600+35*60+19,48+7.038/60,11+31.0/60,22.4,84.4,1,
+            math.sin(track)*22.4,math.cos(track)*22.4])
+
+    def test_vtg(self):
+        track=math.radians(54.7)
+        self.check("VTG",[54.7,5.5,math.sin(track)*5.5,math.cos(track)*5.5])
+
+    def test_speed_axes_agree(self):
+        """EW_SPEED and NS_SPEED mean the same for every sentence and for
+        the derived speeds (east and north positive)"""
+        for nmea_sen,track_pos,speed_pos,ew_pos,ns_pos in (("VTG",0,1,2,3),
+                ("RMC",4,3,6,7),("PUBX,00",5,4,6,7)):
+            track=self.values[(nmea_sen,track_pos)]
+            speed=self.values[(nmea_sen,speed_pos)]
+            self.assertAlmostEqual(self.values[(nmea_sen,ew_pos)],
+                az.derive_ew_speed(track,speed),9,nmea_sen)
+            self.assertAlmostEqual(self.values[(nmea_sen,ns_pos)],
+                az.derive_ns_speed(track,speed),9,nmea_sen)
+            self.assertGreater(self.values[(nmea_sen,ew_pos)],0,nmea_sen)
+
+    def test_gsa(self):
+        self.check("GSA",[3,2.5,1.3,2.1,5])
+
+    def test_gst(self):
+        self.check("GST",[17*3600+28*60+14,0.006,0.023,0.020,0.031*az.M_TO_FT])
+
+    def test_zda(self):
+        self.check("ZDA",[20*3600+15*60+30,4,7,2002])
+
+    def test_pubx00(self):
+        track=math.radians(77.52)
+        speed=0.007*az.KMH_TO_KTS
+        self.check("PUBX,00",[8*3600+13*60+50,47+17.113210/60,8+33.915187/60,
+            546.589*az.M_TO_FT,speed,77.52,math.sin(track)*speed,
+            math.cos(track)*speed,-0.007*az.MS_TO_FPM,2.1,2.0])
+
+    def test_gga_south_west(self):
+        self.check("GGA",[12*3600+35*60+19,-(48+7.038/60),-(11+31.0/60),
+            545.4*az.M_TO_FT,1,8,0.9])
+
+    def test_ublox_catalog_func_is_an_error(self):
+        catalog={"version":az.CATALOG_VERSION,"vars":[{"name":"X","key":1,
+            "ublox":{"sen":"VTG","pos":2,"func":"nmea_vel"}}]}
+        errors=az.data_collect().parse_catalog(catalog)
+        self.assertEqual(len(errors),1)
+        self.assertIn("nmea_field_dict",errors[0])
+
+class Test_catalog(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.mkdtemp()
+        self.filename=os.path.join(self.tmp,"catalog.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self,variables):
+        with open(self.filename,'wb') as f:
+            f.write(az.json.dumps({"version":az.CATALOG_VERSION,"vars":variables}))
+
+    def load(self):
+        """data_collect of the catalog and whether it was parsed (no cache)"""
+        dc=az.data_collect()
+        parsed=[False]
+        parse_catalog=dc.parse_catalog
+        def parse(catalog):
+            parsed[0]=True
+            return parse_catalog(catalog)
+        dc.parse_catalog=parse
+        dc.load_catalog(self.filename)
+        return dc,parsed[0]
+
+    def test_defaults_are_valid(self):
+        dc=az.data_collect()
+        az.add_default_vars(dc)
+        self.assertEqual(dc.validate(),[])
+        self.assertEqual(dc.vdict[dc.key_dict["GROUND_KTS"]].ublox,("VTG",1,None,None))
+
+    def test_second_source_is_rejected(self):
+        dc=az.data_collect()
+        az.add_default_vars(dc)
+        self.assertRaises(ValueError,dc.set_ublox_var,"GROUND_KTS","VTG",0)
+        self.assertRaises(ValueError,dc.set_xplane_var,"GPS_LAT",az.xplane_set_dict["GPS"],3)
+        self.assertRaises(ValueError,dc.set_aid_var,"GPS_LAT",az.aid_set_dict["GNSS"],112)
+
+    def test_validation_errors(self):
+        self.write([
+            {"name":"A","key":1,"xplane":{"set":"GPS","pos":9}},
+            {"name":"B","key":2,"aid":{"channel":"GNSS","label":198}},
+            {"name":"C","key":3,"ublox":{"sen":"VTG","pos":99}},
+            {"name":"D","key":4,"xplane":{"set":"GPS","pos":0}},
+            {"name":"E","key":5,"xplane":{"set":"GPS","pos":0}},
+            {"name":"F","key":6,"aid":{"channel":"GNSS","label":110,
+                "func":"bnr_decode","args":[20,180,0.1,1,2]}},
+            {"name":"G","key":7,"resample":"cubic","tx_ms":0},
+            {"name":"H","key":8,"derived":{"func":"derive_ns_speed","inputs":["I","G"]}},
+            {"name":"I","key":9,"derived":{"func":"derive_ns_speed","inputs":["H","G"]}},
+            {"name":"J","key":10,"xplane":{"set":"GPS","pos":1,"func":"no_such_func"}},
+        ])
+        with self.assertRaises(ValueError) as cm:
+            self.load()
+        message=str(cm.exception)
+        for expected in ("A: xplane position 9","B: AID label 198","C: no position 99",
+                "E: xplane 20/0 already used by D","F: aid args","G: resample must",
+                "G: tx_ms","depend on each other","var 9 (J)"):
+            self.assertIn(expected,message)
+        self.assertFalse(os.path.exists(self.filename+az.CATALOG_CACHE_EXT))
+
+    def test_cache_invalidation(self):
+        variables=[{"name":"GPS_LAT","key":10,"xplane":{"set":"GPS","pos":0},
+            "aid":{"channel":"GNSS","label":110,"func":"bnr_decode","args":[20,180,0.000172]}},
+            {"name":"GROUND_KTS","key":32,"ublox":{"sen":"VTG","pos":1}},
+            {"name":"MAG_HDG","key":41,"resample":"angle"},
+            {"name":"NS_SPEED","key":34,
+                "derived":{"func":"derive_ns_speed","inputs":["MAG_HDG","GROUND_KTS"]}}]
+        self.write(variables)
+        dc,parsed=self.load()
+        self.assertTrue(parsed)
+        cached,parsed=self.load()
+        self.assertFalse(parsed)
+        self.assertEqual(cached.state(),dc.state())
+        self.assertEqual(cached.get_aid_dict(),dc.get_aid_dict())
+        variables.append({"name":"GPS_LON","key":11,"xplane":{"set":"GPS","pos":1}})
+        self.write(variables) # the file changed
+        dc,parsed=self.load()
+        self.assertTrue(parsed)
+        self.assertIn("GPS_LON",dc.key_dict)
+        version=az.CATALOG_CACHE_VERSION
+        az.CATALOG_CACHE_VERSION=version+1 # the cache layout changed
+        try:
+            dc,parsed=self.load()
+        finally:
+            az.CATALOG_CACHE_VERSION=version
+        self.assertTrue(parsed)
+
+class Test_src_poller(unittest.TestCase):
+    def read_all(self,src,n,src_id=2):
+        dest=Fake_dest()
+        loop=az.Src_poller(dest)
+        loop.verbose=False
+        for i in range(n):
+            self.assertTrue(loop.read(src,src_id))
+        return dest
+
+    def test_malformed_aid_line_is_a_decode_error(self):
+        src=aid_source(["data,1.0,%i,110,zz\n" % az.aid_set_dict['GNSS'],
+            "data,1.0\n","data,1.0,%i,110,%x\n" % (az.aid_set_dict['GNSS'],0x600000)])
+        dest=self.read_all(src,3)
+        self.assertEqual(counter(dest.metrics,2,az.METRIC_DECODE_ERR),2)
+        self.assertEqual(counter(dest.metrics,2,az.METRIC_RX),3)
+        self.assertEqual(len(dest.sent),1)
+
+    def test_malformed_line_keeps_the_read(self):
+        gnss=az.aid_set_dict['GNSS']
+        lines=[aid_line(gnss,110,with_parity(110,0x610000)),"data,1.0,%i,zz,1" % gnss,
+            "data,1.0,%i" % gnss,aid_line(gnss,111,with_parity(111,0x608000))]
+        src=aid_source(["\n".join(lines)+"\n"])
+        rec=src.recv()
+        self.assertEqual(src.malformed,2)
+        self.assertEqual([elm[2] for elm in rec],[110,111])
+        src=aid_source(["\n".join(lines)+"\n"])
+        dest=self.read_all(src,1)
+        self.assertEqual(counter(dest.metrics,2,az.METRIC_DECODE_ERR),2)
+        self.assertEqual(counter(dest.metrics,2,az.METRIC_RX),1)
+        self.assertEqual(sorted(dest.sent[0]),[10,11])
+
+    def test_partial_line_is_not_dropped(self):
+        line="data,1.0,%i,110,%x\n" % (az.aid_set_dict['GNSS'],0x600000)
+        src=aid_source([line[:10],line[10:],"info,1\n"])
+        dest=self.read_all(src,3)
+        self.assertEqual(counter(dest.metrics,2,az.METRIC_RX_DROPPED),1)
+        self.assertEqual(counter(dest.metrics,2,az.METRIC_RX),1)
+        self.assertEqual(len(dest.sent),1)
+
+    def test_partial_nmea_sentence_is_not_dropped(self):
+        gga=nmea_sentence("GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,")
+        src=nmea_source([gga[:20],gga[20:],nmea_sentence("GPGSV,1,1,00")])
+        dest=self.read_all(src,3,3)
+        self.assertEqual(counter(dest.metrics,3,az.METRIC_RX_DROPPED),1)
+        self.assertEqual(counter(dest.metrics,3,az.METRIC_RX),1)
+        self.assertEqual(len(dest.sent),1)
+
+    def test_format_error_leaves_the_store_unchanged(self):
+        gga=nmea_sentence("GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,")
+        bad_vtg=nmea_sentence("GPVTG,054.7,T,,M,zz,N,010.2,K,A") # track is written first
+        vtg=nmea_sentence("GPVTG,054.7,T,,M,005.5,N,010.2,K,A")
+        src=nmea_source([gga,bad_vtg,vtg])
+        dc=az.data_collect()
+        az.add_default_vars(dc)
+        store=az.Var_store(dc.vdict.keys())
+        dest=Fake_dest()
+        loop=az.Src_poller(dest,store=store)
+        loop.verbose=False
+        loop.shm=Fake_shm()
+        src.bind_store(store)
+        self.assertTrue(loop.read(src,3))
+        state=(list(store.values),list(store.times),list(store.valid))
+        self.assertTrue(loop.read(src,3))
+        self.assertEqual(counter(dest.metrics,3,az.METRIC_DECODE_ERR),1)
+        self.assertEqual((list(store.values),list(store.times),list(store.valid)),state)
+        self.assertEqual(len(loop.shm.writes),1)
+        self.assertEqual(len(dest.sent),1)
+        self.assertFalse(store.touched)
+        self.assertTrue(all(value!=value for value in store.msg))
+        self.assertTrue(loop.read(src,3))
+        self.assertEqual(set(dest.sent[1]),set(entry[0] for entry in src.plan["VTG"]))
+
+class Test_tx_scheduler(unittest.TestCase):
+    def setUp(self):
+        self.dest=Fake_dest()
+        self.sched=az.Tx_scheduler(self.dest,100,{42:20}) # PITCH at 50 Hz
+
+    def test_rate_groups(self):
+        sched=self.sched
+        sched.update({42:1.0,10:1.0})
+        self.assertEqual(sched.poll(0.0),{42:1.0,10:1.0})
+        sched.update({42:2.0,10:2.0})
+        sched.update({42:3.0}) # latest wins
+        self.assertEqual(sched.next_deadline(),0.02)
+        self.assertIsNone(sched.poll(0.01))
+        self.assertEqual(sched.poll(0.02),{42:3.0})
+        self.assertEqual(sched.next_deadline(),0.1)
+        self.assertIsNone(sched.poll(0.05))
+        self.assertEqual(sched.poll(0.1),{10:2.0})
+        self.assertIsNone(sched.next_deadline())
+        self.assertEqual(self.dest.sent,[{42:1.0,10:1.0},{42:3.0},{10:2.0}])
+
+    def test_due_groups_are_merged(self):
+        sched=self.sched
+        sched.poll(0.0)
+        sched.update({42:1.0,10:1.0})
+        self.assertEqual(sched.poll(0.1),{42:1.0,10:1.0})
+        self.assertEqual(len(self.dest.sent),1)
+
+    def test_late_group_restarts_from_now(self):
+        sched=self.sched
+        sched.update({42:1.0})
+        sched.poll(0.0)
+        sched.update({42:2.0})
+        sched.poll(1.0) # idle: no burst of the missed periodes
+        sched.update({42:3.0})
+        self.assertIsNone(sched.poll(1.01))
+        self.assertEqual(sched.poll(1.02),{42:3.0})
+
+class Fake_timed(object):
+    """source without file descriptor giving one record per due time"""
+    rx_throttle=False
+    multi_src=False
+    stale=0
+    complete=True
+    malformed=0
+    def __init__(self,times):
+        self.times=list(times)
+    def fileno(self):
+        return None
+    def next_time(self):
+        return self.times[0] if self.times else None
+    def recv(self):
+        if not self.times:
+            raise EOFError('done')
+        return self.times.pop(0)
+    def format_recv(self,rec):
+        return {10:rec}
+
+class Test_event_loop(unittest.TestCase):
+    def setUp(self):
+        self.dest=Fake_dest()
+        self.loop=az.Src_poller(self.dest,rx_ms=50)
+        self.loop.verbose=False
+        self.peers=list()
+        self.srcs=list()
+        for src_id in (2,4): # both AID (throttled sources)
+            src=aid_source([])
+            src.sock,peer=socket.socketpair()
+            src.frames=az.line_framer(src.sock)
+            self.loop.add(src,src_id)
+            self.peers.append(peer)
+            self.srcs.append(src)
+
+    def tearDown(self):
+        for sock in self.peers+[src.sock for src in self.srcs]:
+            sock.close()
+
+    def line(self,label,data):
+        return aid_line(az.aid_set_dict['GNSS'],label,with_parity(label,data))+"\n"
+
+    def test_silent_source_does_not_block(self):
+        self.peers[1].sendall(self.line(110,0x610000))
+        t0=az.time.time()
+        self.loop.run_once(1000)
+        self.assertLess(az.time.time()-t0,0.5)
+        self.assertEqual(len(self.dest.sent),1)
+        self.assertEqual(counter(self.dest.metrics,4,az.METRIC_RX),1)
+        self.assertEqual(counter(self.dest.metrics,2,az.METRIC_RX),0)
+
+    def test_throttled_source_is_paused(self):
+        self.peers[0].sendall(self.line(110,0x610000))
+        self.loop.run_once(1000)
+        self.assertIn(self.srcs[0].fileno(),self.loop.paused)
+        self.peers[0].sendall(self.line(111,0x608000))
+        self.loop.run_once(0) # paused: not read
+        self.assertEqual(len(self.dest.sent),1)
+        az.time.sleep(0.06)
+        self.loop.run_once(1000)
+        self.assertEqual(len(self.dest.sent),2)
+        self.assertEqual(counter(self.dest.metrics,2,az.METRIC_RX),2)
+
+    def test_closed_source_is_removed(self):
+        self.peers[0].close()
+        self.loop.run_once(1000)
+        self.assertEqual(self.loop.srcs.keys(),[self.srcs[1].fileno()])
+
+    def test_timed_source_is_read_when_due(self):
+        now=az.time.time()
+        timed=Fake_timed([now,now+0.05])
+        self.loop.add(timed,6)
+        self.assertEqual(self.loop.timed,[(timed,6)])
+        self.loop.run_once(1000)
+        self.assertEqual(self.dest.sent,[{10:now}])
+        self.assertLessEqual(self.loop.timeout(az.time.time()),51)
+        self.loop.run_once(1000)
+        self.assertGreaterEqual(az.time.time(),now+0.05)
+        self.assertEqual(self.dest.sent,[{10:now},{10:now+0.05}])
+        self.loop.run_once(1000) # done: removed
+        self.assertFalse(self.loop.timed)
+
+class Test_resampler(unittest.TestCase):
+    def setUp(self):
+        self.clock=[100.005]
+        monotonic=az.monotonic
+        az.monotonic=lambda: self.clock[0]
+        self.addCleanup(setattr,az,"monotonic",monotonic)
+        self.dest=Fake_dest()
+        self.sched=az.Resampler(self.dest,10,extrap_ms=200,stale_ms=1000,
+            mode_dict={1:"hold",2:"angle",3:"angle180",4:"linear"})
+
+    def sample(self,hist,t):
+        self.sched.hist=dict((var_key,list(samples)) for var_key,samples in hist.items())
+        return self.sched.sample(t)
+
+    def test_interpolation(self):
+        hist={4:[(0.0,0.0),(1.0,10.0),(2.0,30.0)],5:[(1.0,1.0)]}
+        self.assertEqual(self.sample(hist,0.25),{4:2.5,5:1.0})
+        self.assertEqual(self.sample(hist,1.5),{4:20.0,5:1.0})
+        self.assertEqual(self.sample(hist,-1.0)[4],0.0) # before the first sample
+
+    def test_extrapolation_is_capped(self):
+        hist={4:[(0.0,0.0),(1.0,10.0)]}
+        self.assertAlmostEqual(self.sample(hist,1.1)[4],11.0)
+        self.assertAlmostEqual(self.sample(hist,1.9)[4],12.0) # max 200 ms then held
+
+    def test_hold(self):
+        hist={1:[(0.0,1.0),(1.0,2.0)]}
+        self.assertEqual(self.sample(hist,0.9),{1:1.0})
+        self.assertEqual(self.sample(hist,1.5),{1:2.0})
+
+    def test_angle_wrap(self):
+        hist={2:[(0.0,350.0),(1.0,10.0)],3:[(0.0,170.0),(1.0,-170.0)]}
+        msg=self.sample(hist,0.25)
+        self.assertAlmostEqual(msg[2],355.0) # shortest way across 0
+        self.assertAlmostEqual(msg[3],175.0)
+        msg=self.sample(hist,0.75)
+        self.assertAlmostEqual(msg[2],5.0)
+        self.assertAlmostEqual(msg[3],-175.0) # shortest way across 180
+        self.assertAlmostEqual(self.sample(hist,1.1)[2],12.0) # extrapolated
+
+    def test_stale_and_trim(self):
+        hist={4:[(0.0,0.0),(1.0,1.0),(2.0,2.0),(3.0,3.0)]}
+        self.assertEqual(self.sample(hist,2.5),{4:2.5})
+        self.assertEqual(self.sched.hist[4],[(2.0,2.0),(3.0,3.0)])
+        self.assertEqual(self.sample(hist,4.5),{}) # no sample for 1.5 s
+
+    def test_fixed_grid(self):
+        sched=self.sched
+        sched.update({4:1.0})
+        self.clock[0]=100.006
+        self.assertIsNone(sched.poll(0.0)) # tick 100.01 not due
+        self.clock[0]=100.0105
+        self.assertEqual(sched.poll(0.0),{4:1.0})
+        self.clock[0]=100.0505 # ticks 100.02 to 100.04 missed
+        sched.poll(0.0)
+        self.assertEqual(counter(self.dest.metrics,0,az.METRIC_TX_MISSED),3)
+        self.assertEqual(sched.tick,10006) # no drift: next tick 100.06
+        self.assertEqual(len(self.dest.sent),2)
+
+class Test_derived_engine(unittest.TestCase):
+    derived_dict={
+        34:(az.derive_ns_speed,(41,32),[]),
+        35:(az.derive_ew_speed,(41,32),[]),
+        50:(az.derive_track_error,(34,35),[]), # derived from derived
+    }
+
+    def scalar_and_batch(self,msgs,sizes=None):
+        scalar=copy.deepcopy(msgs)
+        batch=copy.deepcopy(msgs)
+        engine=az.Derived_engine(self.derived_dict)
+        for msg in scalar:
+            engine.update(1,msg)
+        batch_engine=az.Derived_engine(self.derived_dict)
+        start=0
+        for size in sizes or [len(msgs)]:
+            batch_engine.update_batch(1,batch[start:start+size])
+            start+=size
+        self.assertEqual(batch,scalar)
+        values,direct=engine.state(1)
+        batch_values,batch_direct=batch_engine.state(1)
+        self.assertEqual([None if v!=v else v for v in batch_values], # NaN
+            [None if v!=v else v for v in values])
+        self.assertEqual(batch_direct,direct)
+        return scalar
+
+    def test_source_value_after_derived_rows(self):
+        msgs=[{41:10.0,32:100.0} for i in range(3)]+[{41:10.0,32:100.0,34:5.0}]+[
+            {41:10.0+i,32:100.0} for i in range(5)]
+        result=self.scalar_and_batch(msgs)
+        self.assertEqual(sorted(result[0]),[32,34,35,41,50])
+        self.assertNotIn(34,result[4]) # given by the source from row 3
+
+    def random_msgs(self,rnd):
+        msgs=list()
+        for i in range(rnd.randint(1,120)):
+            msg=dict()
+            if rnd.random()<0.6:
+                msg[41]=rnd.choice((0.0,10.0,90.0,359.0))
+            if rnd.random()<0.6:
+                msg[32]=rnd.choice((0.0,100.0,120.5))
+            for var_key in (34,35,50):
+                if rnd.random()<0.02:
+                    msg[var_key]=rnd.uniform(-10,10)
+            if rnd.random()<0.1:
+                msg[10]=1.0 # not an input
+            msgs.append(msg)
+        return msgs
+
+    def test_random_sequences(self):
+        rnd=random.Random(24)
+        for seed in range(50):
+            msgs=self.random_msgs(rnd)
+            sizes=list()
+            while sum(sizes)<len(msgs):
+                sizes.append(rnd.randint(1,40))
+            self.scalar_and_batch(msgs,sizes)
+
+    def test_store_matches_update(self):
+        rnd=random.Random(25)
+        keys=[10,32,34,41,50] # 35 is derived but not stored
+        for seed in range(20):
+            store=az.Var_store(keys)
+            engine=az.Derived_engine(self.derived_dict)
+            engine.bind_store(store)
+            dict_engine=az.Derived_engine(self.derived_dict)
+            for i,msg in enumerate(self.random_msgs(rnd)):
+                msg=dict((k,v) for k,v in msg.items() if k in keys) # stored
+                store.write_dict(msg)
+                engine.update_store(1,store)
+                dict_engine.update(1,msg)
+                self.assertEqual(store.as_dict(),dict((k,v) for k,v in msg.items()
+                    if k in keys),i)
+                store.commit(float(i))
+
+    def test_store_path_builds_no_dict(self):
+        vtg=nmea_sentence("GPVTG,054.7,T,,M,005.5,N,010.2,K,A")
+        src=nmea_source([vtg,vtg])
+        dc=az.data_collect()
+        az.add_default_vars(dc)
+        store=az.Var_store(dc.vdict.keys())
+        calls=[0]
+        as_dict=store.as_dict
+        def counted():
+            calls[0]+=1
+            return as_dict()
+        store.as_dict=counted
+        dest=Fake_dest()
+        loop=az.Src_poller(dest,store=store)
+        loop.verbose=False
+        loop.derived=az.Derived_engine(dc.derived_dict)
+        loop.derived.bind_store(store)
+        src.bind_store(store)
+        for i in range(2):
+            self.assertTrue(loop.read(src,3))
+        self.assertEqual(calls[0],len(dest.sent)) # only Fake_dest builds one
+        self.assertTrue(set(dc.derived_dict)<=set(dest.sent[0]))
+
+    def test_records_use_batches(self):
+        msgs=[{41:float(i),32:100.0} for i in range(3*az.DERIVED_BATCH_MIN)]
+        records=[(i%2+1,msg) for i,msg in enumerate(copy.deepcopy(msgs))]
+        az.Derived_engine(self.derived_dict).update_records(records)
+        engine=az.Derived_engine(self.derived_dict)
+        for i,msg in enumerate(msgs):
+            engine.update(i%2+1,msg)
+        self.assertEqual([msg for src_id,msg in records],msgs)
+
+    def test_circular_dependency(self):
+        self.assertRaises(ValueError,az.derived_order,{1:(None,(2,),[]),
+            2:(None,(1,),[])})
+
+class Test_delta_filter(unittest.TestCase):
+    def setUp(self):
+        self.delta=az.Delta_filter([10,11,12],1.0,{10:0.5})
+
+    def test_deadband_and_keyframes(self):
+        filt=self.delta.filter
+        self.assertEqual(filt({10:1.0},0.0),{10:1.0}) # first keyframe
+        self.assertEqual(filt({10:1.3,11:2.0},0.1),{11:2.0}) # within deadband
+        self.assertEqual(filt({10:1.6},0.2),{10:1.6})
+        self.assertEqual(filt({10:1.2,11:2.0},0.3),{}) # unchanged
+        self.assertEqual(filt({12:5.0},1.0),{10:1.2,11:2.0,12:5.0}) # keyframe
+        self.assertEqual(filt({12:5.0},1.5),{})
+
+    def test_late_keyframe_restarts(self):
+        filt=self.delta.filter
+        filt({10:1.0},0.0)
+        self.assertEqual(filt({},5.0),{10:1.0}) # idle: keyframe now
+        self.assertEqual(filt({},5.9),{})
+        self.assertEqual(filt({},6.0),{10:1.0})
+
+    def test_unknown_var_key_is_ignored(self):
+        self.assertEqual(self.delta.filter({10:1.0,99:2.0},0.0),{10:1.0})
+        self.assertEqual(self.delta.filter({10:3.0,99:2.0},0.1),{10:3.0})
+
+class Test_var_fusion(unittest.TestCase):
+    def setUp(self):
+        self.fusion=az.Var_fusion([10,11,12],[1,2,3],1000,{11:[2,1],12:[3]})
+
+    def test_failover(self):
+        update=self.fusion.update
+        self.assertEqual(update(2,{10:1.0},0.0),{10:1.0}) # nothing selected yet
+        self.assertEqual(update(1,{10:2.0},0.1),{10:2.0}) # better source
+        self.assertEqual(update(2,{10:3.0},0.5),{}) # 1 is fresh
+        self.assertEqual(update(2,{10:4.0},1.2),{10:4.0}) # 1 is stale
+        self.assertEqual(update(2,{10:5.0},1.3),{10:5.0})
+        self.assertEqual(update(1,{10:6.0},1.4),{10:6.0}) # 1 takes back
+        self.assertEqual(update(2,{10:7.0},1.5),{})
+
+    def test_variable_priority(self):
+        update=self.fusion.update
+        self.assertEqual(update(1,{10:1.0,11:1.0},0.0),{10:1.0,11:1.0})
+        self.assertEqual(update(2,{10:2.0,11:2.0},0.1),{11:2.0})
+        self.assertEqual(update(3,{12:3.0},0.1),{12:3.0})
+        self.assertEqual(update(1,{12:1.0},0.2),{}) # not listed: last resort
+        self.assertEqual(update(1,{12:1.0},1.2),{12:1.0})
+
+    def test_unknown_var_key_is_ignored(self):
+        self.assertEqual(self.fusion.update(1,{10:1.0,99:2.0},0.0),{10:1.0})
+
+def read_trailer(filename):
+    """(magic,last index offset) and [(src_id,payload)...] of the index chain"""
+    with open(filename,'rb') as f:
+        data=f.read()
+    trailer=struct.unpack(az.LOG_TRAILER_FMT,data[-struct.calcsize(az.LOG_TRAILER_FMT):])
+    rec=struct.Struct(az.LOG_RECORD_FMT)
+    blocks=list()
+    offset=trailer[1]
+    while offset>=0:
+        length,src_id,t=rec.unpack_from(data,offset)
+        payload=data[offset+rec.size:offset+rec.size+length]
+        blocks.append((src_id,payload))
+        offset=struct.unpack_from('<q',payload)[0]
+    return trailer,blocks
+
+class Test_flight_logger(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.mkdtemp()
+        self.prefix=os.path.join(self.tmp,"test")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def replay(self):
+        replay=az.Log_replay(self.prefix+"_*.azl",speed=0)
+        replay.connect()
+        records=list()
+        while True:
+            try:
+                records.extend(replay.format_recv(replay.recv()))
+            except EOFError:
+                break
+        replay.disconnect()
+        return records
+
+    def test_round_trip_across_rotation(self):
+        rnd=random.Random(13)
+        logged=[(rnd.randint(0,3),dict((k,rnd.uniform(-1e6,1e6)) 
+            for k in rnd.sample(range(1000),rnd.randint(0,20)))) for i in range(2000)]
+        logger=az.Flight_logger(self.prefix)
+        logger.max_bytes=20000
+        logger.start()
+        for src_id,recv_dict in logged:
+            logger.log(src_id,recv_dict)
+        logger.stop()
+        self.assertEqual(logger.dropped,0)
+        self.assertIsNone(logger.error)
+        filenames=sorted(glob.glob(self.prefix+"_*.azl"))
+        self.assertGreater(len(filenames),1)
+        for filename in filenames:
+            trailer,blocks=read_trailer(filename)
+            self.assertEqual(trailer[0],az.LOG_TRAILER_MAGIC)
+            self.assertTrue(blocks)
+            self.assertEqual(set(src_id for src_id,payload in blocks),set([az.LOG_INDEX]))
+        self.assertEqual(self.replay(),logged)
+
+    def test_write_error_stops_logging(self):
+        logger=az.Flight_logger(self.prefix)
+        logger.start()
+        logger.log(1,{10:1.0})
+        logger.log(1,{10:None}) # can not be packed
+        end=az.time.time()+5.0
+        while logger.error is None and az.time.time()<end:
+            az.time.sleep(0.01)
+        self.assertIsNotNone(logger.error)
+        dropped=logger.dropped
+        for i in range(10):
+            logger.log(1,{10:float(i)})
+        self.assertEqual(logger.dropped,dropped+10)
+        self.assertTrue(logger.queue.empty())
+        logger.stop()
+        filename,=glob.glob(self.prefix+"_*.azl")
+        self.assertEqual(read_trailer(filename)[0][0],az.LOG_TRAILER_MAGIC)
+        self.assertIn(self.replay(),([],[(1,{10:1.0})]))
+
+def write_log(filename,records,cut=0):
+    """log file of [(monotonic time,src_id,recv_dict)...], the last cut
+    bytes are removed (crash)"""
+    data=struct.pack(az.LOG_HEADER_FMT,az.LOG_MAGIC,az.LOG_VERSION,0.0,0.0)
+    for t,src_id,recv_dict in records:
+        payload="".join(struct.pack(az.LOG_VALUE_FMT,var_key,value) 
+            for var_key,value in sorted(recv_dict.items()))
+        data+=struct.pack(az.LOG_RECORD_FMT,len(payload),src_id,t)+payload
+    with open(filename,'wb') as f:
+        f.write(data[:len(data)-cut])
+
+class Test_log_replay(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def replay(self,files,speed=0,batch=None):
+        filenames=list()
+        for i,(records,cut) in enumerate(files):
+            filenames.append(os.path.join(self.tmp,"test_%03i.azl" % i))
+            write_log(filenames[-1],records,cut)
+        replay=az.Log_replay(os.path.join(self.tmp,"test_*.azl"),speed,batch)
+        replay.connect()
+        self.addCleanup(replay.disconnect)
+        return replay
+
+    def test_batches(self):
+        records=[(float(i),2,{10:float(i)}) for i in range(10)]
+        replay=self.replay([(records,0)],batch=3)
+        sizes=list()
+        received=list()
+        while True:
+            try:
+                recv_list=replay.recv()
+            except EOFError:
+                break
+            sizes.append(len(recv_list))
+            received.extend(recv_list)
+        self.assertEqual(sizes,[3,3,3,1])
+        self.assertEqual(received,records)
+
+    def test_truncated_record_ends_the_file(self):
+        first=[(float(i),2,{10:float(i),11:1.0}) for i in range(5)]
+        second=[(10.0,3,{21:1.0})]
+        replay=self.replay([(first,8),(second,0)])
+        self.assertEqual(replay.format_recv(replay.recv()),
+            [(2,recv_dict) for t,src_id,recv_dict in first[:-1]]+[(3,{21:1.0})])
+
+    def test_original_timing(self):
+        records=[(100.0,2,{10:1.0}),(101.0,2,{10:2.0}),(103.0,2,{10:3.0})]
+        replay=self.replay([(records,0)],speed=10)
+        self.assertEqual(replay.recv(),records[:1])
+        self.assertEqual(replay.recv(),[]) # not due
+        self.assertAlmostEqual(replay.next_time()-az.time.time(),0.1,delta=0.05)
+        az.time.sleep(max(0,replay.next_time()-az.time.time()))
+        self.assertEqual(replay.recv(),records[1:2])
+        self.assertAlmostEqual(replay.next_time()-az.time.time(),0.2,delta=0.05)
+
+    def test_next_session_is_not_delayed(self):
+        records=[(100.0,2,{10:1.0}),(100.5,2,{10:2.0})]
+        session=[(5.0,2,{10:3.0}),(5.5,2,{10:4.0})]
+        replay=self.replay([(records,0),(session,0)],speed=10)
+        replay.recv()
+        az.time.sleep(max(0,replay.next_time()-az.time.time()))
+        self.assertEqual(replay.recv(),records[1:]+session[:1])
+        self.assertAlmostEqual(replay.next_time()-az.time.time(),0.05,delta=0.04)
+
+    def test_not_a_log_file(self):
+        with open(os.path.join(self.tmp,"test_000.azl"),'wb') as f:
+            f.write("not a log file")
+        replay=az.Log_replay(os.path.join(self.tmp,"test_*.azl"))
+        replay.connect()
+        self.assertIsNone(replay.next_time())
+        self.assertRaises(EOFError,replay.recv)
+
+class Test_shm_state(unittest.TestCase):
+    def setUp(self):
+        self.tmp=tempfile.mkdtemp()
+        self.path=os.path.join(self.tmp,"state")
+        self.keys=[10,11,21,41]
+        self.writer=avionics_shm.Shm_state(self.path,self.keys,1234)
+        self.writer.connect()
+        self.reader=avionics_shm.Shm_reader(self.path)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.disconnect()
+        shutil.rmtree(self.tmp)
+
+    def state(self,i):
+        n=len(self.keys)
+        return (array_d([float(i)]*n),array_d([i+0.5]*n),bytearray([i%2]*n))
+
+    def test_snapshot_and_read(self):
+        values=array_d([1.0,2.0,3.0,4.0])
+        times=array_d([5.0,6.0,7.0,8.0])
+        self.writer.write(values,times,bytearray([1,0,1,1]),9.0)
+        self.assertEqual(self.reader.schema_hash,1234)
+        self.assertEqual(list(self.reader.keys),self.keys)
+        seq,t,r_values,r_times,r_valid=self.reader.snapshot()
+        self.assertEqual((seq,t),(2,9.0))
+        self.assertEqual((r_values,r_times,r_valid),(values,times,bytearray([1,0,1,1])))
+        self.assertEqual(self.reader.read(21),(3.0,7.0,True))
+        self.assertEqual(self.reader.read(11),(2.0,6.0,False))
+        self.assertEqual(self.reader.as_dict(),{10:1.0,21:3.0,41:4.0})
+
+    def test_reader_waits_for_the_writer(self):
+        self.writer.write(*(self.state(1)+(1.0,)))
+        struct.pack_into('<Q',self.writer.mm,avionics_shm.SHM_SEQ_OFFSET,3) # in update
+        max_retry=avionics_shm.SHM_MAX_RETRY
+        avionics_shm.SHM_MAX_RETRY=avionics_shm.SHM_SPIN+2
+        try:
+            self.assertRaises(IOError,self.reader.snapshot)
+            self.assertRaises(IOError,self.reader.read,10)
+        finally:
+            avionics_shm.SHM_MAX_RETRY=max_retry
+
+    def test_concurrent_snapshots_are_consistent(self):
+        states=[self.state(i) for i in range(2)]
+        initial=(array_d([0.0]*4),array_d([0.0]*4),bytearray(4)) # first write pending
+        done=threading.Event()
+        def write():
+            i=0
+            while not done.is_set():
+                self.writer.write(*(states[i%2]+(float(i),)))
+                i+=1
+        thread=threading.Thread(target=write)
+        thread.start()
+        try:
+            for n in range(5000):
+                seq,t,values,times,valid=self.reader.snapshot()
+                self.assertFalse(seq&1)
+                self.assertIn((values,times,valid),states+[initial])
+        finally:
+            done.set()
+            thread.join()
+
+    def test_not_a_segment(self):
+        with open(os.path.join(self.tmp,"other"),'wb') as f:
+            f.write("\0"*64)
+        self.assertRaises(IOError,avionics_shm.Shm_reader,os.path.join(self.tmp,"other"))
+
+class Test_pipe_input(unittest.TestCase):
+    def test_missing_record_is_skipped_without_traffic(self):
+        context=zmq.Context.instance()
+        pipe=az.Pipe_input("inproc://test_pipe")
+        pipe.sock=context.socket(zmq.PULL)
+        pipe.sock.bind(pipe.adr)
+        decoder=context.socket(zmq.PUSH)
+        decoder.connect(pipe.adr)
+        header=struct.Struct(az.PIPE_HEADER_FMT)
+        def send(seq,kind,payload=""):
+            decoder.send_multipart([header.pack(seq,1,kind,0.0,0.0,0.0),payload])
+        send(1,az.PIPE_DATA,marshal.dumps([(1,{10:1.0})])) # seq 0 is lost
+        send(2,az.PIPE_END)
+        dest=Fake_dest()
+        loop=az.Src_poller(dest)
+        loop.verbose=False
+        loop.add_pipe(pipe)
+        end=az.time.time()+5*az.PIPE_REORDER_SEC+1.0
+        while loop.srcs and az.time.time()<end:
+            loop.run_once(2000)
+        self.assertEqual(dest.sent,[{10:1.0}])
+        self.assertEqual(pipe.lost,1)
+        self.assertTrue(pipe.done)
+        self.assertFalse(loop.srcs)
+        decoder.close()
+        pipe.sock.close()
+
+class Test_zmq_pmt(unittest.TestCase):
+    def test_bin_buffer_reuse(self):
+        dc=az.data_collect()
+        az.add_default_vars(dc)
+        schema=az.Wire_schema(dc.key_dict)
+        dest=az.Zmq_pmt(("127.0.0.1",0),"bin",schema,True,1)
+        context=zmq.Context.instance()
+        dest.zmq_sock=context.socket(zmq.PUSH)
+        dest.zmq_sock.bind("inproc://test_bin")
+        sink=context.socket(zmq.PULL)
+        sink.connect("inproc://test_bin")
+        sent=[{10:float(i),41:i*0.5} for i in range(50)]
+        for values in sent: # back to back: the pack buffer is reused
+            dest.send_dict(values)
+        received=list()
+        while len(received)<len(sent):
+            hdr,payload=sink.recv_multipart()
+            if struct.unpack(az.ZMQ_HEADER_FMT,hdr)[2]==az.FMT_BIN:
+                received.append(schema.unpack(payload))
+        self.assertEqual(received,sent)
+        sink.close()
+        dest.zmq_sock.close()
+
+    def test_pub_topics(self):
+        dc=az.data_collect()
+        az.add_default_vars(dc)
+        dc.set_group("GPS_LAT","GPS")
+        dc.set_group("GPS_LON","GPS")
+        topic_dict=dc.get_topic_dict("group")
+        dest=az.Zmq_pmt(("127.0.0.1",0),"bin",az.Wire_schema(dc.key_dict),True,1,
+            topic_dict)
+        context=zmq.Context.instance()
+        dest.zmq_sock=context.socket(zmq.PUSH) # same frames as PUB, no filtering
+        dest.zmq_sock.bind("inproc://test_topics")
+        sink=context.socket(zmq.PULL)
+        sink.connect("inproc://test_topics")
+        sent=[{10:1.0,11:2.0,41:3.0,42:4.0},{10:5.0},{41:6.0}]
+        for values in sent:
+            dest.send_dict(values)
+        nschema=len(dest.topic_schemas)
+        seqs=dict() # {topic:[seq...]}
+        received=list()
+        for i in range(nschema+4):
+            topic,hdr,payload=sink.recv_multipart()
+            seq,src_id,fmt_id,t=struct.unpack(az.ZMQ_HEADER_FMT,hdr)
+            seqs.setdefault(topic,list()).append(seq)
+            if fmt_id==az.FMT_BIN:
+                values=dest.topic_schemas[topic].unpack(payload)
+                self.assertEqual(set(topic_dict[var_key] for var_key in values),set([topic]))
+                received.append(values)
+        self.assertEqual(sorted(seqs),sorted(dest.topic_schemas))
+        for topic in seqs: # one counter per topic
+            self.assertEqual(seqs[topic],range(len(seqs[topic])))
+        self.assertEqual(topic_dict[10],"gGPS.")
+        self.assertEqual(topic_dict[41],"g004.")
+        self.assertEqual(sorted(received[:2]),[{10:1.0,11:2.0},{41:3.0,42:4.0}]) # any order
+        self.assertEqual(received[2:],[{10:5.0},{41:6.0}])
+        sink.close()
+        dest.zmq_sock.close()
+
+if __name__ == '__main__':
+    unittest.main()
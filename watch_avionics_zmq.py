@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Watch the stats published by avionics_zmq (--stats) (read main docstring)
+
+each snapshot (see avionics_zmq Metrics) is printed as counter rates per
+source and latency percentiles per stage
+"""
+import sys
+import time
+from optparse import OptionParser
+import json
+import zmq
+import avionics_zmq as az
+
+
+def main():
+    """subscribe to the stats endpoint and print snapshots
+    
+    ex: python watch_avionics_zmq.py -s 127.0.0.1:5557
+    """
+    usage = """ %prog [options]"""
+    parser = OptionParser(usage=usage,version=0.1)
+    parser.add_option("-s", "--stats",
+                  dest="stats_adr",
+                  type="string",
+                  default="127.0.0.1:5557",
+                  help="stats ip address ip:port default=127.0.0.1:5557")
+    parser.add_option("-j", "--json",
+                  dest="json",
+                  action="store_true",
+                  default=False,
+                  help="print raw json snapshots")
+    (options, args) = parser.parse_args()
+    ip,port=az.parse_adr(options.stats_adr)
+    sock=zmq.Context().socket(zmq.SUB)
+    sock.setsockopt(zmq.SUBSCRIBE,az.METRIC_TOPIC)
+    sock.connect("tcp://%s:%i" % (ip,port))
+    print "[info] watching "+options.stats_adr
+    last=None
+    try:
+        while True:
+            topic,msg=sock.recv_multipart()
+            if options.json:
+                print msg
+                continue
+            snap=json.loads(msg)
+            print_snapshot(snap,last)
+            last=snap
+    except KeyboardInterrupt:
+        print "\n[info] Gracefully killed"
+    sock.close()
+
+    # <END of main>
+#------------------------------
+# Globals
+#-------------------------------
+def print_snapshot(snap,last=None):
+    """print counters (total and rate since last) and stage latencies
+    
+    Args:
+        snap (dict): snapshot (see avionics_zmq Metrics.snapshot)
+        last (dict, optional): previous snapshot (rates)
+    """
+    dt=snap["t"]-last["t"] if last else 0
+    print "---- %s uptime %.0f s %s" % (time.strftime("%H:%M:%S",
+        time.localtime(snap["t"])),snap["uptime"],
+        " ".join("%s=%s" % item for item in sorted(snap["gauges"].items())))
+    print "%-4s" % "src"+"".join("%16s" % name for name in az.metric_counter_names)
+    for src_id in sorted(snap["counters"],key=int):
+        counters=snap["counters"][src_id]
+        prev=last["counters"].get(src_id,{}) if last else {}
+        row="%-4s" % src_name_dict.get(int(src_id),src_id)
+        for name in az.metric_counter_names:
+            if dt:
+                row+="%16s" % ("%i (%.0f/s)" % (counters[name],
+                    (counters[name]-prev.get(name,0))/dt))
+            else:
+                row+="%16i" % counters[name]
+        print row
+    print "%-8s %10s %10s %10s %10s %10s" % ("stage","count","p50 us","p99 us",
+        "p99.9 us","max us")
+    for name in az.metric_stage_names:
+        stage=snap["stages"].get(name)
+        if stage:
+            print "%-8s %10i %10i %10i %10i %10i" % (name,stage["count"],
+                stage["p50"],stage["p99"],stage["p999"],stage["max"])
+    sys.stdout.flush()
+
+#source names of src_id (see avionics_zmq src_id_dict)
+src_name_dict=dict((src_id,mode) for mode,src_id in az.src_id_dict.items())
+src_name_dict[0]='?'
+
+if __name__ == '__main__':
+    main()